@@ -6,8 +6,33 @@ class ListingAdmin(admin.ModelAdmin):
     exclude = ('watchlist_items',)
 
 
+def refresh_listings(listing_ids):
+    for listing in Listing.objects.filter(pk__in=listing_ids):
+        listing.refresh_bid_stats()
+
+
+# Bids edited in the admin bypass bid_add, so recalculate the stored bid stats of every listing affected afterwards
+class BidAdmin(admin.ModelAdmin):
+    def save_model(self, request, obj, form, change):
+        super().save_model(request, obj, form, change)
+        obj.listing.refresh_bid_stats()
+        # A bid moved to another listing leaves the one it was on
+        if change and 'listing' in form.changed_data and form.initial.get('listing') is not None:
+            refresh_listings([form.initial['listing']])
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        obj.listing.refresh_bid_stats()
+
+    # The "delete selected" action deletes the bids in bulk, without calling delete_model
+    def delete_queryset(self, request, queryset):
+        listing_ids = set(queryset.values_list('listing_id', flat=True))
+        super().delete_queryset(request, queryset)
+        refresh_listings(listing_ids)
+
+
 admin.site.register(User)
 admin.site.register(Listing, ListingAdmin)
 admin.site.register(Category)
-admin.site.register(Bid)
+admin.site.register(Bid, BidAdmin)
 admin.site.register(Comment)
\ No newline at end of file
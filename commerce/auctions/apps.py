@@ -3,3 +3,14 @@ from django.apps import AppConfig
 
 class AuctionsConfig(AppConfig):
     name = 'auctions'
+
+    def ready(self):
+        # Connect the signal handlers
+        from django.db.backends.signals import connection_created
+        from django.db.models.signals import post_migrate
+        from . import signals
+        from .instrumentation import install_query_timer
+        from .pragmas import apply_sqlite_pragmas
+        post_migrate.connect(signals.ensure_search_index, sender=self)
+        connection_created.connect(install_query_timer)
+        connection_created.connect(apply_sqlite_pragmas)
@@ -0,0 +1,183 @@
+from collections import namedtuple
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage, StaticFilesStorage
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, HttpResponseNotModified
+from django.utils._os import safe_join
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+import base64
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import urllib.request
+
+# Brotli is optional:  without it only gzip copies are written
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+# STATIC ASSETS
+# The build step for static files is:
+#   manage.py vendor_assets     Download the third-party files in VENDOR_ASSETS into auctions/static, checking each
+#                               one against its published hash.  The downloaded files are committed, so this is
+#                               only needed after changing VENDOR_ASSETS, e.g. to upgrade Bootstrap.
+#   manage.py collectstatic     Minify the CSS, give every file a content-hashed name, and write gzip and brotli
+#                               copies next to the files that compress well
+# StaticAssetsMiddleware then serves STATIC_ROOT, picking the compressed copy the browser accepts.
+
+VendorAsset = namedtuple('VendorAsset', ['path', 'url', 'integrity'])
+
+VENDOR_ASSETS = {
+    'bootstrap': VendorAsset(
+        'auctions/vendor/bootstrap-4.4.1.min.css',
+        'https://stackpath.bootstrapcdn.com/bootstrap/4.4.1/css/bootstrap.min.css',
+        'sha384-Vkoo8x4CGsO3+Hhxv8T/Q5PaXtkKtu6ug5TOeNV6gBiFeWPGFN9MuhOf23Q9Ifjh'),
+}
+
+# Files worth compressing; images and fonts are compressed already
+COMPRESSIBLE = ('.css', '.js', '.svg', '.txt', '.json', '.map', '.html')
+
+# Vendored files end with a comment pointing at their source map, which isn't vendored
+SOURCE_MAP_COMMENT = re.compile(r'\s*/\*# sourceMappingURL=[^*]*\*/\s*$')
+
+# Hashed file names end in a 12 digit hex hash before the extension, e.g. styles.0123456789ab.css
+HASHED_NAME = re.compile(r'\.[0-9a-f]{12}\.[^./]+$')
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+class VendorError(Exception):
+    pass
+
+
+# The Subresource Integrity value of some bytes, e.g. "sha384-<base64 digest>"
+
+def integrity(data, algorithm='sha384'):
+    return f'{algorithm}-{base64.b64encode(hashlib.new(algorithm, data).digest()).decode()}'
+
+
+def fetch_vendor_asset(asset):
+    with urllib.request.urlopen(asset.url, timeout=30) as response:
+        data = response.read()
+    algorithm = asset.integrity.split('-', 1)[0]
+    if integrity(data, algorithm) != asset.integrity:
+        raise VendorError(f'{asset.url} does not match its integrity hash')
+    return data
+
+
+# Strip comments and unneeded whitespace from a stylesheet
+# Comments starting with /*! (licence headers) are kept.  This is only meant for our own simple stylesheets:
+# it doesn't look inside strings, so it isn't run on vendored files, which are minified already.
+
+def minify_css(css):
+    css = re.sub(r'/\*(?!!).*?\*/', '', css, flags=re.DOTALL)
+    css = re.sub(r'\s+', ' ', css)
+    css = re.sub(r'\s*([{};,>])\s*', r'\1', css)
+    # Spaces before a colon can be a descendant selector ("nav :hover"), so only the ones after it are removed
+    css = re.sub(r':\s+', ':', css)
+    return css.replace(';}', '}').strip()
+
+
+# Only our own stylesheets are minified; the admin's are left as Django ships them
+
+def should_minify(name):
+    return name.startswith('auctions/') and name.endswith('.css') and not name.endswith('.min.css')
+
+
+# Manifest storage that also minifies our stylesheets and writes compressed copies of every hashed file
+# Until collectstatic has built the manifest (in development and in the tests), files keep their plain names.
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    def url(self, name, force=False):
+        if not self.hashed_files and not force:
+            return StaticFilesStorage.url(self, name)
+        return super().url(name, force)
+
+    def post_process(self, paths, dry_run=False, **options):
+        if dry_run:
+            yield from super().post_process(paths, dry_run, **options)
+            return
+        # Minify the collected copies first, and hash those instead of the originals
+        # The collected copies of vendored files lose their source map comments, which would otherwise fail the
+        # build:  the manifest needs every file a stylesheet refers to.  The originals keep their published bytes.
+        paths = dict(paths)
+        vendored = {asset.path for asset in VENDOR_ASSETS.values()}
+        for name in paths:
+            if should_minify(name) or name in vendored:
+                with open(self.path(name), encoding='utf-8') as file:
+                    css = file.read()
+                with open(self.path(name), 'w', encoding='utf-8') as file:
+                    file.write(minify_css(css) if should_minify(name) else SOURCE_MAP_COMMENT.sub('', css))
+                paths[name] = (self, name)
+
+        for name, hashed_name, processed in super().post_process(paths, dry_run, **options):
+            if hashed_name and not isinstance(processed, Exception) and name.endswith(COMPRESSIBLE):
+                self.write_compressed(hashed_name)
+            yield name, hashed_name, processed
+
+    # Write <name>.gz and <name>.br, unless compressing doesn't make the file smaller
+    def write_compressed(self, name):
+        with open(self.path(name), 'rb') as file:
+            data = file.read()
+        # mtime=0 makes the output the same on every build
+        copies = {'.gz': gzip.compress(data, compresslevel=9, mtime=0)}
+        if brotli is not None:
+            copies['.br'] = brotli.compress(data, quality=11)
+        for suffix, compressed in copies.items():
+            if len(compressed) < len(data):
+                with open(self.path(name) + suffix, 'wb') as file:
+                    file.write(compressed)
+
+
+# The content codings the browser accepts, ignoring any it gives a weight of zero
+
+def accepted_encodings(header):
+    accepted = set()
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        if not re.fullmatch(r'\s*q\s*=\s*0(\.0*)?\s*', params):
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+# Serve a file from STATIC_ROOT, or return None if there's no such file
+# Hashed files are cached by browsers forever; files requested by their plain names must be revalidated.
+
+def serve_static_asset(request, name):
+    try:
+        path = safe_join(settings.STATIC_ROOT, name)
+    except (SuspiciousFileOperation, ValueError):
+        return None
+    if not os.path.isfile(path):
+        return None
+
+    stat = os.stat(path)
+    hashed = HASHED_NAME.search(name) is not None
+    if not hashed and not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        return HttpResponseNotModified()
+
+    content_type, _ = mimetypes.guess_type(name)
+    accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+    encoding = None
+    for coding, suffix in (('br', '.br'), ('gzip', '.gz')):
+        if coding in accepted and os.path.isfile(path + suffix):
+            encoding, path = coding, path + suffix
+            break
+
+    response = FileResponse(open(path, 'rb'), content_type=content_type or 'application/octet-stream',
+                            filename=os.path.basename(name))
+    if encoding:
+        response['Content-Encoding'] = encoding
+    if name.endswith(COMPRESSIBLE):
+        response['Vary'] = 'Accept-Encoding'
+    if hashed:
+        response['Cache-Control'] = IMMUTABLE
+    else:
+        response['Cache-Control'] = 'no-cache'
+        response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,94 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http.response import Http404
+from django.shortcuts import render
+from .categories import acategory_counts, find_category
+from .conditional import alist_validators, alisting_validators, not_modified, add_validators
+from .models import Listing
+from .pagination import KeysetPaginator, encode_cursor
+from .sse import page_events_url
+from .views import CommentForm, BidForm, comment_paginator
+from .watchlist import awatched_listing_ids, ais_watching
+
+
+# ASYNC VIEWS
+# Async versions of the busiest read-only views, served by commerce/asgi_async.py.
+# The queries use Django's async ORM, so a request waiting on the database or a slow client doesn't hold a
+# worker thread.  Templates are still rendered synchronously, after every query has run.
+
+
+# Load the user without blocking the event loop
+# request.user is replaced with the loaded user, so the templates don't query for it again
+
+async def load_user(request):
+    request.user = await request.auser()
+    return request.user
+
+
+# The async version of views.index
+
+async def index(request, listings=None, title='Active Listings'):
+    user = await load_user(request)
+    # Show all active listings, unless a set is passed in
+    if listings is None:
+        listings = Listing.objects.active()
+    # Fetch the owner and bid stats for every card in the same query as the listings
+    listings = listings.with_card_data()
+    # If the browser's copy of the page is still current, skip the listings query and the rendering
+    validators = await alist_validators(request)
+    response = not_modified(request, validators)
+    if response:
+        return response
+    # Show one page of listings, starting after the cursor if one was passed in
+    cursor = request.GET.get('cursor')
+    page = await KeysetPaginator(listings, settings.LISTINGS_PER_PAGE).apage(cursor)
+    response = await sync_to_async(render)(request, 'auctions/index.html', {
+        'listings': page.object_list,
+        'watched_ids': await awatched_listing_ids(user),
+        'title': title,
+        'page': page,
+        'is_first_page': not cursor
+    })
+    return add_validators(request, response, validators)
+
+
+# The async version of views.listing_view
+
+async def listing_view(request, listing_id):
+    user = await load_user(request)
+    # If the browser's copy of the page is still current, skip the queries and the rendering
+    validators = await alisting_validators(request, listing_id)
+    response = not_modified(request, validators)
+    if response:
+        return response
+
+    try:
+        listing = await Listing.objects.select_related('owner', 'category', 'high_bidder').aget(pk=listing_id)
+    except Listing.DoesNotExist:
+        raise Http404("Listing does not exist")
+
+    # Only the first page of comments is rendered here; the rest are fetched from listing_comments
+    comments = await comment_paginator(listing_id).apage()
+
+    response = await sync_to_async(render)(request, 'auctions/listing.html', {
+        'listing_id': listing_id,
+        'listing': listing,
+        'in_watchlist': await ais_watching(user, listing.id),
+        'comments': comments.object_list,
+        'comments_cursor': encode_cursor(comments.object_list[-1]) if comments.object_list else '',
+        'comments_more': comments.has_next,
+        'events_url': page_events_url(listing),
+        'comment_form': CommentForm(initial={'listing': listing_id}),
+        'bid_form': BidForm(initial={'listing': listing})
+    })
+    return add_validators(request, response, validators)
+
+
+# The async version of views.category_listing
+
+async def category_listing(request, category_id):
+    category = find_category(await acategory_counts(), category_id)
+    if category is None:
+        raise Http404("Category does not exist")
+    listings = Listing.objects.active().filter(category=category.id or None)
+    return await index(request, listings, category.name)
@@ -0,0 +1,317 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.db import connection, OperationalError
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from wsgiref.simple_server import WSGIServer, WSGIRequestHandler
+import asyncio
+import contextlib
+import decimal
+import random
+import re
+import threading
+import time
+from .bidding import place_bid, BidOutcome
+from .models import Listing
+
+
+# BENCHMARK HELPERS
+# Shared by the benchmark management commands and the test suite
+
+
+# The value below which pct percent of the sorted values fall (nearest-rank method)
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+# Bid stress test:  many threads bid on the same hot listing at once
+# Each thread reads the current minimum bid and then bids slightly above it, so most threads race on stale reads.
+# Returns a report of accepted bids per second and a breakdown of the rejected ones.
+
+def hammer_listing(listing_id, bidders, threads=8, bids_per_thread=50, seed=None):
+    outcomes = {outcome.value: 0 for outcome in BidOutcome}
+    outcomes['error'] = 0
+    lock = threading.Lock()
+    start_gate = threading.Barrier(threads)
+
+    def worker(worker_number):
+        rng = random.Random(None if seed is None else seed + worker_number)
+        bidder = bidders[worker_number % len(bidders)]
+        counts = dict.fromkeys(outcomes, 0)
+        try:
+            start_gate.wait()
+            for _ in range(bids_per_thread):
+                try:
+                    required = Listing.objects.get(pk=listing_id).required_bid
+                    amount = required + decimal.Decimal(rng.randint(0, 3)) / 100
+                    counts[place_bid(listing_id, bidder, amount).outcome.value] += 1
+                except OperationalError:
+                    # e.g. "database is locked" when the write lock can't be acquired in time
+                    counts['error'] += 1
+        finally:
+            # Each thread has its own database connection, which must be closed by that thread
+            connection.close()
+        with lock:
+            for key, value in counts.items():
+                outcomes[key] += value
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    accepted = outcomes[BidOutcome.ACCEPTED.value]
+    return {
+        'threads': threads,
+        'attempts': threads * bids_per_thread,
+        'seconds': round(elapsed, 3),
+        'accepted_per_second': round(accepted / elapsed, 1) if elapsed else None,
+        'outcomes': outcomes,
+    }
+
+
+# A WSGI server with a fixed pool of worker threads, like a threaded gunicorn worker
+# Each connection holds a thread from the moment it is accepted until its response has been sent.
+
+class PooledWSGIServer(WSGIServer):
+    # Same listen backlog as gunicorn, so waiting connections queue rather than being refused
+    request_queue_size = 2048
+
+    def __init__(self, address, handler, threads):
+        super().__init__(address, handler)
+        self.pool = ThreadPoolExecutor(max_workers=threads)
+
+    def process_request(self, request, client_address):
+        self.pool.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+            # Queries run on the pool's threads, so close their database connections here
+            connection.close()
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+# Serve a WSGI application on a free local port from a background thread
+# Returns the server; call server.shutdown() and server.server_close() when done.
+
+def start_wsgi_server(application, threads, host='127.0.0.1'):
+    server = PooledWSGIServer((host, 0), QuietRequestHandler, threads)
+    server.set_app(application)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# Send a GET request and read the whole response, returning the status code
+# A trickle of N seconds sends the request a byte at a time spread over that long, like a client on a bad network.
+
+async def http_get(host, port, path, trickle=0):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        request = f'GET {path} HTTP/1.1\r\nHost: {host}\r\nConnection: close\r\n\r\n'.encode()
+        if trickle:
+            for index in range(len(request)):
+                writer.write(request[index:index + 1])
+                await writer.drain()
+                await asyncio.sleep(trickle / len(request))
+        else:
+            writer.write(request)
+            await writer.drain()
+        response = await reader.read()
+        return int(response.split(b' ', 2)[1])
+    finally:
+        writer.close()
+
+
+# Time fast requests to a server while it is also busy with many slow clients
+# Returns latency percentiles and throughput for the fast requests, and how many requests of each kind failed.
+
+async def slow_client_load(host, port, path, slow_clients=100, requests=200, concurrency=10, trickle=2.0,
+                           timeout=60):
+    latencies = []
+    errors = {'fast': 0, 'slow': 0}
+
+    async def fast_worker(count):
+        for _ in range(count):
+            started = time.perf_counter()
+            try:
+                status = await asyncio.wait_for(http_get(host, port, path), timeout)
+            except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+                status = None
+            if status == 200:
+                latencies.append((time.perf_counter() - started) * 1000)
+            else:
+                errors['fast'] += 1
+
+    async def slow_client():
+        try:
+            if await asyncio.wait_for(http_get(host, port, path, trickle), timeout + trickle) != 200:
+                errors['slow'] += 1
+        except (OSError, asyncio.TimeoutError, IndexError, ValueError):
+            errors['slow'] += 1
+
+    slow = [asyncio.ensure_future(slow_client()) for _ in range(slow_clients)]
+    # Give the slow clients a head start, so they are already holding connections
+    await asyncio.sleep(min(trickle / 4, 0.5))
+    started = time.perf_counter()
+    await asyncio.gather(*(fast_worker(requests // concurrency + (n < requests % concurrency))
+                           for n in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    await asyncio.gather(*slow)
+    return {
+        'requests': requests,
+        'requests_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+        'max_ms': round(max(latencies), 1) if latencies else None,
+        'errors': errors,
+    }
+
+
+# Statements that take the database write lock
+WRITE_STATEMENT = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+
+# Walk one user through a typical visit and count the database writes made by each action
+# Each round watches a listing, comments on it, bids on it and stops watching it, loading the listing page after
+# every action as the browser does when it follows the redirect.  Writes to the session table are counted apart
+# from the rest.  Returns the writes per action by URL name, averaged over the rounds.
+
+def session_writes(username, password, listing_id, rounds=5):
+    client = Client()
+    listing_url = reverse('listing', args=[listing_id])
+    counts = {}
+
+    def request(name, method, url, data=None):
+        with CaptureQueriesContext(connection) as queries:
+            getattr(client, method)(url, data)
+        writes = [query['sql'] for query in queries.captured_queries if WRITE_STATEMENT.match(query['sql'])]
+        totals = counts.setdefault(name, {'requests': 0, 'session': 0, 'other': 0})
+        totals['requests'] += 1
+        totals['session'] += sum('django_session' in sql for sql in writes)
+        totals['other'] += sum('django_session' not in sql for sql in writes)
+
+    request('login', 'post', reverse('login'), {'username': username, 'password': password})
+    for _ in range(rounds):
+        for name, method, url, data in (
+                ('watchlist_add', 'get', reverse('watchlist_add', args=[listing_id]), None),
+                ('comment_add', 'post', reverse('comment_add'), {'listing': listing_id, 'body': 'Is this available?'}),
+                ('bid_add', 'post', reverse('bid_add'),
+                 {'listing': listing_id, 'amount': Listing.objects.get(pk=listing_id).required_bid}),
+                ('watchlist_remove', 'get', reverse('watchlist_remove', args=[listing_id]), None)):
+            request(name, method, url, data)
+            request('listing', 'get', listing_url)
+    request('logout', 'get', reverse('logout'))
+
+    return {name: {'session': round(totals['session'] / totals['requests'], 2),
+                   'other': round(totals['other'] / totals['requests'], 2)}
+            for name, totals in counts.items()}
+
+
+# Open connections to the default database with other SQLite settings inside the block, to compare them
+# Applies to connections opened inside the block only, so threads must connect after it has started.
+
+@contextlib.contextmanager
+def sqlite_settings(pragmas, transaction_mode=None):
+    options = connection.settings_dict.setdefault('OPTIONS', {})
+    saved = dict(options)
+    connection.close()
+    options['transaction_mode'] = transaction_mode
+    try:
+        with override_settings(SQLITE_PRAGMAS=pragmas):
+            yield
+    finally:
+        connection.close()
+        options.clear()
+        options.update(saved)
+
+
+# Write contention test:  many users bid, comment and watch the same listing at once, through the views
+# The users are logged in one at a time before the clock starts, so every timed request is a write.  Requests
+# that fail because the database was locked are counted rather than raised.  Returns the successful requests per
+# second, latency percentiles, and the number of locked and otherwise failed requests.
+
+def contended_writes(listing_id, users, threads=8, requests_per_thread=50):
+    totals = {'requests': 0, 'locked': 0, 'errors': 0}
+    latencies = []
+    lock = threading.Lock()
+    start_gate = threading.Barrier(threads)
+    clients = []
+    for number in range(threads):
+        clients.append(Client())
+        clients[-1].force_login(users[number % len(users)])
+
+    def worker(worker_number):
+        client = clients[worker_number]
+        counts = dict.fromkeys(totals, 0)
+        times = []
+
+        # data may be a function, to read the form data at the time of the request
+        def timed(method, url, data=None):
+            counts['requests'] += 1
+            started = time.perf_counter()
+            try:
+                status = getattr(client, method)(url, data() if callable(data) else data).status_code
+            except OperationalError as error:
+                counts['locked' if 'locked' in str(error) else 'errors'] += 1
+                return
+            if status >= 400:
+                counts['errors'] += 1
+            else:
+                times.append((time.perf_counter() - started) * 1000)
+
+        try:
+            start_gate.wait()
+            for number in range(requests_per_thread):
+                if number % 3 == 0:
+                    timed('post', reverse('bid_add'),
+                          lambda: {'listing': listing_id, 'amount': Listing.objects.get(pk=listing_id).required_bid})
+                elif number % 3 == 1:
+                    timed('post', reverse('comment_add'), {'listing': listing_id, 'body': f'Comment {number}'})
+                else:
+                    view = 'watchlist_add' if number % 2 else 'watchlist_remove'
+                    timed('get', reverse(view, args=[listing_id]))
+        finally:
+            # Each thread has its own database connection, which must be closed by that thread
+            connection.close()
+        with lock:
+            for key, value in counts.items():
+                totals[key] += value
+            latencies.extend(times)
+
+    workers = [threading.Thread(target=worker, args=(number,)) for number in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {
+        'threads': threads,
+        **totals,
+        'seconds': round(elapsed, 3),
+        'ok_per_second': round(len(latencies) / elapsed, 1) if elapsed else None,
+        'p50_ms': round(percentile(latencies, 50), 1) if latencies else None,
+        'p95_ms': round(percentile(latencies, 95), 1) if latencies else None,
+    }
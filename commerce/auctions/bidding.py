@@ -0,0 +1,62 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, Q
+import decimal
+import enum
+from .live import publish_listing_event
+from .models import Listing, Bid
+
+
+# BID PLACEMENT
+
+# The possible results of a bid attempt
+
+class BidOutcome(enum.Enum):
+    ACCEPTED = 'accepted'
+    OUTBID = 'outbid'
+    CLOSED = 'closed'
+    OWN_LISTING = 'own_listing'
+
+
+class BidResult:
+    def __init__(self, outcome, bid=None, required_bid=None):
+        self.outcome = outcome
+        self.bid = bid
+        # For OUTBID results, the minimum bid that would have been accepted
+        self.required_bid = required_bid
+
+    @property
+    def accepted(self):
+        return self.outcome == BidOutcome.ACCEPTED
+
+    def __repr__(self):
+        return f'<BidResult {self.outcome.value}>'
+
+
+# Validate and record a bid in one short write transaction
+# The listing row is only updated if the bid still beats the current high bid at the moment of writing,
+# so concurrent bidders can never both win with stale reads, and an accepted bid costs two statements.
+
+def place_bid(listing_id, bidder, amount):
+    increment = decimal.Decimal(str(settings.BID_INCREMENT))
+    with transaction.atomic():
+        updated = Listing.objects.active().filter(pk=listing_id).exclude(owner=bidder).filter(
+            Q(high_bid__isnull=True, starting_price__lte=amount) | Q(high_bid__lte=amount - increment)
+        ).update(high_bid=amount, num_bids=F('num_bids') + 1, high_bidder=bidder)
+        if updated:
+            bid = Bid.objects.create(listing_id=listing_id, bidder=bidder, amount=amount)
+            # Tell everyone watching the listing about the new price
+            publish_listing_event(listing_id, 'bid', {
+                'amount': f'{amount:.2f}',
+                'required_bid': f'{amount + increment:.2f}',
+            })
+            return BidResult(BidOutcome.ACCEPTED, bid=bid)
+
+    # The bid was rejected, so look up the listing to find out why
+    # Raises Listing.DoesNotExist if there is no such listing
+    listing = Listing.objects.get(pk=listing_id)
+    if listing.owner_id == bidder.id:
+        return BidResult(BidOutcome.OWN_LISTING)
+    if not listing.is_open:
+        return BidResult(BidOutcome.CLOSED)
+    return BidResult(BidOutcome.OUTBID, required_bid=listing.required_bid)
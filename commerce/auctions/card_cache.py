@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils import timezone, translation
+import time
+from .replicas import replica_cutoff
+
+
+# LISTING CARD CACHE
+# Rendered listing cards are cached under a key that includes the listing's version number.
+# Saving a listing, or a bid or comment on it, bumps the version, so only the cards that changed are re-rendered.
+
+# The catalogue version changes whenever any listing does, for pages that show many listings at once
+
+CATALOGUE_VERSION_KEY = 'listing_version:catalogue'
+
+
+def version_key(listing_id):
+    return f'listing_version:{listing_id}'
+
+
+# Give the listing a new version number, which orphans any cached cards rendered from the old one
+
+def bump_listing_version(listing_id):
+    version = time.time_ns()
+    cache.set_many({version_key(listing_id): version, CATALOGUE_VERSION_KEY: version}, None)
+
+
+# Changes that affect pages of listings without changing any one listing's card, e.g. a deleted listing
+
+def bump_catalogue_version():
+    cache.set(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+
+
+def bump_listing_versions(listing_ids):
+    version = time.time_ns()
+    cache.set_many({version_key(listing_id): version for listing_id in listing_ids}
+                   | {CATALOGUE_VERSION_KEY: version}, None)
+
+
+def catalogue_version():
+    version = cache.get(CATALOGUE_VERSION_KEY)
+    if version is None:
+        # add() rather than set(), so concurrent requests settle on the same version
+        cache.add(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+        version = cache.get(CATALOGUE_VERSION_KEY)
+    return version
+
+
+async def acatalogue_version():
+    version = await cache.aget(CATALOGUE_VERSION_KEY)
+    if version is None:
+        await cache.aadd(CATALOGUE_VERSION_KEY, time.time_ns(), None)
+        version = await cache.aget(CATALOGUE_VERSION_KEY)
+    return version
+
+
+# Look up the current version of each listing, starting a new version for any listing that doesn't have one yet
+# NOTE:  Versions are never reused, so a version evicted from the cache can't bring back a stale card
+
+def listing_versions(listing_ids):
+    keys = {listing_id: version_key(listing_id) for listing_id in listing_ids}
+    versions, missing = merge_versions(keys, cache.get_many(keys.values()))
+    if missing:
+        cache.set_many(missing, None)
+    return versions
+
+
+async def alisting_versions(listing_ids):
+    keys = {listing_id: version_key(listing_id) for listing_id in listing_ids}
+    versions, missing = merge_versions(keys, await cache.aget_many(keys.values()))
+    if missing:
+        await cache.aset_many(missing, None)
+    return versions
+
+
+def merge_versions(keys, found):
+    versions = {}
+    missing = {}
+    for listing_id, key in keys.items():
+        if key in found:
+            versions[listing_id] = found[key]
+        else:
+            versions[listing_id] = missing[key] = time.time_ns()
+    return versions, missing
+
+
+# Cards show localized timestamps, so the key also includes the active timezone and language
+# Watched listings get a "Watching" badge, so they are cached separately
+
+def card_key(listing_id, version, watching=False):
+    return (f'listing_card:{listing_id}:{version}:{timezone.get_current_timezone_name()}:{translation.get_language()}'
+            f'{":watching" if watching else ""}')
+
+
+# Render the cards for a page of listings, re-using cached HTML wherever the listing hasn't changed
+# Cards read from a replica that may not have the listing's latest version yet are rendered but not cached
+
+def render_listing_cards(listings, watched_ids=frozenset()):
+    versions = listing_versions([listing.id for listing in listings])
+    cutoff = replica_cutoff()
+    keys = {listing.id: card_key(listing.id, versions[listing.id], listing.id in watched_ids) for listing in listings
+            if versions[listing.id] < cutoff}
+    cached = cache.get_many(keys.values())
+
+    cards = []
+    rendered = {}
+    for listing in listings:
+        key = keys.get(listing.id)
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string('auctions/listing_card.html', {
+                'listing': listing,
+                'watching': listing.id in watched_ids
+            })
+            if key is not None:
+                rendered[key] = html
+        cards.append(html)
+    if rendered:
+        cache.set_many(rendered, settings.LISTING_CARD_CACHE_TIMEOUT)
+    return cards
@@ -0,0 +1,72 @@
+from collections import namedtuple
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q, Value
+from django.utils import timezone
+from .models import Category, Listing
+
+
+# CATEGORY COUNTS
+# Every category with its number of active listings, plus an "Uncategorized" entry with id 0.
+# The counts come from one grouped query and are cached for the whole site, since the category pages are on almost
+# every visitor's path.  Creating, closing or deleting a listing and changing a category drop the cached counts
+# (see signals.py and closing.py); listings that pass their end time are picked up when the closer runs.
+# The counts are always read from default, since counts read from a replica that is behind would be cached for
+# everyone until they time out.
+
+CATEGORY_COUNTS_KEY = 'category_counts'
+
+UNCATEGORIZED = 'Uncategorized'
+
+CategoryCount = namedtuple('CategoryCount', ['id', 'name', 'listing_count'])
+
+
+# Count the active listings per category, and those without a category, in a single query
+# Empty categories are kept by the outer join, and a category of None marks the uncategorized row
+
+def count_query():
+    now = timezone.now()
+    is_open = Q(listings__is_active=True) & (Q(listings__end_time__isnull=True) | Q(listings__end_time__gt=now))
+    categories = (Category.objects.order_by()
+                  .annotate(listing_count=Count('listings', filter=is_open))
+                  .values_list('id', 'name', 'listing_count'))
+    uncategorized = (Listing.objects.active().filter(category=None).order_by()
+                     .values('category').annotate(listing_count=Count('id'))
+                     .values_list('category', Value(UNCATEGORIZED), 'listing_count'))
+    return categories.union(uncategorized, all=True)
+
+
+# Categories in name order, with uncategorized listings last as on the category index
+# There's no uncategorized row at all when there are no uncategorized listings
+
+def make_counts(rows):
+    counts = sorted((CategoryCount(*row) for row in rows if row[0] is not None), key=lambda category: category.name)
+    uncategorized = next((row[2] for row in rows if row[0] is None), 0)
+    return counts + [CategoryCount(0, UNCATEGORIZED, uncategorized)]
+
+
+def category_counts():
+    counts = cache.get(CATEGORY_COUNTS_KEY)
+    if counts is None:
+        counts = make_counts(list(count_query().using('default')))
+        cache.set(CATEGORY_COUNTS_KEY, counts, settings.CATEGORY_COUNTS_TIMEOUT)
+    return counts
+
+
+async def acategory_counts():
+    counts = await cache.aget(CATEGORY_COUNTS_KEY)
+    if counts is None:
+        counts = make_counts([row async for row in count_query().using('default')])
+        await cache.aset(CATEGORY_COUNTS_KEY, counts, settings.CATEGORY_COUNTS_TIMEOUT)
+    return counts
+
+
+# Look a category up by id in the counts, or None if there's no such category
+# Id 0 is the uncategorized entry
+
+def find_category(counts, category_id):
+    return next((category for category in counts if category.id == category_id), None)
+
+
+def invalidate_category_counts():
+    cache.delete(CATEGORY_COUNTS_KEY)
@@ -0,0 +1,46 @@
+from django.db import transaction
+from django.utils import timezone
+from .card_cache import bump_listing_versions
+from .categories import invalidate_category_counts
+from .live import publish_listing_event
+from .models import Listing, bid_stats
+
+
+# SCHEDULED CLOSING
+# Listings with an end time are closed by the close_expired_auctions worker.  Each batch of expired listings
+# is found through the end time index and closed with one UPDATE, which also locks in the final bid stats
+# and the winner, as close_listing does for a single listing.
+
+def close_expired_batch(now=None, batch_size=500):
+    now = now or timezone.now()
+    with transaction.atomic():
+        ids = list(Listing.objects.filter(is_active=True, end_time__isnull=False, end_time__lte=now)
+                   .order_by('end_time').values_list('id', flat=True)[:batch_size])
+        if not ids:
+            return []
+
+        Listing.objects.filter(pk__in=ids, is_active=True).update(is_active=False, **bid_stats())
+
+        # Bulk updates don't send signals, so refresh the cached cards and tell any watchers here
+        closed = Listing.objects.filter(pk__in=ids).values('id', 'high_bid', 'num_bids')
+        for listing in closed:
+            won = listing['num_bids'] > 0
+            publish_listing_event(listing['id'], 'close', {
+                'amount': f'{listing["high_bid"]:.2f}' if won else None,
+            })
+        transaction.on_commit(lambda: bump_listing_versions(ids))
+        transaction.on_commit(invalidate_category_counts)
+    return ids
+
+
+# Close every expired listing, one batch at a time
+# Returns the number of listings closed
+
+def close_expired_auctions(now=None, batch_size=500):
+    now = now or timezone.now()
+    closed = 0
+    while True:
+        ids = close_expired_batch(now, batch_size)
+        closed += len(ids)
+        if len(ids) < batch_size:
+            return closed
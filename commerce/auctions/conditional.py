@@ -0,0 +1,151 @@
+from collections import namedtuple
+from django.contrib import messages
+from django.core.cache import cache
+from django.db.models import Count, Max, Min, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone, translation
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+import hashlib
+from .card_cache import catalogue_version, acatalogue_version, listing_versions, alisting_versions
+from .models import Listing, Bid, Comment
+from .replicas import replica_cutoff, areplica_cutoff
+from .watchlist import watched_listing_ids, awatched_listing_ids
+
+
+# CONDITIONAL GET
+# Listing and browse pages send an ETag built from a single small query, or from cached version numbers alone,
+# so a browser refreshing an unchanged page gets a 304 without the page being queried or rendered again.
+# The ETag also covers everything about the viewer that changes the page:  who they are, their timezone and
+# language, their watchlist and their CSRF token.
+# NOTE:  There is no Last-Modified header.  No single timestamp changes with all of those, so a client that only
+#        sent If-Modified-Since could be told a stale page was current.
+
+Validators = namedtuple('Validators', ['etag'])
+
+
+def make_validators(request, parts):
+    user_id = request.user.id if request.user.is_authenticated else 'anonymous'
+    viewer = [user_id, timezone.get_current_timezone_name(), translation.get_language(),
+              request.META.get('CSRF_COOKIE', '')]
+    raw = '|'.join(str(part) for part in viewer + parts)
+    return Validators(quote_etag(hashlib.md5(raw.encode(), usedforsecurity=False).hexdigest()))
+
+
+# Validators for a listing detail page, or None if the listing doesn't exist
+# The listing version changes whenever the listing, its bids or its comments are saved; the bid and comment
+# columns also catch bulk updates that don't send signals.  A page read from a replica that may not have the
+# listing's latest version yet gets no validators, so the stale page can't be revalidated once the replica catches up.
+
+def listing_validators(request, listing_id):
+    version = listing_versions([listing_id])[listing_id]
+    if version >= replica_cutoff():
+        return None
+    row = listing_state(listing_id).first()
+    if row is None:
+        return None
+    return listing_page_validators(request, row, [version, listing_id in watched_listing_ids(request.user)])
+
+
+async def alisting_validators(request, listing_id):
+    version = (await alisting_versions([listing_id]))[listing_id]
+    if version >= await areplica_cutoff():
+        return None
+    row = await listing_state(listing_id).afirst()
+    if row is None:
+        return None
+    return listing_page_validators(request, row, [version, listing_id in await awatched_listing_ids(request.user)])
+
+
+def listing_state(listing_id):
+    bids = Bid.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    comments = Comment.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    return Listing.objects.filter(pk=listing_id).annotate(
+        last_bid=Subquery(bids.annotate(latest=Max('timestamp')).values('latest')),
+        last_comment=Subquery(comments.annotate(latest=Max('timestamp')).values('latest')),
+        comment_count=Coalesce(Subquery(comments.annotate(count=Count('id')).values('count')), 0),
+    ).values('timestamp', 'is_active', 'end_time', 'high_bid', 'num_bids', 'last_bid', 'last_comment', 'comment_count')
+
+
+def listing_page_validators(request, row, parts):
+    # The page changes when the end time passes, even before the listing is closed
+    ended = row['end_time'] is not None and row['end_time'] <= timezone.now()
+    return make_validators(request, parts + list(row.values()) + [ended])
+
+
+# Validators for a page of listings, which need no query on most requests
+# The catalogue version changes when any listing is created, edited, bid on, watched, closed or deleted, or a
+# category changes.  The only other way a page of listings changes is a listing passing its end time, so the
+# ETag also includes the next end time still to come, which moves on each time a listing ends.
+# As with a listing page, pages read from a replica that may not have the latest catalogue version get no validators.
+
+def list_validators(request):
+    version = catalogue_version()
+    if version >= replica_cutoff():
+        return None
+    parts = [version, next_listing_end(version), sorted(watched_listing_ids(request.user))]
+    return make_validators(request, parts)
+
+
+async def alist_validators(request):
+    version = await acatalogue_version()
+    if version >= await areplica_cutoff():
+        return None
+    parts = [version, await anext_listing_end(version), sorted(await awatched_listing_ids(request.user))]
+    return make_validators(request, parts)
+
+
+# The earliest end time still to come of any active listing, or None if no active listing has one
+# Cached with the catalogue version it was found under, which the database read from is known to include, and found
+# again (on listing_active_end_idx) only once that version changes or the end time has passed
+
+NEXT_LISTING_END_KEY = 'next_listing_end'
+
+
+def next_listing_end(version):
+    cached = cache.get(NEXT_LISTING_END_KEY)
+    if is_current(cached, version):
+        return cached[1]
+    next_end = upcoming_ends().aggregate(next_end=Min('end_time'))['next_end']
+    cache.set(NEXT_LISTING_END_KEY, (version, next_end), None)
+    return next_end
+
+
+async def anext_listing_end(version):
+    cached = await cache.aget(NEXT_LISTING_END_KEY)
+    if is_current(cached, version):
+        return cached[1]
+    next_end = (await upcoming_ends().aaggregate(next_end=Min('end_time')))['next_end']
+    await cache.aset(NEXT_LISTING_END_KEY, (version, next_end), None)
+    return next_end
+
+
+def upcoming_ends():
+    return Listing.objects.filter(is_active=True, end_time__gt=timezone.now()).order_by()
+
+
+def is_current(cached, version):
+    return cached is not None and cached[0] == version and (cached[1] is None or cached[1] > timezone.now())
+
+
+# Return a 304 response if the client's copy is still current, otherwise None
+# Pages with pending flash messages are never validated, since rendering them uses up the messages
+
+def not_modified(request, validators):
+    if validators is None or not cacheable(request):
+        return None
+    response = get_conditional_response(request, etag=validators.etag)
+    return response and add_validators(request, response, validators)
+
+
+def add_validators(request, response, validators):
+    if validators is None or not cacheable(request):
+        return response
+    response.headers.setdefault('ETag', validators.etag)
+    # The page depends on who is asking, and must be revalidated before every reuse
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def cacheable(request):
+    return request.method in ('GET', 'HEAD') and not len(messages.get_messages(request))
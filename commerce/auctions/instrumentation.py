@@ -0,0 +1,72 @@
+from django.template.backends.django import DjangoTemplates, Template
+import contextvars
+import time
+
+
+# PER-REQUEST TIMINGS
+# PerformanceMiddleware stores a RequestTimings object here for each sampled request,
+# and the database and template hooks below add to it.
+# A context variable follows the request into the threads that async views run their queries and templates in.
+
+current_timings = contextvars.ContextVar('current_timings', default=None)
+
+
+class RequestTimings:
+    def __init__(self):
+        self.query_count = 0
+        self.db_time = 0.0
+        self.template_time = 0.0
+        # Templates render other templates (includes, cached cards), so only time the outermost one
+        self.template_depth = 0
+
+    # Times every query run while the request is being handled
+    # See https://docs.djangoproject.com/en/3.0/topics/db/instrumentation/
+    def record_query(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db_time += time.perf_counter() - started
+            self.query_count += 1
+
+
+# Database execute wrapper installed on every connection when it is created (see AuctionsConfig.ready)
+# Queries run outside a sampled request pass straight through.
+
+def record_query(execute, sql, params, many, context):
+    timings = current_timings.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+    return timings.record_query(execute, sql, params, many, context)
+
+
+def install_query_timer(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+# Template backend that adds its render time to the current request's timings
+# Drop-in replacement for django.template.backends.django.DjangoTemplates
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        timings = current_timings.get()
+        if timings is None:
+            return super().render(context, request)
+        timings.template_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            timings.template_depth -= 1
+            if timings.template_depth == 0:
+                timings.template_time += time.perf_counter() - started
+
+
+class TimedDjangoTemplates(DjangoTemplates):
+    def from_string(self, template_code):
+        return TimedTemplate(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        template = super().get_template(template_name)
+        return TimedTemplate(template.template, self)
@@ -0,0 +1,99 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils.module_loading import import_string
+import asyncio
+import functools
+import threading
+
+
+# LIVE UPDATES
+# Bids and closings are published to a per-listing channel, and the server-sent event streams (see sse.py)
+# pass them on to everyone watching the listing.  The broker is chosen by settings.LIVE_UPDATES_BROKER,
+# so a cross-process broker can replace the in-process one without touching the publishers or the streams.
+
+def listing_channel(listing_id):
+    return f'listing:{listing_id}'
+
+
+# The interface every broker implements
+# publish() may be called from any thread; subscribe() is called from the event loop serving the stream
+
+class Broker:
+    def publish(self, channel, event):
+        raise NotImplementedError
+
+    def subscribe(self, channel):
+        raise NotImplementedError
+
+
+class Subscription:
+    # Wait for the next event on the channel
+    async def get(self):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+
+# Delivers events to subscribers in the same process, through an asyncio queue per subscriber
+# An idle subscriber is just a queue and a suspended coroutine, so thousands of watchers cost very little.
+# NOTE:  Only bids placed in this process reach its subscribers, so run a single process or use a shared broker.
+
+class InProcessBroker(Broker):
+    # A subscriber that falls this far behind loses its oldest events rather than holding memory forever
+    QUEUE_SIZE = 100
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = {}
+
+    def publish(self, channel, event):
+        with self.lock:
+            subscribers = list(self.subscribers.get(channel, ()))
+        for subscription in subscribers:
+            # Queues aren't thread-safe, so hand the event to the subscriber's own event loop
+            subscription.loop.call_soon_threadsafe(subscription.put, event)
+
+    def subscribe(self, channel):
+        subscription = InProcessSubscription(self, channel)
+        with self.lock:
+            self.subscribers.setdefault(channel, set()).add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            subscribers = self.subscribers.get(subscription.channel, set())
+            subscribers.discard(subscription)
+            if not subscribers:
+                self.subscribers.pop(subscription.channel, None)
+
+
+class InProcessSubscription(Subscription):
+    def __init__(self, broker, channel):
+        self.broker = broker
+        self.channel = channel
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(broker.QUEUE_SIZE)
+
+    def put(self, event):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(event)
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+@functools.lru_cache(maxsize=None)
+def get_broker():
+    return import_string(settings.LIVE_UPDATES_BROKER)()
+
+
+# Publish an event about a listing once the current transaction commits, so watchers never see a rolled-back bid
+
+def publish_listing_event(listing_id, event_type, data):
+    event = {'type': event_type, 'data': data}
+    transaction.on_commit(lambda: get_broker().publish(listing_channel(listing_id), event))
@@ -0,0 +1,324 @@
+from django.db import connection
+from django.urls import Resolver404, resolve, reverse
+from http.cookies import SimpleCookie
+import decimal
+import functools
+import http.client
+import io
+import random
+import re
+import sys
+import threading
+import time
+import urllib.parse
+from .benchmarks import percentile
+from .seeding import SEED_PASSWORD
+
+
+# LOAD TESTING
+# Virtual users walk through the site the way people do:  browsers look at the index, some listings, a category
+# and a search, and buyers log in to watch, bid on and comment on the listings they open.  Each virtual user is
+# a thread with its own cookies, which reads links, CSRF tokens and minimum bids from the pages it is served.
+# The WSGI application is driven either in this process, or through a local socket (see start_wsgi_server).
+# Buyers log in as the users made by manage.py seed_auctions, so seed the database first.
+
+# Words that appear in the seeded listing descriptions
+SEARCH_TERMS = ['vintage', 'box', 'heirloom', 'artisan', 'used', 'photos']
+
+CSRF_TOKEN = re.compile(r'name="csrfmiddlewaretoken" value="([^"]+)"')
+REQUIRED_BID = re.compile(r'data-live="required_bid">([0-9.]+)<')
+
+# Requests that fail without a response, e.g. a refused connection or a timeout
+TRANSPORT_ERRORS = (OSError, http.client.HTTPException)
+
+
+# Matches links to a URL that takes one id, capturing the id
+@functools.lru_cache(maxsize=None)
+def link_pattern(url_name):
+    return re.compile(r'href="' + re.escape(reverse(url_name, args=[12345])).replace('12345', r'(\d+)') + '"')
+
+
+# Call the WSGI application directly, as a WSGI server would
+# Returns the status code, the response headers as a list of (name, value) pairs, and the body
+
+class InProcessTransport:
+    def __init__(self, application, host='127.0.0.1'):
+        self.application = application
+        self.host = host
+
+    def send(self, method, path, headers, body):
+        path, _, query = path.partition('?')
+        environ = {
+            'REQUEST_METHOD': method,
+            'SCRIPT_NAME': '',
+            'PATH_INFO': urllib.parse.unquote(path, 'iso-8859-1'),
+            'QUERY_STRING': query,
+            'SERVER_NAME': self.host,
+            'SERVER_PORT': '80',
+            'SERVER_PROTOCOL': 'HTTP/1.1',
+            'REMOTE_ADDR': '127.0.0.1',
+            'HTTP_HOST': self.host,
+            'CONTENT_LENGTH': str(len(body)),
+            'wsgi.version': (1, 0),
+            'wsgi.url_scheme': 'http',
+            'wsgi.input': io.BytesIO(body),
+            'wsgi.errors': sys.stderr,
+            'wsgi.multithread': True,
+            'wsgi.multiprocess': False,
+            'wsgi.run_once': False,
+        }
+        for name, value in headers.items():
+            key = name.upper().replace('-', '_')
+            environ[key if key == 'CONTENT_TYPE' else f'HTTP_{key}'] = value
+
+        response = {}
+
+        def start_response(status, response_headers, exc_info=None):
+            response['status'] = int(status.split(' ', 1)[0])
+            response['headers'] = response_headers
+
+        result = self.application(environ, start_response)
+        try:
+            content = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return response['status'], response['headers'], content
+
+
+# Send each request over a new HTTP connection to a server, e.g. one from start_wsgi_server
+
+class SocketTransport:
+    def __init__(self, host, port, timeout=30):
+        self.host = host
+        self.port = port
+        self.timeout = timeout
+
+    def send(self, method, path, headers, body):
+        http_connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+        try:
+            http_connection.request(method, path, body=body or None, headers=headers)
+            response = http_connection.getresponse()
+            return response.status, response.getheaders(), response.read()
+        finally:
+            http_connection.close()
+
+
+# Collects the outcome of every request, by URL name, from all the virtual users
+
+class LoadReport:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.journeys = {}
+
+    def record(self, url_name, milliseconds, ok):
+        with self.lock:
+            self.latencies.setdefault(url_name, []).append(milliseconds)
+            self.errors[url_name] = self.errors.get(url_name, 0) + (not ok)
+
+    def journey(self, name):
+        with self.lock:
+            self.journeys[name] = self.journeys.get(name, 0) + 1
+
+    # Throughput, error rates and latency percentiles, overall and for each URL name
+    def summary(self, seconds):
+        def stats(latencies, errors):
+            return {
+                'requests': len(latencies),
+                'requests_per_second': round(len(latencies) / seconds, 1) if seconds else None,
+                'error_rate': round(errors / len(latencies), 4) if latencies else 0,
+                **{f'p{pct}_ms': round(percentile(latencies, pct), 1) for pct in (50, 90, 95, 99)},
+                'max_ms': round(max(latencies), 1),
+            }
+
+        everything = [latency for latencies in self.latencies.values() for latency in latencies]
+        return {
+            'seconds': round(seconds, 3),
+            'journeys': dict(self.journeys),
+            'total': stats(everything, sum(self.errors.values())) if everything else {'requests': 0},
+            'urls': {name: stats(latencies, self.errors[name]) for name, latencies in sorted(self.latencies.items())},
+        }
+
+
+# One virtual user's browser:  keeps its cookies, follows redirects, and records every request it makes
+
+class Browser:
+    def __init__(self, transport, report, rng, think_time=0):
+        self.transport = transport
+        self.report = report
+        self.rng = rng
+        self.think_time = think_time
+        self.cookies = {}
+        self.csrf_token = None
+
+    # Wait a while between pages, as people do:  think_time seconds on average
+    def think(self):
+        if self.think_time:
+            time.sleep(self.rng.uniform(0, 2 * self.think_time))
+
+    # Returns the status code and the body of the final response, or (None, '') if the request failed
+    def request(self, method, path, data=None, follow=True):
+        headers = {}
+        if self.cookies:
+            headers['Cookie'] = '; '.join(f'{name}={value}' for name, value in self.cookies.items())
+        body = b''
+        if data is not None:
+            body = urllib.parse.urlencode({**data, 'csrfmiddlewaretoken': self.csrf_token or ''}).encode()
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+
+        started = time.perf_counter()
+        try:
+            status, response_headers, content = self.transport.send(method, path, headers, body)
+        except TRANSPORT_ERRORS:
+            self.report.record(self.url_name(path), (time.perf_counter() - started) * 1000, False)
+            return None, ''
+        self.report.record(self.url_name(path), (time.perf_counter() - started) * 1000, status < 400)
+
+        location = None
+        for name, value in response_headers:
+            if name.lower() == 'set-cookie':
+                self.set_cookies(value)
+            elif name.lower() == 'location':
+                location = value
+        text = content.decode('utf-8', 'replace')
+        token = CSRF_TOKEN.search(text)
+        if token:
+            self.csrf_token = token.group(1)
+        if follow and location and status in (301, 302, 303, 307, 308):
+            url = urllib.parse.urlsplit(urllib.parse.urljoin(path, location))
+            return self.request('GET', url.path + (f'?{url.query}' if url.query else ''))
+        return status, text
+
+    def get(self, path):
+        return self.request('GET', path)
+
+    def post(self, path, data):
+        return self.request('POST', path, data)
+
+    def set_cookies(self, header):
+        for name, morsel in SimpleCookie(header).items():
+            if morsel['max-age'] == '0' or not morsel.value:
+                self.cookies.pop(name, None)
+            else:
+                self.cookies[name] = morsel.value
+
+    @staticmethod
+    def url_name(path):
+        try:
+            return resolve(urllib.parse.urlsplit(path).path).url_name
+        except Resolver404:
+            return 'unknown'
+
+    def log_in(self, username, password=SEED_PASSWORD):
+        self.get(reverse('login'))
+        self.think()
+        # The login form always sends next, empty unless the user was sent there from another page
+        self.post(reverse('login'), {'username': username, 'password': password, 'next': ''})
+        return 'sessionid' in self.cookies
+
+
+# JOURNEYS
+# Each journey is one visit to the site.  It starts from the index page and only follows links it was shown.
+
+def links(pattern, text):
+    return [int(found) for found in pattern.findall(text)]
+
+
+# Look at the index, a few listings, a category and the search results
+
+def browse(browser):
+    _, index = browser.get(reverse('index'))
+    listing_ids = links(link_pattern('listing'), index)
+    for listing_id in browser.rng.sample(listing_ids, min(len(listing_ids), browser.rng.randint(1, 3))):
+        browser.think()
+        browser.get(reverse('listing', args=[listing_id]))
+    browser.think()
+    _, categories = browser.get(reverse('category_index'))
+    category_ids = links(link_pattern('category_listing'), categories)
+    if category_ids:
+        browser.think()
+        browser.get(reverse('category_listing', args=[browser.rng.choice(category_ids)]))
+    browser.think()
+    browser.get(reverse('search') + '?' + urllib.parse.urlencode({'q': browser.rng.choice(SEARCH_TERMS)}))
+
+
+# Open a listing from the index, watch it, bid the minimum or a little more, comment, and stop watching it
+# Every action redirects back to the listing page, which the browser loads as it would.
+
+def shop(browser):
+    _, index = browser.get(reverse('index'))
+    listing_ids = links(link_pattern('listing'), index)
+    if not listing_ids:
+        return
+    listing_id = browser.rng.choice(listing_ids)
+    browser.think()
+    _, page = browser.get(reverse('listing', args=[listing_id]))
+    browser.think()
+    browser.get(reverse('watchlist_add', args=[listing_id]))
+    required_bid = REQUIRED_BID.search(page)
+    if required_bid:
+        browser.think()
+        amount = decimal.Decimal(required_bid.group(1)) + decimal.Decimal(browser.rng.randint(0, 500)) / 100
+        _, page = browser.post(reverse('bid_add'), {'listing': listing_id, 'amount': amount})
+    browser.think()
+    browser.post(reverse('comment_add'), {'listing': listing_id, 'body': 'Is this still available?'})
+    browser.think()
+    browser.get(reverse('watchlist_remove', args=[listing_id]))
+
+
+# Run virtual users against the site for a while, and report on every request they made
+# A buyer_fraction of the users log in as the seeded users <user_prefix>0 ... <user_prefix><seeded_users - 1>
+# and shop; the rest browse anonymously.  Users are started evenly over ramp_up seconds, and each keeps making
+# journeys until duration seconds have passed, or it has made journeys_per_user of them.
+
+def run_load_test(transport, users=20, duration=30, journeys_per_user=None, buyer_fraction=0.2, think_time=0,
+                  ramp_up=0, seeded_users=100, user_prefix='user', seed=None):
+    report = LoadReport()
+    buyers = round(users * buyer_fraction)
+    started = time.perf_counter()
+    deadline = started + ramp_up + duration
+
+    def virtual_user(number):
+        rng = random.Random(None if seed is None else seed + number)
+        browser = Browser(transport, report, rng, think_time)
+        try:
+            time.sleep(ramp_up * number / users)
+            journey = browse
+            if number < buyers:
+                journey = shop
+                if not browser.log_in(f'{user_prefix}{number % seeded_users}'):
+                    report.journey('failed_login')
+                    return
+            made = 0
+            while time.perf_counter() < deadline and (journeys_per_user is None or made < journeys_per_user):
+                journey(browser)
+                report.journey(journey.__name__)
+                made += 1
+                browser.think()
+        finally:
+            # In process, the views run on this thread, which has its own database connection
+            connection.close()
+
+    workers = [threading.Thread(target=virtual_user, args=(number,)) for number in range(users)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return report.summary(time.perf_counter() - started)
+
+
+# The ways a load test report misses the capacity targets, if any
+# Checked overall and for every URL name, so one slow page can't hide among many fast ones
+
+def missed_targets(summary, max_p95_ms=None, max_error_rate=None):
+    missed = []
+    for name, stats in [('total', summary['total']), *summary['urls'].items()]:
+        if not stats['requests']:
+            continue
+        if max_p95_ms is not None and stats['p95_ms'] > max_p95_ms:
+            missed.append(f'{name}: p95 of {stats["p95_ms"]}ms is over {max_p95_ms}ms')
+        if max_error_rate is not None and stats['error_rate'] > max_error_rate:
+            missed.append(f'{name}: error rate of {stats["error_rate"]:.2%} is over {max_error_rate:.2%}')
+    return missed
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+import decimal
+import json
+from auctions.benchmarks import hammer_listing
+from auctions.models import User, Listing
+
+
+# Stress test bid placement by hammering a single hot listing from many threads
+# Creates a throwaway owner, bidders and listing in the configured database, and removes them afterwards.
+
+class Command(BaseCommand):
+    help = 'Report accepted bids per second and the rejection breakdown for one contended listing'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8)
+        parser.add_argument('--bids-per-thread', type=int, default=100)
+        parser.add_argument('--seed', type=int, default=None)
+
+    def handle(self, *args, **options):
+        owner = User.objects.create_user('bench_bids_owner')
+        bidders = [User.objects.create_user(f'bench_bids_{n}') for n in range(options['threads'])]
+        listing = Listing.objects.create(
+            owner=owner, title='Benchmark listing', description='Hot listing for bench_bids',
+            starting_price=decimal.Decimal('1.00'))
+        try:
+            report = hammer_listing(listing.id, bidders, threads=options['threads'],
+                                    bids_per_thread=options['bids_per_thread'], seed=options['seed'])
+        finally:
+            # Deleting the users cascades to the listing and its bids
+            User.objects.filter(pk__in=[owner.pk] + [bidder.pk for bidder in bidders]).delete()
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,45 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+import json
+import time
+from auctions.benchmarks import percentile
+from auctions.models import Listing
+from auctions.search import fts_available, search_listings, icontains_search
+
+
+QUERIES = ['vintage', 'heirloom corners', 'box', 'artisan', 'perfectly', 'listing 4', 'photos bidding', 'nothing matches this']
+
+
+# Compare FTS5 search against a naive icontains scan over the listings in the configured database
+# Seed a realistic catalogue first, e.g.:  manage.py seed_auctions --listings 100000
+
+class Command(BaseCommand):
+    help = 'Time ranked full-text listing search against an icontains scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--runs', type=int, default=20, help='Times to run each query')
+        parser.add_argument('--limit', type=int, default=50)
+
+    def handle(self, *args, **options):
+        if not fts_available(connection):
+            raise CommandError('The full-text search index is only used with SQLite.')
+
+        report = {'listings': Listing.objects.count(), 'queries': {}}
+        for query in QUERIES:
+            timings = {'fts': [], 'icontains': []}
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                fts_results = search_listings(query, limit=options['limit'])
+                timings['fts'].append((time.perf_counter() - started) * 1000)
+
+                started = time.perf_counter()
+                icontains_results = list(icontains_search(
+                    Listing.objects.active().with_card_data(), query)[:options['limit']])
+                timings['icontains'].append((time.perf_counter() - started) * 1000)
+
+            report['queries'][query] = {
+                'results': {'fts': len(fts_results), 'icontains': len(icontains_results)},
+                **{f'{method}_p50_ms': round(percentile(values, 50), 2) for method, values in timings.items()},
+                **{f'{method}_p95_ms': round(percentile(values, 95), 2) for method, values in timings.items()},
+            }
+        self.stdout.write(json.dumps(report, indent=2))
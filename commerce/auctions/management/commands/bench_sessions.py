@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+import decimal
+import json
+from auctions.benchmarks import session_writes
+from auctions.models import User, Listing
+
+
+# Count the database writes per user action under each session and message storage profile
+# Creates a throwaway owner, bidder and listing in the configured database, and removes them afterwards.
+
+class Command(BaseCommand):
+    help = 'Report database writes per user action for each SESSION_PROFILES entry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rounds', type=int, default=5, help='Times to repeat each action')
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='Profile to measure; may be repeated (default: all of them)')
+
+    def handle(self, *args, **options):
+        profiles = options['profiles'] or list(settings.SESSION_PROFILES)
+        for profile in profiles:
+            if profile not in settings.SESSION_PROFILES:
+                raise CommandError(f'Unknown session profile: {profile}')
+
+        password = 'bench_sessions'
+        owner = User.objects.create_user('bench_sessions_owner')
+        bidder = User.objects.create_user('bench_sessions_bidder', password=password)
+        listing = Listing.objects.create(
+            owner=owner, title='Benchmark listing', description='Listing for bench_sessions',
+            starting_price=decimal.Decimal('1.00'))
+        report = {}
+        try:
+            # The test client's requests are addressed to "testserver"
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+                for profile in profiles:
+                    cache.clear()
+                    with override_settings(**settings.SESSION_PROFILES[profile]):
+                        report[profile] = session_writes(bidder.username, password, listing.id, options['rounds'])
+        finally:
+            # Deleting the users cascades to the listing and its bids and comments
+            User.objects.filter(pk__in=[owner.pk, bidder.pk]).delete()
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,64 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.core.wsgi import get_wsgi_application
+import asyncio
+import json
+import threading
+import time
+from auctions.benchmarks import slow_client_load, start_wsgi_server
+
+
+# Compare the WSGI deployment with the async views under ASGI while many slow clients are connected
+# A slow client holds a WSGI worker thread for as long as it takes to send its request; under ASGI it only holds
+# a socket.  Runs both servers in this process against the configured database, so seed it first, e.g.:
+# manage.py seed_auctions --listings 10000
+# The ASGI side needs an ASGI server:  pip install uvicorn
+
+class Command(BaseCommand):
+    help = 'Time fast requests to the WSGI and ASGI deployments while slow clients tie up connections'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--path', default='/', help='Page to request')
+        parser.add_argument('--slow-clients', type=int, default=100)
+        parser.add_argument('--trickle', type=float, default=2.0,
+                            help='Seconds each slow client takes to send its request')
+        parser.add_argument('--requests', type=int, default=200, help='Number of fast requests to time')
+        parser.add_argument('--concurrency', type=int, default=10, help='Fast requests in flight at once')
+        parser.add_argument('--threads', type=int, default=8, help='WSGI worker threads')
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn
+        except ImportError:
+            raise CommandError('The ASGI benchmark needs uvicorn:  pip install uvicorn')
+
+        load = {key: options[key] for key in ('slow_clients', 'trickle', 'requests', 'concurrency')}
+        report = {'path': options['path'], 'wsgi_threads': options['threads'], **load}
+
+        server = start_wsgi_server(get_wsgi_application(), options['threads'])
+        try:
+            report['wsgi'] = asyncio.run(slow_client_load('127.0.0.1', server.server_port, options['path'], **load))
+        finally:
+            server.shutdown()
+            server.server_close()
+
+        # As in its own process, the ASGI side doesn't keep connections open (see commerce/asgi_async.py)
+        for database in settings.DATABASES.values():
+            database['CONN_MAX_AGE'] = 0
+
+        # The slow clients and fast requests share one event loop with no worker threads to run out of
+        config = uvicorn.Config('commerce.asgi_async:application', host='127.0.0.1', port=0, lifespan='off',
+                                log_level='warning', backlog=4096)
+        asgi_server = uvicorn.Server(config)
+        thread = threading.Thread(target=asgi_server.run, daemon=True)
+        thread.start()
+        while not asgi_server.started:
+            time.sleep(0.05)
+        try:
+            port = asgi_server.servers[0].sockets[0].getsockname()[1]
+            report['asgi'] = asyncio.run(slow_client_load('127.0.0.1', port, options['path'], **load))
+        finally:
+            asgi_server.should_exit = True
+            thread.join()
+
+        self.stdout.write(json.dumps(report, indent=2))
@@ -0,0 +1,63 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+import decimal
+import json
+import logging
+from auctions.benchmarks import contended_writes, sqlite_settings
+from auctions.models import User, Listing
+
+
+# Compare write throughput and "database is locked" errors under SQLite's defaults and under SQLITE_PRAGMAS
+# Many users bid, comment and watch one listing at once, through the views.
+# Creates throwaway users and a listing in the configured database, and removes them afterwards.
+# NOTE:  journal_mode is stored in the database file, so it's left in the mode of the last profile measured.
+
+def write_profiles():
+    return {
+        # SQLite's defaults, with the 5 second busy timeout Python's sqlite3 module sets
+        'defaults': ({'journal_mode': 'delete', 'synchronous': 'full'}, None),
+        'tuned': (settings.SQLITE_PRAGMAS, settings.DATABASES['default'].get('OPTIONS', {}).get('transaction_mode')),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Report write throughput and lock errors with SQLite\'s defaults and with the tuned settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--requests-per-thread', type=int, default=50)
+        parser.add_argument('--profile', action='append', dest='profiles',
+                            help='Profile to measure; may be repeated (default: all of them)')
+
+    def handle(self, *args, **options):
+        profiles = write_profiles()
+        names = options['profiles'] or list(profiles)
+        for name in names:
+            if name not in profiles:
+                raise CommandError(f'Unknown profile: {name}')
+        if settings.DATABASES['default']['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('bench_writes compares SQLite settings, and needs a SQLite database')
+
+        owner = User.objects.create_user('bench_writes_owner')
+        bidders = [User.objects.create_user(f'bench_writes_{n}') for n in range(options['threads'])]
+        listing = Listing.objects.create(
+            owner=owner, title='Benchmark listing', description='Listing for bench_writes',
+            starting_price=decimal.Decimal('1.00'))
+        report = {}
+        # Locked requests are expected here, so Django's error log for each of them is muted
+        request_logger = logging.getLogger('django.request')
+        level = request_logger.level
+        request_logger.setLevel(logging.CRITICAL)
+        try:
+            # The test client's requests are addressed to "testserver"
+            with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], PERFORMANCE_SAMPLE_RATE=0):
+                for name in names:
+                    with sqlite_settings(*profiles[name]):
+                        report[name] = contended_writes(listing.id, bidders, threads=options['threads'],
+                                                        requests_per_thread=options['requests_per_thread'])
+        finally:
+            request_logger.setLevel(level)
+            # Deleting the users cascades to the listing and its bids and comments
+            User.objects.filter(pk__in=[owner.pk] + [bidder.pk for bidder in bidders]).delete()
+        self.stdout.write(json.dumps(report, indent=2))
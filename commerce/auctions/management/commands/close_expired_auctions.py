@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+import time
+from auctions.closing import close_expired_auctions
+
+
+# Background worker that closes listings once their end time has passed
+# Run it alongside the web server, e.g.:  manage.py close_expired_auctions --interval 30
+# Use --once to close whatever has expired and exit, e.g. from cron.
+
+class Command(BaseCommand):
+    help = 'Close expired auctions in batches, now and then every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=30, help='Seconds between checks')
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--once', action='store_true', help='Check once and exit')
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            closed = close_expired_auctions(batch_size=options['batch_size'])
+            if closed or options['verbosity'] > 1:
+                self.stdout.write(f'Closed {closed} expired auctions in {time.perf_counter() - started:.2f}s.')
+            if options['once']:
+                return
+            # Don't hold a database connection open between checks
+            close_old_connections()
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+import time
+from auctions.thumbnails import Image, generate_thumbnails
+
+
+# Background worker that makes thumbnails for new listing images
+# Run it alongside the web server, e.g.:  manage.py generate_thumbnails --interval 10 --workers 8
+# Use --once to process whatever is pending and exit, e.g. from cron.
+
+class Command(BaseCommand):
+    help = 'Fetch listing images and store their thumbnails, now and then every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=10, help='Seconds between checks')
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--workers', type=int, default=4, help='Images fetched and resized at once')
+        parser.add_argument('--once', action='store_true', help='Check once and exit')
+
+    def handle(self, *args, **options):
+        if Image is None:
+            raise CommandError('Making thumbnails needs Pillow:  pip install Pillow')
+        while True:
+            started = time.perf_counter()
+            done = generate_thumbnails(batch_size=options['batch_size'], workers=options['workers'])
+            if done or options['verbosity'] > 1:
+                self.stdout.write(f'Made thumbnails for {done} listings in {time.perf_counter() - started:.2f}s.')
+            if options['once']:
+                return
+            # Don't hold a database connection open between checks
+            close_old_connections()
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,60 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import override_settings
+import json
+from auctions.benchmarks import start_wsgi_server
+from auctions.loadtest import InProcessTransport, SocketTransport, missed_targets, run_load_test
+from auctions.models import User
+
+
+# Load test the site with virtual users browsing, watching, bidding and commenting at once
+# Drives the application in commerce/wsgi.py, either by calling it from each user's thread (--transport inprocess)
+# or over HTTP through a local threaded server (--transport socket).  Seed the database first, e.g.:
+#   manage.py seed_auctions --users 100 --listings 10000 --bids 100000
+#   manage.py load_test --users 50 --duration 60 --think-time 1 --max-p95 500 --max-error-rate 0.01
+# With --max-p95 or --max-error-rate the command fails if the run misses them, so it can check capacity targets.
+
+class Command(BaseCommand):
+    help = 'Run virtual users through realistic journeys and report throughput, latency and errors by URL name'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=20, help='Virtual users running at once')
+        parser.add_argument('--duration', type=float, default=30, help='Seconds to run for, after the ramp-up')
+        parser.add_argument('--journeys', type=int, default=None,
+                            help='Stop each user after this many journeys, even if --duration has not passed')
+        parser.add_argument('--buyers', type=float, default=0.2,
+                            help='Fraction of the users who log in and bid; the rest only browse')
+        parser.add_argument('--think-time', type=float, default=0, help='Average seconds between pages')
+        parser.add_argument('--ramp-up', type=float, default=0, help='Seconds over which to start the users')
+        parser.add_argument('--transport', choices=['inprocess', 'socket'], default='inprocess')
+        parser.add_argument('--threads', type=int, default=8, help='Server threads, for --transport socket')
+        parser.add_argument('--user-prefix', default='user', help='As given to seed_auctions')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable journeys')
+        parser.add_argument('--max-p95', type=float, default=None, help='Target p95 latency in milliseconds')
+        parser.add_argument('--max-error-rate', type=float, default=None, help='Target error rate, e.g. 0.01')
+
+    def handle(self, *args, **options):
+        seeded_users = User.objects.filter(username__startswith=options['user_prefix']).count()
+        if options['buyers'] and not User.objects.filter(username=f'{options["user_prefix"]}0').exists():
+            raise CommandError('No seeded users to log in as.  Seed the database first:  manage.py seed_auctions')
+
+        from commerce.wsgi import application
+        load = dict(users=options['users'], duration=options['duration'], journeys_per_user=options['journeys'],
+                    buyer_fraction=options['buyers'], think_time=options['think_time'], ramp_up=options['ramp_up'],
+                    seeded_users=max(seeded_users, 1), user_prefix=options['user_prefix'], seed=options['seed'])
+        # Request logging is switched off, so it doesn't flood the output
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, '127.0.0.1'], PERFORMANCE_SAMPLE_RATE=0):
+            if options['transport'] == 'inprocess':
+                summary = run_load_test(InProcessTransport(application), **load)
+            else:
+                server = start_wsgi_server(application, options['threads'])
+                try:
+                    summary = run_load_test(SocketTransport('127.0.0.1', server.server_port), **load)
+                finally:
+                    server.shutdown()
+                    server.server_close()
+
+        self.stdout.write(json.dumps({'transport': options['transport'], **summary}, indent=2))
+        missed = missed_targets(summary, options['max_p95'], options['max_error_rate'])
+        if missed:
+            raise CommandError('Missed the capacity targets:\n' + '\n'.join(missed))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from auctions.search import fts_available, rebuild_search_index
+
+
+# Rebuild the listing search index from the listings table
+
+class Command(BaseCommand):
+    help = 'Recreate the listing search index and its triggers, and re-index every listing'
+
+    def handle(self, *args, **options):
+        if not fts_available(connection):
+            raise CommandError('The listing search index is only used with SQLite.')
+        rebuild_search_index(connection)
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
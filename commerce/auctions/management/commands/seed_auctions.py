@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+import time
+from auctions.seeding import seed_auctions, SEED_PASSWORD
+
+
+# Generate a large synthetic dataset for local load testing
+
+class Command(BaseCommand):
+    help = 'Create users, categories, listings, bids, comments and watchlist entries with realistic skew'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100)
+        parser.add_argument('--categories', type=int, default=10)
+        parser.add_argument('--listings', type=int, default=1000)
+        parser.add_argument('--bids', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=5000)
+        parser.add_argument('--watchlist', type=int, default=2000,
+                            help='Number of watchlist entries to create (duplicates are skipped)')
+        parser.add_argument('--closed-fraction', type=float, default=0.2,
+                            help='Fraction of listings that are closed')
+        parser.add_argument('--skew', type=float, default=1.1,
+                            help='Zipf exponent for listing popularity; higher values concentrate bids on fewer listings')
+        parser.add_argument('--seed', type=int, default=None, help='Random seed, for repeatable output')
+        parser.add_argument('--batch-size', type=int, default=5000)
+        parser.add_argument('--user-prefix', default='user')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        created = seed_auctions(
+            users=options['users'], categories=options['categories'], listings=options['listings'],
+            bids=options['bids'], comments=options['comments'], watchlist=options['watchlist'],
+            closed_fraction=options['closed_fraction'], skew=options['skew'], seed=options['seed'],
+            batch_size=options['batch_size'], user_prefix=options['user_prefix'])
+        elapsed = time.perf_counter() - started
+        for model, count in created.items():
+            self.stdout.write(f'{model}: {count}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Seeded in {elapsed:.1f}s.  Users can log in as {options["user_prefix"]}0, '
+            f'{options["user_prefix"]}1, ... with password "{SEED_PASSWORD}".'))
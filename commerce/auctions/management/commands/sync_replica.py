@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+import time
+from auctions.replicas import copy_database, record_replica_copy
+
+
+# Background worker that keeps the read replica (AUCTIONS_REPLICA_DB) a recent copy of the database
+# Run it alongside the web server, e.g.:  manage.py sync_replica --interval 2
+# Keep --interval below READ_REPLICA_STICKY_SECONDS, so users are back on the replica only once it has their writes.
+# Use --once to copy the database once and exit, e.g. to create the replica before starting the web server.
+
+class Command(BaseCommand):
+    help = 'Copy the database to the read replica, now and then every --interval seconds'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float, default=2, help='Seconds between copies')
+        parser.add_argument('--once', action='store_true', help='Copy once and exit')
+
+    def handle(self, *args, **options):
+        if not settings.REPLICA_DATABASE_PATH:
+            raise CommandError('Set AUCTIONS_REPLICA_DB to the path of the replica database')
+        source = settings.DATABASES['default']['NAME']
+        while True:
+            started = time.perf_counter()
+            # Taken before copying, so only changes committed before the copy began count as copied
+            copy_started = time.time_ns()
+            copy_database(source, settings.REPLICA_DATABASE_PATH)
+            record_replica_copy(copy_started)
+            if options['verbosity'] > 1:
+                self.stdout.write(f'Copied the database to the replica in {time.perf_counter() - started:.2f}s.')
+            if options['once']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
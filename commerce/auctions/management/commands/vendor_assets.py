@@ -0,0 +1,31 @@
+from django.apps import apps
+from django.core.management.base import BaseCommand, CommandError
+import os
+from auctions.assets import VENDOR_ASSETS, VendorError, fetch_vendor_asset
+
+
+# Download the third-party static files in VENDOR_ASSETS into auctions/static
+# Each file is checked against its Subresource Integrity hash before it is written.  The files are committed, so
+# run it after adding or upgrading an asset in VENDOR_ASSETS (with --force to replace files already vendored).
+
+class Command(BaseCommand):
+    help = 'Download and verify the vendored static files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Download files that are already vendored')
+
+    def handle(self, *args, **options):
+        static_dir = os.path.join(apps.get_app_config('auctions').path, 'static')
+        for name, asset in VENDOR_ASSETS.items():
+            path = os.path.join(static_dir, *asset.path.split('/'))
+            if os.path.exists(path) and not options['force']:
+                self.stdout.write(f'{name}: {asset.path} is already vendored.')
+                continue
+            try:
+                data = fetch_vendor_asset(asset)
+            except (OSError, VendorError) as error:
+                raise CommandError(f'Could not vendor {name}: {error}')
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as file:
+                file.write(data)
+            self.stdout.write(f'{name}: wrote {len(data)} bytes to {asset.path}.')
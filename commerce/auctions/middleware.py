@@ -0,0 +1,186 @@
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils import timezone
+import logging
+import random
+import time
+from .assets import serve_static_asset
+from .instrumentation import RequestTimings, current_timings
+from .replicas import is_sticky, read_database, stick_to_primary
+from .timezones import TIMEZONE_SESSION_KEY, display_timezone
+
+logger = logging.getLogger('auctions.performance')
+
+
+# Record the query count, database time, template render time and total time for a sample of requests
+# The numbers are returned in a Server-Timing header (visible in the browser's dev tools) and logged,
+# tagged with the URL name.  Set PERFORMANCE_SAMPLE_RATE to a fraction between 0 and 1 to control the overhead.
+# Works in both sync and async middleware chains, so async views under ASGI aren't pushed back onto a thread.
+
+class PerformanceMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= settings.PERFORMANCE_SAMPLE_RATE:
+            return self.get_response(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    async def __acall__(self, request):
+        if random.random() >= settings.PERFORMANCE_SAMPLE_RATE:
+            return await self.get_response(request)
+
+        timings = RequestTimings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        return self.report(request, response, timings, time.perf_counter() - started)
+
+    def report(self, request, response, timings, total_time):
+        response['Server-Timing'] = ', '.join([
+            f'db;dur={timings.db_time * 1000:.1f};desc="{timings.query_count} queries"',
+            f'tpl;dur={timings.template_time * 1000:.1f};desc="Template rendering"',
+            f'view;dur={total_time * 1000:.1f};desc="Total"',
+        ])
+
+        match = request.resolver_match
+        stats = {
+            'url_name': match.url_name if match else None,
+            'method': request.method,
+            'path': request.path,
+            'status': response.status_code,
+            'queries': timings.query_count,
+            'db_ms': round(timings.db_time * 1000, 1),
+            'template_ms': round(timings.template_time * 1000, 1),
+            'total_ms': round(total_time * 1000, 1),
+        }
+        logger.info(' '.join(f'{key}={value}' for key, value in stats.items()), extra={'performance': stats})
+        return response
+
+
+# Activate the user's display timezone for the request, or the site default for anonymous users
+# The zone is read from the session (see signals.store_timezone), so activating it doesn't load the user.
+# Users who logged in before their zone was kept in the session have it copied there on their next request.
+
+class TimezoneMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        name = request.session.get(TIMEZONE_SESSION_KEY)
+        if name is None and request.user.is_authenticated:
+            name = display_timezone(request.user.timezone)
+            request.session[TIMEZONE_SESSION_KEY] = name
+        timezone.activate(display_timezone(name))
+        try:
+            return self.get_response(request)
+        finally:
+            timezone.deactivate()
+
+    async def __acall__(self, request):
+        name = await request.session.aget(TIMEZONE_SESSION_KEY)
+        if name is None:
+            user = await request.auser()
+            if user.is_authenticated:
+                name = display_timezone(user.timezone)
+                await request.session.aset(TIMEZONE_SESSION_KEY, name)
+        timezone.activate(display_timezone(name))
+        try:
+            return await self.get_response(request)
+        finally:
+            timezone.deactivate()
+
+
+# Serve the files collected into STATIC_ROOT, before the rest of the middleware loads the session or the user
+# Should come first in MIDDLEWARE.  In production the web server can serve STATIC_ROOT itself instead;
+# runserver serves the app's static directories as usual.
+
+class StaticAssetsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def static_response(self, request):
+        if (settings.STATIC_ROOT and request.method in ('GET', 'HEAD')
+                and request.path.startswith(settings.STATIC_URL)):
+            return serve_static_asset(request, request.path[len(settings.STATIC_URL):])
+        return None
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.static_response(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.static_response(request) or await self.get_response(request)
+
+
+# Send the reads of GET and HEAD requests to the read replica, if there is one (see auctions/replicas.py)
+# Other requests, and every request for a few seconds after one that wrote, stay on default.
+# Should come before SessionMiddleware, so the session and the user are read from the replica too.
+
+class ReplicaMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def replica_for(self, request):
+        if request.method in ('GET', 'HEAD') and not is_sticky(request):
+            return settings.READ_REPLICA_DATABASE
+        return None
+
+    def finish(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS', 'TRACE'):
+            stick_to_primary(response)
+        return response
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = read_database.set(self.replica_for(request))
+        try:
+            response = self.get_response(request)
+        finally:
+            read_database.reset(token)
+        return self.finish(request, response)
+
+    async def __acall__(self, request):
+        token = read_database.set(self.replica_for(request))
+        try:
+            response = await self.get_response(request)
+        finally:
+            read_database.reset(token)
+        return self.finish(request, response)
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-17 11:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0034_alter_comment_body'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='high_bid',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=9, null=True),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='high_bidder',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='leading_listings', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='num_bids',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
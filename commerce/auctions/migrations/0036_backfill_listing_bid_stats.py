@@ -0,0 +1,34 @@
+from django.db import migrations
+from django.db.models import Count, Max
+
+
+# Fill in the stored bid stats for listings created before those columns existed
+def backfill_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Bid = apps.get_model('auctions', 'Bid')
+
+    stats = Bid.objects.values('listing_id').annotate(
+        high_bid=Max('amount'), num_bids=Count('id')).order_by()
+    for row in stats:
+        # The earliest bid at the high amount is the leading bid
+        high_bidder_id = Bid.objects.filter(
+            listing_id=row['listing_id'], amount=row['high_bid']).order_by(
+            'timestamp').values_list('bidder_id', flat=True).first()
+        Listing.objects.filter(pk=row['listing_id']).update(
+            high_bid=row['high_bid'], num_bids=row['num_bids'], high_bidder_id=high_bidder_id)
+
+
+def clear_bid_stats(apps, schema_editor):
+    Listing = apps.get_model('auctions', 'Listing')
+    Listing.objects.update(high_bid=None, num_bids=0, high_bidder=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0035_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_bid_stats, clear_bid_stats),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+# Create the FTS5 search index for listings (SQLite only)
+# See auctions/search.py for the index definition and the triggers that keep it in sync
+
+def install(apps, schema_editor):
+    from auctions.search import install_search_index, rebuild_search_index
+    install_search_index(schema_editor.connection)
+    rebuild_search_index(schema_editor.connection)
+
+
+def uninstall(apps, schema_editor):
+    from auctions.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0036_backfill_listing_bid_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(install, uninstall),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:08
+
+import auctions.timezones
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0039_listing_end_time'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='timezone',
+            field=models.CharField(choices=auctions.timezones.timezone_choices, default='America/New_York', max_length=32),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-17 12:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auctions', '0040_user_timezone_choices'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail',
+            field=models.CharField(blank=True, editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='listing',
+            name='thumbnail_source',
+            field=models.URLField(blank=True, editable=False, null=True),
+        ),
+    ]
@@ -1,17 +1,19 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
-from django.db.models import Max
+from django.db.models import Max, Count, F, Q, Value, DecimalField, ExpressionWrapper, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 from django.conf import settings
 from django.core.validators import MinValueValidator
+from django.urls import reverse
+from django.utils import timezone
 import decimal
-import pytz
+from .timezones import timezone_choices
 
 
 class User(AbstractUser):
     # The spec did not call for local time zones, but users would expect it, and it was a fun problem to explore
-    # Timezones list approach from:  https://stackoverflow.com/a/45867250
-    timezones = tuple(zip(pytz.all_timezones, pytz.all_timezones))
-    timezone = models.CharField(max_length=32, choices=timezones,
+    # The choices are built once, from the timezone database (see timezones.py)
+    timezone = models.CharField(max_length=32, choices=timezone_choices,
                                 default=settings.DEFAULT_TIMEZONE)
 
     def __str__(self):
@@ -28,6 +30,23 @@ class Category(models.Model):
         verbose_name_plural = 'Categories'
 
 
+class ListingQuerySet(models.QuerySet):
+    # Listings that are still open for bids
+    # Listings past their end time are left out even before close_expired_auctions gets to them
+    def active(self):
+        return self.filter(Q(end_time__isnull=True) | Q(end_time__gt=timezone.now()), is_active=True)
+
+    # Fetch everything a listing card needs in a single query:  the related owner and category,
+    # plus the minimum required bid computed from the stored bid stats
+    def with_card_data(self):
+        increment = Value(decimal.Decimal(str(settings.BID_INCREMENT)))
+        price_field = DecimalField(max_digits=9, decimal_places=2)
+        return self.select_related('owner', 'category').annotate(
+            card_required_bid=Coalesce(
+                ExpressionWrapper(F('high_bid') + increment, output_field=price_field),
+                F('starting_price'), output_field=price_field))
+
+
 class Listing(models.Model):
     owner = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='listings')
@@ -42,11 +61,39 @@ class Listing(models.Model):
     is_active = models.BooleanField(default=True)
     image_url = models.URLField(
         null=True, blank=True, verbose_name='Image URL')
+    # The stored thumbnail of the image (see thumbnails.py), and the image URL it was made from
+    # The thumbnail is '' if the image couldn't be fetched or read
+    thumbnail = models.CharField(max_length=100, blank=True, editable=False)
+    thumbnail_source = models.URLField(null=True, blank=True, editable=False)
     timestamp = models.DateTimeField(auto_now_add=True)
+    # When the auction closes by itself; without one it runs until the owner closes it
+    end_time = models.DateTimeField(null=True, blank=True)
+    # Bid stats are stored on the listing so the index pages don't need an aggregate query per card
+    # They are kept up to date by bidding.place_bid() and refresh_bid_stats()
+    high_bid = models.DecimalField(
+        max_digits=9, decimal_places=2, null=True, blank=True, editable=False)
+    num_bids = models.PositiveIntegerField(default=0, editable=False)
+    high_bidder = models.ForeignKey(
+        User, on_delete=models.SET_NULL, related_name='leading_listings', null=True, blank=True, editable=False)
+
+    objects = ListingQuerySet.as_manager()
 
     # Sort most recent listings first by default
+    # The indexes match the listing pages:  active or closed listings newest first (keyset paginated on timestamp, id),
+    # and active listings in one category.  They are partial indexes on backends that support them.
+    # The end time index lets close_expired_auctions find the expired listings without scanning the active ones.
     class Meta:
         ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['-timestamp', '-id'], condition=models.Q(is_active=True),
+                         name='listing_active_recent_idx'),
+            models.Index(fields=['-timestamp', '-id'], condition=models.Q(is_active=False),
+                         name='listing_closed_recent_idx'),
+            models.Index(fields=['category', '-timestamp', '-id'], condition=models.Q(is_active=True),
+                         name='listing_category_active_idx'),
+            models.Index(fields=['end_time'], condition=models.Q(is_active=True, end_time__isnull=False),
+                         name='listing_active_end_idx'),
+        ]
 
     def __str__(self):
         return f'{self.owner.username}\'s {self.title}'
@@ -55,67 +102,116 @@ class Listing(models.Model):
     # CITATION:  Learned the @property decorator approach from:  https://stackoverflow.com/a/17682694
     @property
     def bid_count(self):
-        return self.bids.count()
+        return self.num_bids
 
     # Highest existing bid for this listing
     @property
     def max_bid(self):
-        try:
-            bid = self.bids.aggregate(Max('amount'))
-            return round(bid['amount__max'], 2)
-        except Exception:
+        if self.high_bid is None:
             return None
+        return round(self.high_bid, 2)
 
     # The minimum valid bid for this item
     @property
     def required_bid(self):
-        if self.max_bid is None:
+        # Prefer the value annotated by ListingQuerySet.with_card_data(), if present
+        annotated = getattr(self, 'card_required_bid', None)
+        if annotated is not None:
+            return round(annotated, 2)
+        max_bid = self.max_bid
+        if max_bid is None:
             return self.starting_price
         else:
-            return round(self.max_bid + decimal.Decimal(settings.BID_INCREMENT), 2)
+            return round(max_bid + decimal.Decimal(settings.BID_INCREMENT), 2)
+
+    # Whether the auction is still taking bids:  not closed, and not past its end time
+    @property
+    def is_open(self):
+        return self.is_active and (self.end_time is None or self.end_time > timezone.now())
 
     # The winner of this auction, if any
     @property
     def winner(self):
-        if self.bid_count > 0:
-            try:
-                # From this listing's bid objects, find the one w/ the max bid amount and return its user
-                return self.bids.filter(amount=self.max_bid)[0].bidder
-            except Exception:
-                return 'Error determining winner'
+        if self.num_bids > 0:
+            return self.high_bidder
         else:
             return None
 
-    # If the user did not supply an image, use the placeholder
+    # Recalculate the stored bid stats from the bids table, in a single query
+    # Used when bids may have been changed outside place_bid(), e.g. in the admin interface, and to lock in the
+    # final stats when a listing is closed.  Pass save=False to save them along with other changes.
+    def refresh_bid_stats(self, save=True):
+        stats = Listing.objects.filter(pk=self.pk).values(
+            **{f'current_{name}': expression for name, expression in bid_stats().items()}).get()
+        self.high_bid = stats['current_high_bid']
+        self.num_bids = stats['current_num_bids']
+        # Changing the id also drops a previously loaded high_bidder
+        self.high_bidder_id = stats['current_high_bidder']
+        if save:
+            self.save(update_fields=['high_bid', 'num_bids', 'high_bidder'])
+
+    # The thumbnail of the listing's image, or the placeholder if there's no image or its thumbnail isn't ready
     # NOTE:  Needed because relative paths fail URL field validation when listing is updated in the admin interface
     @property
     def image_display(self):
-        if self.image_url is None:
-            return settings.PLACEHOLDER_IMAGE
+        if self.image_url and self.thumbnail and self.thumbnail_source == self.image_url:
+            return reverse('thumbnail', args=[self.thumbnail])
         else:
-            return self.image_url
+            return settings.PLACEHOLDER_IMAGE
+
+    # The full-size image for the listing page, or the placeholder if the user did not supply one
+    @property
+    def image_full(self):
+        return self.image_url or settings.PLACEHOLDER_IMAGE
+
+
+# Expressions for a listing's bid stats, computed from the bids table
+# Used with values() or update() on a listing queryset.  The earliest of the highest bids wins.
+
+def bid_stats():
+    bids = Bid.objects.filter(listing=OuterRef('pk')).order_by().values('listing')
+    return {
+        'high_bid': Subquery(bids.annotate(high=Max('amount')).values('high')),
+        'num_bids': Coalesce(Subquery(bids.annotate(count=Count('id')).values('count')), 0),
+        'high_bidder': Subquery(
+            Bid.objects.filter(listing=OuterRef('pk')).order_by('-amount', 'timestamp').values('bidder')[:1]),
+    }
 
 
 class Bid(models.Model):
+    # Indexed by bid_listing_amount_idx below, so the foreign key doesn't need its own index
     listing = models.ForeignKey(
-        Listing, on_delete=models.CASCADE, related_name='bids')
+        Listing, on_delete=models.CASCADE, related_name='bids', db_index=False)
     bidder = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='bids')
     timestamp = models.DateTimeField(auto_now_add=True)
     amount = models.DecimalField(
         max_digits=9, decimal_places=2, verbose_name='Your bid')
 
+    # Finds a listing's highest bid without scanning its other bids
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing', '-amount'], name='bid_listing_amount_idx'),
+        ]
+
     def __str__(self):
         return f'{self.bidder.username} for {self.listing.title}: ${self.amount}'
 
 
 class Comment(models.Model):
+    # Indexed by comment_listing_time_idx below, so the foreign key doesn't need its own index
     listing = models.ForeignKey(
-        Listing, on_delete=models.CASCADE, related_name='comments')
+        Listing, on_delete=models.CASCADE, related_name='comments', db_index=False)
     commenter = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='comments')
     body = models.TextField(max_length=500, blank=False, null=False)
     timestamp = models.DateTimeField(auto_now_add=True)
 
+    # A listing's comments, oldest first
+    class Meta:
+        indexes = [
+            models.Index(fields=['listing', 'timestamp', 'id'], name='comment_listing_time_idx'),
+        ]
+
     def __str__(self):
         return f'{self.timestamp.strftime("%x %X")} - {self.commenter.username} on {self.listing.title}'
@@ -0,0 +1,72 @@
+from django.db.models import Q
+from django.http.response import Http404
+from django.utils.dateparse import parse_datetime
+import base64
+import binascii
+
+
+# Keyset (cursor) pagination on (timestamp, id)
+# Each page seeks past the last row of the previous page instead of using OFFSET,
+# so a deep page costs the same as the first one.
+
+def encode_cursor(obj):
+    raw = f'{obj.timestamp.isoformat()}|{obj.id}'
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    try:
+        # Restore the padding stripped by encode_cursor
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode()
+        timestamp, obj_id = raw.rsplit('|', 1)
+        timestamp = parse_datetime(timestamp)
+        obj_id = int(obj_id)
+    except (ValueError, binascii.Error, UnicodeDecodeError):
+        raise Http404('Invalid page')
+    if timestamp is None:
+        raise Http404('Invalid page')
+    return timestamp, obj_id
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, per_page, descending=True):
+        self.per_page = per_page
+        self.descending = descending
+        if descending:
+            self.queryset = queryset.order_by('-timestamp', '-id')
+        else:
+            self.queryset = queryset.order_by('timestamp', 'id')
+
+    # Only the rows after the cursor, in the paginator's sort order
+    def after(self, cursor):
+        if not cursor:
+            return self.queryset
+        timestamp, obj_id = decode_cursor(cursor)
+        if self.descending:
+            return self.queryset.filter(
+                Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=obj_id))
+        return self.queryset.filter(
+            Q(timestamp__gt=timestamp) | Q(timestamp=timestamp, id__gt=obj_id))
+
+    def page(self, cursor=None):
+        # Fetch one extra row to find out whether there is a next page
+        return self.make_page(list(self.after(cursor)[:self.per_page + 1]))
+
+    async def apage(self, cursor=None):
+        return self.make_page([row async for row in self.after(cursor)[:self.per_page + 1]])
+
+    def make_page(self, rows):
+        if len(rows) > self.per_page:
+            rows = rows[:self.per_page]
+            return KeysetPage(rows, encode_cursor(rows[-1]))
+        return KeysetPage(rows, None)
@@ -0,0 +1,20 @@
+from django.conf import settings
+
+
+# SQLITE TUNING
+# SQLite's defaults suit a single process writing now and then.  The web server has many threads writing bids,
+# comments and sessions at once, so every new connection is tuned with the PRAGMA settings in SQLITE_PRAGMAS.
+# journal_mode is stored in the database file itself; the others only last as long as the connection,
+# which is why they are applied every time one is opened (see AuctionsConfig.ready).
+
+# The values in SQLITE_PRAGMAS are simple names and numbers written straight into the statement
+def pragma_statements(pragmas):
+    return [f'PRAGMA {name} = {value}' for name, value in pragmas.items()]
+
+
+# Runs on the underlying database connection, so the statements aren't counted as the request's queries
+def apply_sqlite_pragmas(sender, connection, **kwargs):
+    if connection.vendor != 'sqlite':
+        return
+    for statement in pragma_statements(settings.SQLITE_PRAGMAS):
+        connection.connection.execute(statement)
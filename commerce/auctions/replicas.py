@@ -0,0 +1,116 @@
+from asgiref.sync import iscoroutinefunction
+from contextvars import ContextVar
+from django.conf import settings
+from django.core.cache import cache
+import functools
+import math
+import sqlite3
+
+
+# READ REPLICA
+# When READ_REPLICA_DATABASE names a database alias, the reads of GET and HEAD requests go to that database,
+# so browsing doesn't compete with bidding for the main database.  Writes always go to default.
+# A user who has just written something reads from default for the next READ_REPLICA_STICKY_SECONDS, so they
+# see their own bid or comment even if the replica hasn't caught up yet.
+# ReplicaMiddleware picks the database for each request; views that write on a GET use @use_primary_database.
+
+# Marks a browser whose user wrote something recently
+STICKY_COOKIE = 'recent_write'
+
+# The database alias reads go to for the current request, or None for default
+read_database = ContextVar('read_database', default=None)
+
+# When the latest copy of default made by sync_replica started
+REPLICA_COPIED_KEY = 'replica_copied_at'
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        return read_database.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    # The replica is a copy of default, so objects read from either may be related to each other
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    # The replica gets its tables by being copied from default, not from migrations
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
+
+
+def is_sticky(request):
+    return STICKY_COOKIE in request.COOKIES
+
+
+# Keep the user's reads on default for the next few seconds, after a request that wrote
+def stick_to_primary(response):
+    if settings.READ_REPLICA_DATABASE:
+        response.set_cookie(STICKY_COOKIE, '1', max_age=settings.READ_REPLICA_STICKY_SECONDS,
+                            httponly=True, samesite='Lax')
+    return response
+
+
+# Run a view's queries against default, and keep the user there for a few seconds afterwards
+# For views that write on a GET request, so they never act on a stale copy of what they change.
+
+def use_primary_database(view):
+    if iscoroutinefunction(view):
+        @functools.wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            token = read_database.set(None)
+            try:
+                return stick_to_primary(await view(request, *args, **kwargs))
+            finally:
+                read_database.reset(token)
+        return async_wrapper
+
+    @functools.wraps(view)
+    def wrapper(request, *args, **kwargs):
+        token = read_database.set(None)
+        try:
+            return stick_to_primary(view(request, *args, **kwargs))
+        finally:
+            read_database.reset(token)
+    return wrapper
+
+
+# Copy one SQLite database over another with SQLite's online backup API
+# The source can be in use while it's copied, and readers of the target see either the old copy or the new one.
+
+def copy_database(source_path, target_path, pages_per_step=1024):
+    source = sqlite3.connect(source_path)
+    try:
+        target = sqlite3.connect(target_path)
+        try:
+            source.backup(target, pages=pages_per_step)
+        finally:
+            target.close()
+    finally:
+        source.close()
+
+
+# THE REPLICA AND THE CACHE
+# Cached listing cards and ETags are keyed by version numbers, which are the time of the change that made them
+# (see card_cache.py), and are only bumped once the change is committed.  So a copy of the database started after a
+# version was made includes that version's change.  Pages read from the replica only cache cards, or send ETags, for
+# versions older than the latest copy; anything newer would be cached from data the replica may not have yet.
+
+def record_replica_copy(started):
+    cache.set(REPLICA_COPIED_KEY, started, None)
+
+
+# Versions older than this are in the database the current request reads from
+# Everything is in default, and nothing is known to be in a replica that hasn't been copied yet
+
+def replica_cutoff():
+    if read_database.get() is None:
+        return math.inf
+    return cache.get(REPLICA_COPIED_KEY, -math.inf)
+
+
+async def areplica_cutoff():
+    if read_database.get() is None:
+        return math.inf
+    return await cache.aget(REPLICA_COPIED_KEY, -math.inf)
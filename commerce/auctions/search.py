@@ -0,0 +1,140 @@
+from django.db import connection, connections, router
+from django.db.models import Q
+from django.utils import timezone
+import re
+from .models import Listing
+
+
+# LISTING SEARCH
+# On SQLite, listings are indexed in an FTS5 virtual table that mirrors the title and description columns.
+# Triggers keep the index in sync with every insert, update and delete, including bulk inserts and raw SQL.
+# Other database backends fall back to a simple icontains scan.
+
+FTS_TABLE = 'auctions_listing_fts'
+
+# Matches in the title count for more than matches in the description
+TITLE_WEIGHT = 10.0
+DESCRIPTION_WEIGHT = 1.0
+
+INSTALL_SQL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        title, description, content='auctions_listing', content_rowid='id', tokenize='porter unicode61')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_insert AFTER INSERT ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_delete AFTER DELETE ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END""",
+    # Only re-index when the text changes, not on every bid or status update
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_update AFTER UPDATE OF title, description ON auctions_listing BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, title, description) VALUES (new.id, new.title, new.description);
+    END""",
+]
+
+UNINSTALL_SQL = [
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_insert',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_delete',
+    f'DROP TRIGGER IF EXISTS {FTS_TABLE}_update',
+    f'DROP TABLE IF EXISTS {FTS_TABLE}',
+]
+
+
+def fts_available(using=connection):
+    return using.vendor == 'sqlite'
+
+
+# Create the search index and its triggers if they don't exist yet
+# Safe to run repeatedly.  It runs after every migrate, because SQLite drops the triggers
+# whenever a migration has to rebuild the listing table.
+
+def install_search_index(using=connection):
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in INSTALL_SQL:
+            cursor.execute(sql)
+
+
+def uninstall_search_index(using=connection):
+    if not fts_available(using):
+        return
+    with using.cursor() as cursor:
+        for sql in UNINSTALL_SQL:
+            cursor.execute(sql)
+
+
+# Re-index every listing from scratch
+
+def rebuild_search_index(using=connection):
+    install_search_index(using)
+    with using.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('optimize')")
+
+
+# Turn the user's text into an FTS5 query:  every word must match, and the last word may be a prefix
+# Quoting each word means punctuation and FTS operators typed by the user can't cause syntax errors
+
+def fts_query(text):
+    words = re.findall(r'\w+', text)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+# Find listings matching the query text, best matches first
+# category_id 0 means uncategorized, as in the category_listing view
+
+def search_listings(text, active_only=True, category_id=None, limit=50):
+    # The raw query has to go to the same database as the ORM's reads, which may be the read replica
+    using = connections[router.db_for_read(Listing)]
+    if not fts_available(using):
+        listings = Listing.objects.with_card_data()
+        if active_only:
+            listings = listings.active()
+        if category_id == 0:
+            listings = listings.filter(category=None)
+        elif category_id is not None:
+            listings = listings.filter(category=category_id)
+        return list(icontains_search(listings, text)[:limit])
+
+    match = fts_query(text)
+    if match is None:
+        return []
+    # Join the full-text matches to the listings, so SQLite walks the (usually short) match list
+    # and looks each listing up by primary key, rather than probing the index once per listing
+    filters = []
+    params = [match]
+    if active_only:
+        filters.append('AND auctions_listing.is_active '
+                       'AND (auctions_listing.end_time IS NULL OR auctions_listing.end_time > %s)')
+        params.append(using.ops.adapt_datetimefield_value(timezone.now()))
+    if category_id == 0:
+        filters.append('AND auctions_listing.category_id IS NULL')
+    elif category_id is not None:
+        filters.append('AND auctions_listing.category_id = %s')
+        params.append(category_id)
+    with using.cursor() as cursor:
+        cursor.execute(
+            f'SELECT auctions_listing.id FROM {FTS_TABLE} '
+            f'JOIN auctions_listing ON auctions_listing.id = {FTS_TABLE}.rowid '
+            f'WHERE {FTS_TABLE} MATCH %s {" ".join(filters)} '
+            f'ORDER BY bm25({FTS_TABLE}, %s, %s) LIMIT %s',
+            [*params, TITLE_WEIGHT, DESCRIPTION_WEIGHT, limit])
+        ids = [row[0] for row in cursor.fetchall()]
+    found = Listing.objects.with_card_data().in_bulk(ids)
+    return [found[listing_id] for listing_id in ids if listing_id in found]
+
+
+# The naive search:  a case-insensitive substring scan of every listing
+# Used where FTS5 isn't available, and as the baseline in the search benchmark
+
+def icontains_search(listings, text):
+    for word in re.findall(r'\w+', text):
+        listings = listings.filter(Q(title__icontains=word) | Q(description__icontains=word))
+    return listings.order_by('-timestamp')
@@ -0,0 +1,160 @@
+from contextlib import contextmanager
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.utils import timezone
+import datetime
+import decimal
+import itertools
+import random
+from .models import User, Category, Listing, Bid, Comment
+
+
+# SYNTHETIC DATA
+# Generates production-like data for load testing and benchmarks.
+# Rows are inserted in large batches inside a transaction, and a seeded random generator makes the output repeatable.
+
+SEED_PASSWORD = 'password'
+
+DESCRIPTIONS = [
+    'Gently used, works perfectly.',
+    'Brand new in the original box.',
+    'A family heirloom in excellent condition. Some light wear on the corners.',
+    'Vintage piece, sold as-is. Please check the photos and ask questions before bidding.',
+    'Hand made by a local artisan.',
+]
+
+COMMENTS = [
+    'Is this still available?',
+    'Do you ship internationally?',
+    'Great item!',
+    'Can you post more photos?',
+    'What are the dimensions?',
+]
+
+
+# auto_now_add would overwrite the listing timestamps we generate, so switch it off while inserting
+
+@contextmanager
+def explicit_timestamps(*models):
+    fields = [model._meta.get_field('timestamp') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+# Insert rows of already-adapted values with executemany
+# Used for the biggest tables, where building a model instance per row would dominate the run time
+
+def insert_rows(model, field_names, rows, batch_size):
+    table = connection.ops.quote_name(model._meta.db_table)
+    columns = ', '.join(connection.ops.quote_name(model._meta.get_field(name).column) for name in field_names)
+    placeholders = ', '.join(['%s'] * len(field_names))
+    sql = f'INSERT INTO {table} ({columns}) VALUES ({placeholders})'
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+# Zipf-like popularity:  the listing at rank r gets weight 1 / r^skew, so a few hot listings get most of the bids
+
+def popularity_weights(count, skew):
+    return list(itertools.accumulate(1 / (rank ** skew) for rank in range(1, count + 1)))
+
+
+# Create users, categories, listings, bids, comments and watchlist entries
+# Users are named <prefix>0, <prefix>1, ... and share SEED_PASSWORD; existing users and categories are reused.
+# Returns the number of rows created for each model.
+
+def seed_auctions(users=100, categories=10, listings=1000, bids=10000, comments=5000, watchlist=2000,
+                  closed_fraction=0.2, skew=1.1, seed=None, batch_size=5000, user_prefix='user'):
+    rng = random.Random(seed)
+    now = timezone.now()
+
+    # Hash the password once; hashing it for every user would dominate the run time
+    password = make_password(SEED_PASSWORD)
+    usernames = [f'{user_prefix}{n}' for n in range(users)]
+    with transaction.atomic():
+        User.objects.bulk_create(
+            (User(username=username, password=password) for username in usernames),
+            batch_size=batch_size, ignore_conflicts=True)
+        Category.objects.bulk_create(
+            (Category(name=f'Category {n}') for n in range(categories)), ignore_conflicts=True)
+    user_ids = list(User.objects.filter(username__in=usernames).order_by('id').values_list('id', flat=True))
+    category_ids = list(Category.objects.values_list('id', flat=True)) + [None]
+
+    # Plan the listings first, so their stored bid stats can be filled in before they are inserted
+    # Listings are spread over the last year, oldest first
+    span = datetime.timedelta(days=365)
+    planned = []
+    owners = []
+    for n in range(listings):
+        owners.append(rng.randrange(len(user_ids)))
+        planned.append(Listing(
+            owner_id=user_ids[owners[-1]],
+            category_id=rng.choice(category_ids),
+            title=f'Listing {n}',
+            description=rng.choice(DESCRIPTIONS),
+            starting_price=decimal.Decimal(rng.randint(100, 50000)) / 100,
+            is_active=rng.random() >= closed_fraction,
+            timestamp=now - span + span * n / max(listings, 1),
+        ))
+
+    # Hot listings are spread randomly over the catalogue rather than being the oldest ones
+    ranked = list(range(listings))
+    rng.shuffle(ranked)
+    weights = popularity_weights(listings, skew) if listings else []
+    planned_bids = []
+    # Owners can't bid on their own listings, so with a single user there is nobody to bid
+    for index in rng.choices(ranked, cum_weights=weights, k=bids) if listings and len(user_ids) > 1 else []:
+        listing = planned[index]
+        # Pick from every user but the owner
+        bidder = rng.randrange(len(user_ids) - 1)
+        if bidder >= owners[index]:
+            bidder += 1
+        bidder_id = user_ids[bidder]
+        current = listing.high_bid if listing.high_bid is not None else listing.starting_price
+        listing.high_bid = current + decimal.Decimal(rng.randint(1, 500)) / 100
+        listing.num_bids += 1
+        listing.high_bidder_id = bidder_id
+        # Bids come a minute apart, but never later than now
+        planned_bids.append((index, bidder_id, listing.high_bid,
+                             min(listing.timestamp + datetime.timedelta(minutes=listing.num_bids), now)))
+
+    adapt_amount = connection.ops.adapt_decimalfield_value
+    adapt_timestamp = connection.ops.adapt_datetimefield_value
+    with explicit_timestamps(Listing), transaction.atomic():
+        last_id = Listing.objects.order_by('-id').values_list('id', flat=True).first() or 0
+        Listing.objects.bulk_create(planned, batch_size=batch_size)
+        # Listings are inserted in order, so their ids line up with the plan
+        listing_ids = list(Listing.objects.filter(pk__gt=last_id).order_by('id').values_list('id', flat=True))
+
+        insert_rows(Bid, ['listing', 'bidder', 'amount', 'timestamp'], [
+            (listing_ids[index], bidder_id, adapt_amount(amount, 9, 2), adapt_timestamp(timestamp))
+            for index, bidder_id, amount, timestamp in planned_bids], batch_size)
+
+        # Comments follow the same popularity curve as bids
+        commented = rng.choices(ranked, cum_weights=weights, k=comments) if listings else []
+        insert_rows(Comment, ['listing', 'commenter', 'body', 'timestamp'], [
+            (listing_ids[index], rng.choice(user_ids), rng.choice(COMMENTS),
+             adapt_timestamp(min(planned[index].timestamp + datetime.timedelta(seconds=rng.randint(1, 86400)), now)))
+            for index in commented], batch_size)
+
+        # Users watch popular listings too; duplicates are ignored
+        Watch = Listing.watchlist_items.through
+        watched = rng.choices(ranked, cum_weights=weights, k=watchlist) if listings else []
+        Watch.objects.bulk_create(
+            (Watch(listing_id=listing_ids[index], user_id=rng.choice(user_ids)) for index in watched),
+            batch_size=batch_size, ignore_conflicts=True)
+
+    return {
+        'users': len(user_ids),
+        'categories': len(category_ids) - 1,
+        'listings': len(listing_ids),
+        'bids': len(planned_bids),
+        'comments': len(commented),
+        'watchlist': len(watched),
+    }
@@ -0,0 +1,42 @@
+from django.conf import settings
+from django.contrib.sessions.backends import cached_db
+import copy
+
+
+# LOW-WRITE SESSIONS
+# A cached_db session engine that writes the session row as rarely as it can.  Every write takes SQLite's
+# database-wide write lock, so a session save competes with the bids and comments other users are placing.
+# Select it with SESSION_ENGINE = 'auctions.sessions' (see SESSION_PROFILES in settings.py).
+
+class SessionStore(cached_db.SessionStore):
+    def __init__(self, session_key=None):
+        super().__init__(session_key)
+        # The session data as last read from or written to storage, to tell whether a save would change anything
+        # A deep copy, so values changed in place (e.g. a list appended to) still count as changes
+        self._stored = None
+
+    def load(self):
+        data = super().load()
+        self._stored = copy.deepcopy(data)
+        return data
+
+    # Skip the write when the data is the same as what's stored, even if the session was marked as modified
+    # Sessions are still saved on every request with SESSION_SAVE_EVERY_REQUEST, so their expiry keeps sliding.
+    def save(self, must_create=False):
+        if (not must_create and self.session_key is not None and not settings.SESSION_SAVE_EVERY_REQUEST
+                and self._stored is not None and self._session == self._stored):
+            return
+        super().save(must_create)
+        self._stored = copy.deepcopy(self._session)
+
+    # Django creates the new session row as soon as the key is cycled (on login), and then updates it when the
+    # response goes out.  Here the new key is only created by that final save, so logging in writes one row.
+    # NOTE:  session_key is None until the end of the request.
+    def cycle_key(self):
+        data = self._session
+        key = self.session_key
+        self._session_key = None
+        self._session_cache = data
+        self.modified = True
+        if key:
+            self.delete(key)
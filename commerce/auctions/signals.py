@@ -0,0 +1,78 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import connections, transaction
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+from .card_cache import bump_catalogue_version, bump_listing_version, bump_listing_versions
+from .categories import invalidate_category_counts
+from .models import Listing, Category, Bid, Comment
+from .search import install_search_index
+from .timezones import TIMEZONE_SESSION_KEY, display_timezone
+from .watchlist import invalidate_watchlists
+
+
+# Invalidate the cached listing card whenever the listing or anything shown about it changes
+# Every invalidation below waits for the change to be committed.  Until then other requests still read the old
+# rows, and would cache what they render from them under the new version, where it would stay.
+
+@receiver(post_save, sender=Listing)
+def listing_saved(sender, instance, **kwargs):
+    listing_id = instance.id
+    transaction.on_commit(lambda: bump_listing_version(listing_id))
+
+
+@receiver(post_save, sender=Bid)
+@receiver(post_save, sender=Comment)
+def listing_activity_saved(sender, instance, **kwargs):
+    listing_id = instance.listing_id
+    transaction.on_commit(lambda: bump_listing_version(listing_id))
+
+
+# Pages of listings also change when a listing is deleted, or a category is renamed or deleted
+
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def catalogue_changed(sender, **kwargs):
+    transaction.on_commit(bump_catalogue_version)
+
+
+# Drop the cached category counts whenever a listing is created, closed or deleted, or a category changes
+# Saving a listing for any other reason is rare enough that it isn't worth telling the cases apart
+
+@receiver(post_save, sender=Listing)
+@receiver(post_delete, sender=Listing)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def category_counts_changed(sender, **kwargs):
+    transaction.on_commit(invalidate_category_counts)
+
+
+# Drop the cached watchlist ids of every user whose watchlist changes, and bump the listings watched or unwatched
+# The watchlist can be changed from either side:  listing.watchlist_items.add(user) or user.watchlist_items.add(listing)
+
+@receiver(m2m_changed, sender=Listing.watchlist_items.through)
+def watchlist_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        user_ids = pk_set if not reverse else [instance.pk]
+        listing_ids = [instance.pk] if not reverse else pk_set
+    elif action == 'pre_clear':
+        user_ids = instance.watchlist_items.values_list('id', flat=True) if not reverse else [instance.pk]
+        listing_ids = [instance.pk] if not reverse else instance.watchlist_items.values_list('id', flat=True)
+    else:
+        return
+    user_ids, listing_ids = list(user_ids), list(listing_ids)
+    transaction.on_commit(lambda: invalidate_watchlists(user_ids))
+    transaction.on_commit(lambda: bump_listing_versions(listing_ids))
+
+
+# Make sure the search index triggers survive migrations that rebuild the listing table
+
+def ensure_search_index(sender, using, **kwargs):
+    install_search_index(connections[using])
+
+
+# Keep the user's display timezone in the session, so TimezoneMiddleware doesn't have to load the user
+
+@receiver(user_logged_in)
+def store_timezone(sender, request, user, **kwargs):
+    request.session[TIMEZONE_SESSION_KEY] = display_timezone(user.timezone)
@@ -0,0 +1,117 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+import asyncio
+import json
+import re
+from .live import get_broker, listing_channel
+from .models import Listing
+
+
+# SERVER-SENT EVENTS
+# A bare ASGI application that streams a listing's bids and closing to the browser.
+# It sits in front of Django in commerce/asgi.py rather than being a Django view, so an idle stream holds no
+# session, middleware or database connection, and costs only a queue and a suspended coroutine.
+# A view could stream the same events from an async iterator with StreamingHttpResponse, but every stream would
+# still go through the whole middleware stack and load the session and user on connect.
+
+EVENTS_PATH = re.compile(r'^/listing/(?P<listing_id>\d+)/events$')
+
+
+def events_url(listing_id):
+    return f'/listing/{listing_id}/events'
+
+
+# The stream a listing page should open, or '' for none:  when the listing is closed, or when this process isn't
+# serving the streams.  Under WSGI /listing/<id>/events is a 404, which the browser would keep retrying.
+
+def page_events_url(listing):
+    return events_url(listing.id) if settings.LIVE_UPDATES and listing.is_open else ''
+
+
+# The listing's current state, sent when a stream opens so the page catches up on anything it missed
+
+def listing_snapshot(listing_id):
+    close_old_connections()
+    try:
+        listing = Listing.objects.get(pk=listing_id)
+    except Listing.DoesNotExist:
+        return None
+    finally:
+        close_old_connections()
+    return {
+        'amount': f'{listing.max_bid:.2f}' if listing.max_bid is not None else None,
+        'required_bid': f'{listing.required_bid:.2f}',
+        'num_bids': listing.num_bids,
+        'is_active': listing.is_open,
+    }
+
+
+def format_event(event_type, data):
+    return f'event: {event_type}\ndata: {json.dumps(data)}\n\n'.encode()
+
+
+async def wait_for_disconnect(receive):
+    while (await receive())['type'] != 'http.disconnect':
+        pass
+
+
+async def listing_events(scope, receive, send, listing_id):
+    # Subscribe before taking the snapshot, so no bid can fall between the two
+    subscription = get_broker().subscribe(listing_channel(listing_id))
+    disconnect = asyncio.ensure_future(wait_for_disconnect(receive))
+    next_event = None
+    try:
+        snapshot = await sync_to_async(listing_snapshot)(listing_id)
+        if snapshot is None:
+            await send({'type': 'http.response.start', 'status': 404,
+                        'headers': [(b'content-type', b'text/plain; charset=utf-8')]})
+            await send({'type': 'http.response.body', 'body': b'Listing does not exist'})
+            return
+
+        await send({'type': 'http.response.start', 'status': 200, 'headers': [
+            (b'content-type', b'text/event-stream'),
+            (b'cache-control', b'no-cache'),
+            # Stop proxies such as nginx from buffering the stream
+            (b'x-accel-buffering', b'no'),
+        ]})
+        await send({'type': 'http.response.body', 'body': format_event('listing', snapshot), 'more_body': True})
+
+        # Closed listings have nothing more to report
+        while snapshot['is_active']:
+            if next_event is None:
+                next_event = asyncio.ensure_future(subscription.get())
+            done, _ = await asyncio.wait({next_event, disconnect}, timeout=settings.LIVE_UPDATES_KEEPALIVE,
+                                         return_when=asyncio.FIRST_COMPLETED)
+            if disconnect in done:
+                return
+            if next_event in done:
+                event = next_event.result()
+                next_event = None
+                await send({'type': 'http.response.body', 'body': format_event(event['type'], event['data']),
+                            'more_body': True})
+                if event['type'] == 'close':
+                    break
+            else:
+                # A comment line keeps idle connections from being dropped by proxies
+                await send({'type': 'http.response.body', 'body': b': keepalive\n\n', 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        subscription.close()
+        disconnect.cancel()
+        if next_event is not None:
+            next_event.cancel()
+
+
+# Serve the event streams, and pass every other request on to Django
+
+class LiveUpdatesRouter:
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            match = EVENTS_PATH.match(scope['path'])
+            if match:
+                return await listing_events(scope, receive, send, int(match['listing_id']))
+        return await self.application(scope, receive, send)
@@ -0,0 +1,43 @@
+// Fetch the next page of comments for the listing page, appending them below the ones already shown
+// Once every page has been loaded, the same button checks for comments posted since
+
+document.addEventListener('DOMContentLoaded', () => {
+    const button = document.querySelector('#comment-more');
+    const list = document.querySelector('#comment-list');
+    if (!button || !list) {
+        return;
+    }
+
+    button.addEventListener('click', () => {
+        const url = new URL(button.dataset.url, window.location.href);
+        if (button.dataset.cursor) {
+            url.searchParams.set('since', button.dataset.cursor);
+        }
+        button.disabled = true;
+        fetch(url, {headers: {'Accept': 'application/json'}})
+            .then(response => response.json())
+            .then(data => {
+                data.comments.forEach(comment => list.append(renderComment(comment)));
+                button.dataset.cursor = data.cursor;
+                button.textContent = data.more ? button.dataset.moreLabel : button.dataset.newLabel;
+            })
+            .finally(() => {
+                button.disabled = false;
+            });
+    });
+});
+
+
+// Build the same markup as the server-rendered comments
+// textContent keeps user-supplied text from being interpreted as HTML
+
+function renderComment(comment) {
+    const quote = document.createElement('blockquote');
+    const body = document.createElement('p');
+    body.className = 'comment-body';
+    body.textContent = comment.body;
+    const byline = document.createElement('p');
+    byline.textContent = `- ${comment.commenter}, ${comment.display_timestamp}`;
+    quote.append(body, byline);
+    return quote;
+}
@@ -0,0 +1,55 @@
+// Keep the listing page's price up to date from the listing's server-sent event stream
+// Elements marked with data-live="<field>" are updated in place.  When the layout itself has to change,
+// e.g. on the first bid or when the auction closes, the page is reloaded instead.
+
+document.addEventListener('DOMContentLoaded', () => {
+    const listing = document.querySelector('[data-events-url]');
+    if (!listing || !listing.dataset.eventsUrl || !window.EventSource) {
+        return;
+    }
+    const initialBids = document.querySelector('[data-live="num_bids"]');
+    let numBids = initialBids ? Number(initialBids.textContent) : null;
+    const events = new EventSource(listing.dataset.eventsUrl);
+
+    // Sent when the stream opens, and again after every reconnect
+    events.addEventListener('listing', event => {
+        const data = JSON.parse(event.data);
+        if (!data.is_active || !update(data)) {
+            reload();
+        }
+        numBids = data.num_bids;
+        setField('num_bids', numBids);
+    });
+
+    events.addEventListener('bid', event => {
+        if (!update(JSON.parse(event.data))) {
+            reload();
+        }
+        if (numBids !== null) {
+            setField('num_bids', ++numBids);
+        }
+    });
+
+    events.addEventListener('close', reload);
+
+    // Returns false if the page has nowhere to show the new price
+    function update(data) {
+        if (data.amount !== null && !document.querySelector('[data-live="amount"]')) {
+            return false;
+        }
+        setField('amount', data.amount);
+        setField('required_bid', data.required_bid);
+        return true;
+    }
+
+    function setField(name, value) {
+        document.querySelectorAll(`[data-live="${name}"]`).forEach(element => {
+            element.textContent = value;
+        });
+    }
+
+    function reload() {
+        events.close();
+        window.location.reload();
+    }
+});
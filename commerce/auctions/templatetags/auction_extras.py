@@ -0,0 +1,24 @@
+from django import template
+from django.templatetags.static import static
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+from ..assets import VENDOR_ASSETS
+from ..card_cache import render_listing_cards
+
+register = template.Library()
+
+
+# Render a page of listing cards from the card cache, marking the ones the user is watching
+# Usage:  {% listing_cards listings watched_ids %}
+
+@register.simple_tag
+def listing_cards(listings, watched_ids=frozenset()):
+    return mark_safe(''.join(render_listing_cards(listings, watched_ids)))
+
+
+# Link a vendored stylesheet from our own static files
+# Usage:  {% vendor_stylesheet 'bootstrap' %}
+
+@register.simple_tag
+def vendor_stylesheet(name):
+    return format_html('<link rel="stylesheet" href="{}">', static(VENDOR_ASSETS[name].path))
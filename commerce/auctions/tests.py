@@ -1,3 +1,1282 @@
-from django.test import TestCase
+from asgiref.sync import sync_to_async
+from asgiref.testing import ApplicationCommunicator
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.contrib.staticfiles import finders
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, router
+from django.db.models import F, Max
+from django.http import HttpResponse
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.urls import resolve, reverse
+from django.utils import timezone, translation
+from django.utils.functional import SimpleLazyObject
+import datetime
+import decimal
+import gzip
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+from .assets import VENDOR_ASSETS, VendorAsset, VendorError, brotli, fetch_vendor_asset, integrity, minify_css
+from .benchmarks import (contended_writes, hammer_listing, percentile, session_writes, sqlite_settings,
+                         start_wsgi_server)
+from .bidding import place_bid, BidOutcome
+from .card_cache import card_key, listing_versions, render_listing_cards
+from .categories import category_counts
+from .closing import close_expired_auctions
+from .live import get_broker, listing_channel
+from .loadtest import InProcessTransport, SocketTransport, missed_targets, run_load_test
+from .middleware import ReplicaMiddleware, TimezoneMiddleware
+from .models import User, Listing, Category, Bid, Comment
+from .pagination import KeysetPaginator, decode_cursor, encode_cursor
+from .replicas import STICKY_COOKIE, copy_database, read_database, record_replica_copy, use_primary_database
+from .search import search_listings
+from .sessions import SessionStore as LowWriteSessionStore
+from .seeding import seed_auctions
+from .sse import LiveUpdatesRouter, events_url
+from .thumbnails import Image, ThumbnailError, fetch_image, generate_thumbnails, is_allowed_address, thumbnail_path
+from .timezones import TIMEZONE_SESSION_KEY
+from .watchlist import watched_listing_ids, is_watching
+from .views import ListingForm
+from . import async_views, urls, views
 
-# Create your tests here.
+
+# BIDDING TESTS
+
+class PlaceBidTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        self.listing = Listing.objects.create(
+            owner=self.owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+
+    def test_outcomes(self):
+        self.assertEqual(place_bid(self.listing.id, self.bidder, decimal.Decimal('4.99')).outcome,
+                         BidOutcome.OUTBID)
+        self.assertEqual(place_bid(self.listing.id, self.bidder, decimal.Decimal('5.00')).outcome,
+                         BidOutcome.ACCEPTED)
+        result = place_bid(self.listing.id, self.bidder, decimal.Decimal('5.00'))
+        self.assertEqual(result.outcome, BidOutcome.OUTBID)
+        self.assertEqual(result.required_bid, decimal.Decimal('5.01'))
+        self.assertEqual(place_bid(self.listing.id, self.owner, decimal.Decimal('10.00')).outcome,
+                         BidOutcome.OWN_LISTING)
+        Listing.objects.filter(pk=self.listing.id).update(is_active=False)
+        self.assertEqual(place_bid(self.listing.id, self.bidder, decimal.Decimal('10.00')).outcome,
+                         BidOutcome.CLOSED)
+
+        self.listing.refresh_from_db()
+        self.assertEqual(self.listing.bid_count, 1)
+        self.assertEqual(self.listing.max_bid, decimal.Decimal('5.00'))
+        self.assertEqual(self.listing.winner, self.bidder)
+
+    def test_refresh_bid_stats(self):
+        # Bids written outside place_bid(), e.g. in the admin, leave the stored stats out of date
+        rival = User.objects.create_user('rival', password='password')
+        Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=decimal.Decimal('7.00'))
+        Bid.objects.create(listing=self.listing, bidder=rival, amount=decimal.Decimal('7.00'))
+        Bid.objects.create(listing=self.listing, bidder=rival, amount=decimal.Decimal('6.00'))
+        self.assertEqual(self.listing.bid_count, 0)
+        # One query for the stats and the winner, one to save them
+        with self.assertNumQueries(2):
+            self.listing.refresh_bid_stats()
+        self.assertEqual((self.listing.bid_count, self.listing.max_bid), (3, decimal.Decimal('7.00')))
+        self.assertEqual(self.listing.required_bid, decimal.Decimal('7.01'))
+        # The earliest of the highest bids wins
+        self.assertEqual(self.listing.winner, self.bidder)
+
+    def test_closing_keeps_concurrent_changes(self):
+        Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=decimal.Decimal('6.00'))
+        refresh_bid_stats = Listing.refresh_bid_stats
+
+        # The thumbnail worker finishes while the owner is closing the listing
+        def refresh_during_update(listing, save=True):
+            Listing.objects.filter(pk=listing.pk).update(thumbnail='ab/new.webp', description='Updated')
+            refresh_bid_stats(listing, save)
+
+        self.client.force_login(self.owner)
+        with mock.patch.object(Listing, 'refresh_bid_stats', refresh_during_update):
+            self.client.get(reverse('close_listing', args=[self.listing.id]))
+        self.listing.refresh_from_db()
+        self.assertEqual((self.listing.thumbnail, self.listing.description), ('ab/new.webp', 'Updated'))
+        self.assertFalse(self.listing.is_active)
+        self.assertEqual((self.listing.bid_count, self.listing.winner), (1, self.bidder))
+
+
+class BidAdminTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        self.hat, self.scarf = [Listing.objects.create(owner=owner, title=title, description='For sale',
+                                                       starting_price=decimal.Decimal('5.00'))
+                                for title in ('Hat', 'Scarf')]
+        for amount in ('6.00', '7.00'):
+            self.assertTrue(place_bid(self.hat.id, self.bidder, decimal.Decimal(amount)).accepted)
+        self.client.force_login(User.objects.create_superuser('admin', password='password'))
+
+    def test_moving_a_bid_refreshes_both_listings(self):
+        bid = self.hat.bids.get(amount=decimal.Decimal('7.00'))
+        response = self.client.post(reverse('admin:auctions_bid_change', args=[bid.id]), {
+            'listing': self.scarf.id, 'bidder': self.bidder.id, 'amount': '7.00'})
+        self.assertEqual(response.status_code, 302)
+        self.hat.refresh_from_db()
+        self.scarf.refresh_from_db()
+        self.assertEqual((self.hat.bid_count, self.hat.max_bid), (1, decimal.Decimal('6.00')))
+        self.assertEqual((self.scarf.bid_count, self.scarf.max_bid), (1, decimal.Decimal('7.00')))
+
+    def test_deleting_selected_bids_refreshes_their_listings(self):
+        response = self.client.post(reverse('admin:auctions_bid_changelist'), {
+            'action': 'delete_selected', 'post': 'yes',
+            '_selected_action': list(self.hat.bids.values_list('id', flat=True))})
+        self.assertEqual(response.status_code, 302)
+        self.hat.refresh_from_db()
+        self.assertEqual((self.hat.bid_count, self.hat.max_bid, self.hat.winner), (0, None, None))
+
+
+class BidStressTests(TransactionTestCase):
+    def test_concurrent_bids_on_hot_listing(self):
+        owner = User.objects.create_user('owner', password='password')
+        bidders = [User.objects.create_user(f'bidder{n}', password='password') for n in range(4)]
+        listing = Listing.objects.create(
+            owner=owner, title='Hot item', description='Everyone wants it', starting_price=decimal.Decimal('1.00'))
+
+        report = hammer_listing(listing.id, bidders, threads=4, bids_per_thread=25, seed=1)
+
+        # Every accepted bid must have beaten the one before it, and the stored stats must match the bids table
+        listing.refresh_from_db()
+        amounts = list(listing.bids.order_by('id').values_list('amount', flat=True))
+        accepted = report['outcomes'][BidOutcome.ACCEPTED.value]
+        self.assertGreater(accepted, 0)
+        self.assertEqual(sum(report['outcomes'].values()), report['attempts'])
+        self.assertEqual(len(amounts), accepted)
+        self.assertEqual(amounts, sorted(set(amounts)))
+        self.assertEqual(listing.num_bids, accepted)
+        self.assertEqual(listing.high_bid, listing.bids.aggregate(Max('amount'))['amount__max'])
+
+
+# VIEW BENCHMARKS
+# Seeds a realistic dataset, holds every URL to a query budget, and records render times through the test client.
+# Set AUCTIONS_BENCH_REPORT to a file path to write the timings as JSON, so they can be diffed between commits.
+
+BENCH_LISTINGS = int(os.environ.get('AUCTIONS_BENCH_LISTINGS', 2000))
+BENCH_BIDS = int(os.environ.get('AUCTIONS_BENCH_BIDS', 20000))
+BENCH_COMMENTS = int(os.environ.get('AUCTIONS_BENCH_COMMENTS', 20000))
+BENCH_RUNS = int(os.environ.get('AUCTIONS_BENCH_RUNS', 10))
+
+
+# Request logging is switched off so it doesn't flood the test output
+@override_settings(PERFORMANCE_SAMPLE_RATE=0)
+class ViewBudgetTests(TestCase):
+    # The most queries each URL may run, by URL name
+    # Listing pages must stay within budget no matter how many listings, bids or comments there are
+    QUERY_BUDGETS = {
+        'index': 5,
+        'login': 0,
+        'logout': 4,
+        'register': 0,
+        'listing': 6,
+        'listing_comments': 2,
+        'listings_closed': 5,
+        'listing_add': 3,
+        'watchlist_add': 4,
+        'watchlist_remove': 4,
+        'watchlist_view': 5,
+        'close_listing': 11,
+        'comment_add': 5,
+        'bid_add': 8,
+        'category_index': 3,
+        'category_listing': 6,
+        'search': 6,
+        'thumbnail': 1,
+    }
+    timings = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_auctions(users=50, listings=BENCH_LISTINGS, bids=BENCH_BIDS, comments=BENCH_COMMENTS,
+                      watchlist=BENCH_LISTINGS, seed=0)
+        cls.user = User.objects.get(username='user0')
+        cls.listing = Listing.objects.filter(is_active=True).exclude(owner=cls.user).order_by('-num_bids').first()
+        cls.own_listing = Listing.objects.filter(is_active=True, owner=cls.user).first()
+        cls.category = Category.objects.first()
+
+    @classmethod
+    def tearDownClass(cls):
+        report_path = os.environ.get('AUCTIONS_BENCH_REPORT')
+        if report_path:
+            with open(report_path, 'w') as report:
+                json.dump({
+                    'dataset': {'listings': BENCH_LISTINGS, 'bids': BENCH_BIDS, 'comments': BENCH_COMMENTS},
+                    'runs': BENCH_RUNS,
+                    'views': cls.timings,
+                }, report, indent=2, sort_keys=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    # Check the query budget on the first request, with a cold cache, then time repeated requests
+    def check_view(self, name, url, method='get', data=None, status=200, runs=BENCH_RUNS):
+        request = getattr(self.client, method)
+        cache.clear()
+        with self.assertNumQueries(self.QUERY_BUDGETS[name]):
+            response = request(url, data)
+        self.assertEqual(response.status_code, status)
+
+        durations = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            request(url, data)
+            durations.append((time.perf_counter() - started) * 1000)
+        self.timings[name] = {
+            'queries': self.QUERY_BUDGETS[name],
+            'p50_ms': round(percentile(durations, 50), 2) if durations else None,
+            'p95_ms': round(percentile(durations, 95), 2) if durations else None,
+        }
+
+    def test_every_url_has_a_budget(self):
+        self.assertEqual({pattern.name for pattern in urls.urlpatterns}, set(self.QUERY_BUDGETS))
+
+    def test_browse_views(self):
+        self.check_view('index', reverse('index'))
+        self.check_view('listings_closed', reverse('listings_closed'))
+        self.check_view('category_index', reverse('category_index'))
+        self.check_view('category_listing', reverse('category_listing', args=[self.category.id]))
+        self.check_view('listing', reverse('listing', args=[self.listing.id]))
+        self.check_view('listing_comments', reverse('listing_comments', args=[self.listing.id]))
+        self.check_view('watchlist_view', reverse('watchlist_view'))
+        self.check_view('search', reverse('search') + '?q=vintage')
+        self.check_view('thumbnail', reverse('thumbnail', args=['00/' + '0' * 64 + '.webp']), status=404)
+
+    def test_anonymous_views(self):
+        self.check_view('logout', reverse('logout'), status=302, runs=0)
+        self.check_view('login', reverse('login'))
+        self.check_view('register', reverse('register'))
+
+    def test_write_views(self):
+        listing_url = reverse('listing', args=[self.listing.id])
+        self.check_view('listing_add', reverse('listing_add'))
+        self.check_view('watchlist_add', reverse('watchlist_add', args=[self.listing.id]), status=302)
+        self.check_view('watchlist_remove', reverse('watchlist_remove', args=[self.listing.id]), status=302)
+        self.check_view('comment_add', reverse('comment_add'), 'post',
+                        {'listing': self.listing.id, 'body': 'Great item'}, status=302)
+        self.check_view('bid_add', reverse('bid_add'), 'post',
+                        {'listing': self.listing.id, 'amount': self.listing.required_bid + 1000}, status=302, runs=0)
+        self.check_view('close_listing', reverse('close_listing', args=[self.own_listing.id]), runs=0)
+        self.assertEqual(self.client.get(listing_url).status_code, 200)
+
+
+# SEARCH TESTS
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.category = Category.objects.create(name='Clothing')
+        self.hat = Listing.objects.create(
+            owner=self.owner, title='Red hat', description='A warm woolly hat',
+            starting_price=decimal.Decimal('5.00'), category=self.category)
+        self.scarf = Listing.objects.create(
+            owner=self.owner, title='Scarf', description='Matches the red hat',
+            starting_price=decimal.Decimal('5.00'))
+
+    def test_ranking_and_filters(self):
+        # Title matches rank above description matches
+        self.assertEqual(search_listings('hat'), [self.hat, self.scarf])
+        self.assertEqual(search_listings('hat', category_id=self.category.id), [self.hat])
+        self.assertEqual(search_listings('hat', category_id=0), [self.scarf])
+        # Prefix matching on the last word, and FTS syntax in the query is treated as plain text
+        self.assertEqual(search_listings('wool'), [self.hat])
+        self.assertEqual(search_listings('"hat)*'), [self.hat, self.scarf])
+
+    def test_index_follows_updates(self):
+        self.hat.title = 'Blue cap'
+        self.hat.is_active = False
+        self.hat.save()
+        self.assertEqual(search_listings('cap'), [])
+        self.assertEqual(search_listings('cap', active_only=False), [self.hat])
+        self.scarf.delete()
+        self.assertEqual(search_listings('scarf', active_only=False), [])
+
+
+# CATEGORY TESTS
+
+class CategoryCountTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.clothing = Category.objects.create(name='Clothing')
+        self.books = Category.objects.create(name='Books')
+        self.hat = Listing.objects.create(owner=self.owner, title='Hat', description='A hat',
+                                          starting_price=decimal.Decimal('5.00'), category=self.clothing)
+        Listing.objects.create(owner=self.owner, title='Scarf', description='A scarf',
+                               starting_price=decimal.Decimal('5.00'), category=self.clothing, is_active=False)
+        Listing.objects.create(owner=self.owner, title='Boots', description='Some boots',
+                               starting_price=decimal.Decimal('5.00'), category=self.clothing,
+                               end_time=timezone.now() - datetime.timedelta(minutes=1))
+        Listing.objects.create(owner=self.owner, title='Lamp', description='A lamp',
+                               starting_price=decimal.Decimal('5.00'))
+
+    def counts(self):
+        return [(category.name, category.listing_count) for category in category_counts()]
+
+    def test_counts_are_cached(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(self.counts(), [('Books', 0), ('Clothing', 1), ('Uncategorized', 1)])
+        with self.assertNumQueries(0):
+            self.counts()
+
+    def test_invalidation(self):
+        self.counts()
+        with self.captureOnCommitCallbacks(execute=True):
+            Listing.objects.create(owner=self.owner, title='Novel', description='A novel',
+                                   starting_price=decimal.Decimal('5.00'), category=self.books)
+        self.assertEqual(self.counts(), [('Books', 1), ('Clothing', 1), ('Uncategorized', 1)])
+        self.hat.is_active = False
+        with self.captureOnCommitCallbacks(execute=True):
+            self.hat.save()
+        self.assertEqual(self.counts(), [('Books', 1), ('Clothing', 0), ('Uncategorized', 1)])
+        self.books.name = 'Novels'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.books.save()
+        self.assertEqual(self.counts(), [('Clothing', 0), ('Novels', 1), ('Uncategorized', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clothing.delete()
+        self.assertEqual(self.counts(), [('Novels', 1), ('Uncategorized', 1)])
+
+    def test_closing_worker_invalidates(self):
+        self.counts()
+        Listing.objects.filter(pk=self.hat.id).update(end_time=timezone.now() - datetime.timedelta(minutes=1))
+        with self.captureOnCommitCallbacks(execute=True):
+            close_expired_auctions()
+        self.assertEqual(self.counts(), [('Books', 0), ('Clothing', 0), ('Uncategorized', 1)])
+
+    def test_category_pages(self):
+        response = self.client.get(reverse('category_index'))
+        self.assertContains(response, 'Clothing</a> (1)')
+        self.assertContains(response, 'Uncategorized</a> (1)')
+        self.assertContains(self.client.get(reverse('category_listing', args=[self.books.id])), 'Books')
+        self.assertEqual(self.client.get(reverse('category_listing', args=[self.books.id + 1])).status_code, 404)
+
+
+# WATCHLIST TESTS
+
+class WatchlistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('owner', password='password')
+        self.user = User.objects.create_user('watcher', password='password')
+        self.listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+        self.client.force_login(self.user)
+
+    def test_cached_ids_follow_watchlist_changes(self):
+        self.assertEqual(watched_listing_ids(self.user), frozenset())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('watchlist_add', args=[self.listing.id]))
+        with self.assertNumQueries(1):
+            self.assertEqual(watched_listing_ids(self.user), {self.listing.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(is_watching(self.user, self.listing.id))
+        self.assertContains(self.client.get(reverse('index')), 'Watching')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.get(reverse('watchlist_remove', args=[self.listing.id]))
+        self.assertFalse(is_watching(self.user, self.listing.id))
+        self.assertNotContains(self.client.get(reverse('index')), 'Watching')
+
+
+# LISTING CARD CACHE TESTS
+
+class CardCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        self.listing = Listing.objects.create(
+            owner=self.owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+
+    def cards(self, watched_ids=frozenset()):
+        return render_listing_cards(list(Listing.objects.with_card_data().filter(pk=self.listing.id)), watched_ids)
+
+    def version(self):
+        return listing_versions([self.listing.id])[self.listing.id]
+
+    def test_hit_skips_rendering(self):
+        html = self.cards()
+        with mock.patch('auctions.card_cache.render_to_string') as render:
+            self.assertEqual(self.cards(), html)
+        render.assert_not_called()
+        # Watched cards are cached separately, so the first one is rendered
+        self.assertNotEqual(self.cards({self.listing.id}), html)
+
+    def test_changes_bump_the_version(self):
+        changes = [
+            lambda: Bid.objects.create(listing=self.listing, bidder=self.bidder, amount=decimal.Decimal('6.00')),
+            lambda: Comment.objects.create(listing=self.listing, commenter=self.bidder, body='Nice hat'),
+            lambda: self.listing.save(),
+            lambda: self.listing.watchlist_items.add(self.bidder),
+            lambda: self.bidder.watchlist_items.remove(self.listing),
+            lambda: self.bidder.watchlist_items.add(self.listing),
+            lambda: self.bidder.watchlist_items.clear(),
+        ]
+        for change in changes:
+            version = self.version()
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+                # Other requests can't see the change until it's committed, so the version waits for that too
+                self.assertEqual(self.version(), version)
+            self.assertNotEqual(self.version(), version)
+        version = self.version()
+        with mock.patch('auctions.card_cache.render_to_string', return_value='new') as render:
+            self.assertEqual(self.cards(), ['new'])
+        render.assert_called_once()
+        self.assertEqual(self.version(), version)
+
+    def test_key_includes_timezone_language_and_watching(self):
+        keys = {card_key(self.listing.id, 1), card_key(self.listing.id, 1, watching=True),
+                card_key(self.listing.id, 2)}
+        with timezone.override('Asia/Tokyo'):
+            keys.add(card_key(self.listing.id, 1))
+        with translation.override('fr'):
+            keys.add(card_key(self.listing.id, 1))
+        self.assertEqual(len(keys), 5)
+
+
+# PAGINATION TESTS
+
+@override_settings(LISTINGS_PER_PAGE=3)
+class IndexPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('owner', password='password')
+        for n in range(8):
+            Listing.objects.create(
+                owner=owner, title=f'Item {n}', description='An item', starting_price=decimal.Decimal('5.00'))
+        # Most of the listings share a timestamp, so only the id tells them apart
+        now = timezone.now()
+        Listing.objects.filter(title__in=['Item 0', 'Item 1']).update(timestamp=now - datetime.timedelta(hours=1))
+        Listing.objects.exclude(title__in=['Item 0', 'Item 1']).update(timestamp=now)
+
+    def test_cursor_round_trip(self):
+        listing = Listing.objects.get(title='Item 3')
+        self.assertEqual(decode_cursor(encode_cursor(listing)), (listing.timestamp, listing.id))
+
+    def test_pages_have_no_duplicates_or_gaps(self):
+        expected = list(Listing.objects.order_by('-timestamp', '-id').values_list('id', flat=True))
+        seen = []
+        cursor = None
+        for _ in range(len(expected)):
+            response = self.client.get(reverse('index'), {'cursor': cursor} if cursor else {})
+            page = response.context['page']
+            seen.extend(listing.id for listing in page.object_list)
+            if not page.has_next:
+                break
+            self.assertContains(response, f'?cursor={page.next_cursor}')
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor(self):
+        for cursor in ('nonsense', encode_cursor(Listing.objects.first())[:-3], 'fA'):
+            self.assertEqual(self.client.get(reverse('index'), {'cursor': cursor}).status_code, 404)
+
+
+# COMMENT TESTS
+
+@override_settings(COMMENTS_PER_PAGE=2)
+class CommentPagingTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='password')
+        self.listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+        for n in range(3):
+            Comment.objects.create(listing=self.listing, commenter=owner, body=f'Comment {n}')
+        self.url = reverse('listing_comments', args=[self.listing.id])
+
+    def test_pages_and_new_comments(self):
+        response = self.client.get(reverse('listing', args=[self.listing.id]))
+        self.assertContains(response, 'Comment 1')
+        self.assertNotContains(response, 'Comment 2')
+
+        data = self.client.get(self.url, {'since': response.context['comments_cursor']}).json()
+        self.assertEqual([comment['body'] for comment in data['comments']], ['Comment 2'])
+        self.assertFalse(data['more'])
+
+        # Nothing new yet, so the cursor stays put until another comment is posted
+        caught_up = self.client.get(self.url, {'since': data['cursor']}).json()
+        self.assertEqual((caught_up['comments'], caught_up['cursor']), ([], data['cursor']))
+        Comment.objects.create(listing=self.listing, commenter=self.listing.owner, body='Comment 3')
+        data = self.client.get(self.url, {'since': data['cursor']}).json()
+        self.assertEqual([comment['body'] for comment in data['comments']], ['Comment 3'])
+
+    def test_missing_listing_and_bad_cursor(self):
+        self.assertEqual(self.client.get(reverse('listing_comments', args=[0])).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'since': 'nonsense'}).status_code, 404)
+
+
+# CONDITIONAL GET TESTS
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        self.listing = Listing.objects.create(
+            owner=self.owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+        self.client.force_login(self.bidder)
+
+    # The first visit sets the CSRF cookie, which is part of the ETag, so validate from the second one
+    def current_etag(self, url):
+        self.client.get(url)
+        response = self.client.get(url)
+        self.assertNotIn('Last-Modified', response)
+        return response['ETag']
+
+    def test_unchanged_pages_are_not_rendered(self):
+        # Session, user and validator queries only; pages of listings are validated from the cache alone
+        for url, queries in ((reverse('listing', args=[self.listing.id]), 3), (reverse('index'), 2)):
+            etag = self.current_etag(url)
+            with self.assertNumQueries(queries):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_changes_invalidate_the_etag(self):
+        self.client.get(reverse('index'))
+        for amount, url in enumerate((reverse('listing', args=[self.listing.id]), reverse('index')), 6):
+            etag = self.client.get(url)['ETag']
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertTrue(place_bid(self.listing.id, self.bidder, decimal.Decimal(amount)).accepted)
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            # Bulk updates don't send signals, but the listing page still notices them
+            etag = self.client.get(url)['ETag']
+            Listing.objects.filter(pk=self.listing.id).update(is_active=False, num_bids=2)
+            if url != reverse('index'):
+                self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+            Listing.objects.filter(pk=self.listing.id).update(is_active=True)
+
+    def test_list_etag_follows_the_catalogue(self):
+        url = reverse('index')
+        ending = Listing.objects.create(owner=self.owner, title='Scarf', description='A scarf',
+                                        starting_price=decimal.Decimal('5.00'),
+                                        end_time=timezone.now() + datetime.timedelta(hours=1))
+        category = Category.objects.create(name='Clothing')
+        changes = [
+            lambda: Listing.objects.create(owner=self.owner, title='Boots', description='Boots',
+                                           starting_price=decimal.Decimal('5.00')),
+            lambda: Listing.objects.get(title='Boots').delete(),
+            lambda: Category.objects.filter(pk=category.pk).get().save(),
+        ]
+        for change in changes:
+            etag = self.current_etag(url)
+            with self.captureOnCommitCallbacks(execute=True):
+                change()
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        # A listing passing its end time leaves the page before the closer gets to it
+        etag = self.current_etag(url)
+        with mock.patch('django.utils.timezone.now', return_value=ending.end_time + datetime.timedelta(seconds=1)):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, 'Scarf')
+
+    # Without a Last-Modified header, If-Modified-Since alone never gets a 304
+    def test_if_modified_since_is_not_trusted(self):
+        url = reverse('listing', args=[self.listing.id])
+        self.current_etag(url)
+        self.client.get(reverse('close_listing', args=[self.listing.id]))
+        future = 'Fri, 01 Jan 2100 00:00:00 GMT'
+        self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+        self.assertEqual(self.client.get(reverse('index'), HTTP_IF_MODIFIED_SINCE=future).status_code, 200)
+
+    def test_etag_varies_by_viewer(self):
+        url = reverse('listing', args=[self.listing.id])
+        etag = self.current_etag(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.force_login(self.owner)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.client.logout()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+        self.client.force_login(self.bidder)
+        etag = self.client.get(url)['ETag']
+        self.bidder.watchlist_items.add(self.listing)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_pages_with_messages_are_not_validated(self):
+        url = reverse('listing', args=[self.listing.id])
+        self.client.get(reverse('watchlist_add', args=[self.listing.id]))
+        response = self.client.get(url)
+        self.assertContains(response, 'added to your watchlist')
+        self.assertNotIn('ETag', response)
+        etag = self.current_etag(url)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+
+# SCHEDULED CLOSING TESTS
+
+class ScheduledClosingTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        now = timezone.now()
+        self.expired = [
+            Listing.objects.create(owner=self.owner, title=f'Expired {n}', description='A hat',
+                                   starting_price=decimal.Decimal('5.00'), end_time=now + datetime.timedelta(hours=1))
+            for n in range(3)]
+        self.running = Listing.objects.create(owner=self.owner, title='Running', description='A hat',
+                                              starting_price=decimal.Decimal('5.00'),
+                                              end_time=now + datetime.timedelta(days=1))
+        self.unscheduled = Listing.objects.create(owner=self.owner, title='Unscheduled', description='A hat',
+                                                  starting_price=decimal.Decimal('5.00'))
+        place_bid(self.expired[0].id, self.bidder, decimal.Decimal('7.00'))
+        Listing.objects.filter(pk__in=[listing.id for listing in self.expired]).update(
+            end_time=now - datetime.timedelta(minutes=1))
+
+    def test_expired_listings_are_not_active(self):
+        self.assertCountEqual(Listing.objects.active(), [self.running, self.unscheduled])
+        self.assertEqual(place_bid(self.expired[1].id, self.bidder, decimal.Decimal('9.00')).outcome,
+                         BidOutcome.CLOSED)
+        self.assertNotContains(self.client.get(reverse('index')), 'Expired')
+
+    def test_closer_works_in_batches(self):
+        # Two batches, each of them a savepoint, the id lookup, the update, the event data and the release
+        with self.assertNumQueries(2 * 5):
+            self.assertEqual(close_expired_auctions(batch_size=2), 3)
+        self.assertEqual(Listing.objects.filter(is_active=True).count(), 2)
+        winner = Listing.objects.get(pk=self.expired[0].id)
+        self.assertEqual((winner.winner, winner.max_bid, winner.num_bids), (self.bidder, decimal.Decimal('7.00'), 1))
+        self.assertIsNone(Listing.objects.get(pk=self.expired[1].id).winner)
+        self.assertEqual(close_expired_auctions(), 0)
+
+    def test_end_time_must_be_in_the_future(self):
+        form = ListingForm({'title': 'Hat', 'description': 'A hat', 'starting_price': '5.00',
+                            'end_time': '2001-01-01T12:00'})
+        self.assertIn('end_time', form.errors)
+
+
+# LIVE UPDATE TESTS
+
+class LiveUpdateTests(TestCase):
+    def setUp(self):
+        # The event stream closes old connections itself, as Django does around requests.  Inside a test's
+        # transaction that would close the test's own connection, so it's left alone, as the test client does.
+        close_patch = mock.patch('auctions.sse.close_old_connections')
+        close_patch.start()
+        self.addCleanup(close_patch.stop)
+        self.owner = User.objects.create_user('owner', password='password')
+        self.bidder = User.objects.create_user('bidder', password='password')
+        self.listing = Listing.objects.create(
+            owner=self.owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+
+    async def open_stream(self, path):
+        async def django_app(scope, receive, send):
+            raise AssertionError('Event streams should not reach Django')
+        communicator = ApplicationCommunicator(LiveUpdatesRouter(django_app), {
+            'type': 'http', 'method': 'GET', 'path': path, 'headers': []})
+        await communicator.send_input({'type': 'http.request', 'body': b''})
+        return communicator
+
+    async def next_event(self, communicator):
+        message = await communicator.receive_output(timeout=1)
+        event_type, data = (line.split(': ', 1)[1] for line in message['body'].decode().strip().split('\n'))
+        return event_type, json.loads(data)
+
+    def commit(self, action, *args):
+        with self.captureOnCommitCallbacks(execute=True):
+            return action(*args)
+
+    async def test_stream_follows_bids_and_close(self):
+        communicator = await self.open_stream(events_url(self.listing.id))
+        start = await communicator.receive_output(timeout=1)
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'content-type', b'text/event-stream'), start['headers'])
+        self.assertEqual(await self.next_event(communicator), ('listing', {
+            'amount': None, 'required_bid': '5.00', 'num_bids': 0, 'is_active': True}))
+
+        await sync_to_async(self.commit)(place_bid, self.listing.id, self.bidder, decimal.Decimal('6.00'))
+        self.assertEqual(await self.next_event(communicator), ('bid', {
+            'amount': '6.00', 'required_bid': '6.01'}))
+
+        await sync_to_async(self.client.force_login)(self.owner)
+        await sync_to_async(self.commit)(self.client.get, reverse('close_listing', args=[self.listing.id]))
+        self.assertEqual(await self.next_event(communicator), ('close', {'amount': '6.00'}))
+        self.assertEqual((await communicator.receive_output(timeout=1))['body'], b'')
+        await communicator.wait()
+
+    async def test_disconnect_unsubscribes(self):
+        communicator = await self.open_stream(events_url(self.listing.id))
+        await communicator.receive_output(timeout=1)
+        await self.next_event(communicator)
+        self.assertIn(listing_channel(self.listing.id), get_broker().subscribers)
+        await communicator.send_input({'type': 'http.disconnect'})
+        await communicator.wait()
+        self.assertNotIn(listing_channel(self.listing.id), get_broker().subscribers)
+
+    def test_pages_only_open_streams_that_are_served(self):
+        url = reverse('listing', args=[self.listing.id])
+        # Under WSGI there's no stream to open
+        self.assertContains(self.client.get(url), 'data-events-url=""')
+        with override_settings(LIVE_UPDATES=True):
+            self.assertContains(self.client.get(url), f'data-events-url="{events_url(self.listing.id)}"')
+            Listing.objects.filter(pk=self.listing.id).update(is_active=False)
+            self.assertContains(self.client.get(url), 'data-events-url=""')
+
+    async def test_missing_listing(self):
+        communicator = await self.open_stream(events_url(0))
+        self.assertEqual((await communicator.receive_output(timeout=1))['status'], 404)
+
+
+# ASYNC VIEW TESTS
+
+@override_settings(ROOT_URLCONF='commerce.urls_async')
+class AsyncViewTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = User.objects.create_user('owner', password='password')
+        self.category = Category.objects.create(name='Clothing')
+        self.listing = Listing.objects.create(owner=self.owner, title='Hat', description='A hat',
+                                              starting_price=decimal.Decimal('5.00'), category=self.category)
+        Comment.objects.create(listing=self.listing, commenter=self.owner, body='Nice hat')
+
+    def test_async_urls(self):
+        for name, args in (('index', []), ('listing', [self.listing.id]), ('category_listing', [self.category.id])):
+            self.assertIs(resolve(reverse(name, args=args)).func, getattr(async_views, resolve(
+                reverse(name, args=args), urlconf='commerce.urls').func.__name__))
+        # Everything else is still served by the sync views
+        self.assertIs(resolve(reverse('search')).func, views.search)
+
+    async def test_pages_match_the_sync_views(self):
+        await self.async_client.aforce_login(self.owner)
+        for url, text in ((reverse('index'), 'Hat'), (reverse('listing', args=[self.listing.id]), 'Nice hat'),
+                          (reverse('category_listing', args=[self.category.id]), 'Clothing'),
+                          (reverse('category_listing', args=[0]), 'Uncategorized')):
+            response = await self.async_client.get(url)
+            self.assertContains(response, text)
+            # The async views send the same validators, so the browser's copy can be revalidated
+            self.assertIn('ETag', response)
+            etag = (await self.async_client.get(url))['ETag']
+            self.assertEqual((await self.async_client.get(url, headers={'If-None-Match': etag})).status_code, 304)
+        self.assertEqual((await self.async_client.get(reverse('listing', args=[0]))).status_code, 404)
+        missing_category = reverse('category_listing', args=[self.category.id + 1])
+        self.assertEqual((await self.async_client.get(missing_category)).status_code, 404)
+
+
+# INDEX TESTS
+# Check the query plans for the hot queries, so a model or query change can't silently lose its index
+
+class IndexUsageTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='password')
+        self.category = Category.objects.create(name='Clothing')
+        self.listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'), category=self.category)
+
+    def assertUsesIndex(self, queryset, index_name):
+        plan = queryset.explain()
+        self.assertIn(f'USING INDEX {index_name}', plan)
+        self.assertNotIn('USE TEMP B-TREE FOR ORDER BY', plan)
+
+    def test_listing_pages(self):
+        paginator = KeysetPaginator(Listing.objects.active().with_card_data(), 25)
+        self.assertUsesIndex(paginator.after(None)[:26], 'listing_active_recent_idx')
+        self.assertUsesIndex(paginator.after(encode_cursor(self.listing))[:26], 'listing_active_recent_idx')
+        paginator = KeysetPaginator(Listing.objects.filter(is_active=False).with_card_data(), 25)
+        self.assertUsesIndex(paginator.after(None)[:26], 'listing_closed_recent_idx')
+        paginator = KeysetPaginator(Listing.objects.active().filter(category=self.category), 25)
+        self.assertUsesIndex(paginator.after(None)[:26], 'listing_category_active_idx')
+
+    def test_highest_bid(self):
+        self.assertUsesIndex(Bid.objects.filter(listing=self.listing).order_by('-amount')[:1], 'bid_listing_amount_idx')
+        plan = Bid.objects.filter(listing=self.listing).values('listing').annotate(Max('amount')).explain()
+        self.assertIn('bid_listing_amount_idx', plan)
+
+    def test_expired_listings(self):
+        expired = Listing.objects.filter(is_active=True, end_time__isnull=False, end_time__lte=timezone.now())
+        self.assertUsesIndex(expired.order_by('end_time'), 'listing_active_end_idx')
+
+    def test_listing_comments(self):
+        self.assertUsesIndex(Comment.objects.filter(listing=self.listing).order_by('timestamp', 'id'),
+                             'comment_listing_time_idx')
+
+
+# INSTRUMENTATION TESTS
+
+class PerformanceMiddlewareTests(TestCase):
+    def setUp(self):
+        owner = User.objects.create_user('owner', password='password')
+        self.listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=1)
+    def test_server_timing_and_log_line(self):
+        with self.assertLogs('auctions.performance', 'INFO') as logs:
+            response = self.client.get(reverse('listing', args=[self.listing.id]))
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="\d+ queries", tpl;dur=[\d.]+;.*view;dur=')
+        stats = logs.records[0].performance
+        self.assertEqual(stats['url_name'], 'listing')
+        self.assertGreater(stats['queries'], 0)
+        self.assertGreater(stats['template_ms'], 0)
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_unsampled_requests_are_not_timed(self):
+        response = self.client.get(reverse('index'))
+        self.assertNotIn('Server-Timing', response)
+
+
+class TimezoneMiddlewareTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('tokyo', password='password', timezone='Asia/Tokyo')
+        self.middleware = TimezoneMiddleware(lambda request: HttpResponse(timezone.get_current_timezone_name()))
+
+    def zone_for(self, session, user):
+        request = RequestFactory().get('/')
+        request.session = session
+        request.user = user
+        return self.middleware(request).content.decode()
+
+    def test_zone_comes_from_the_session(self):
+        self.assertEqual(self.zone_for(self.client.session, AnonymousUser()), settings.DEFAULT_TIMEZONE)
+        self.client.force_login(self.user)
+        # The zone was stored at login, so only the session is loaded, not the user
+        with self.assertNumQueries(1):
+            zone = self.zone_for(self.client.session, SimpleLazyObject(lambda: self.fail('user was loaded')))
+        self.assertEqual(zone, 'Asia/Tokyo')
+        self.assertEqual(timezone.get_current_timezone_name(), settings.TIME_ZONE)
+
+    def test_older_sessions_are_filled_in(self):
+        session = self.client.session
+        self.assertEqual(self.zone_for(session, self.user), 'Asia/Tokyo')
+        self.assertEqual(session[TIMEZONE_SESSION_KEY], 'Asia/Tokyo')
+
+    def test_register_checks_the_zone(self):
+        self.assertContains(self.client.get(reverse('register')),
+                            f'<option value="{settings.DEFAULT_TIMEZONE}" selected="selected">', html=False)
+        self.client.post(reverse('register'), {'username': 'nowhere', 'email': 'nowhere@example.com', 'password': 'pw',
+                                               'confirmation': 'pw', 'user_timezone': 'Mars/Olympus_Mons'})
+        self.assertEqual(User.objects.get(username='nowhere').timezone, settings.DEFAULT_TIMEZONE)
+        self.assertEqual(self.client.session[TIMEZONE_SESSION_KEY], settings.DEFAULT_TIMEZONE)
+
+
+# SESSION TESTS
+
+class SessionProfileTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        owner = User.objects.create_user('owner', password='password')
+        User.objects.create_user('bidder', password='password')
+        self.listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+
+    def writes(self, profile):
+        with override_settings(**settings.SESSION_PROFILES[profile]):
+            return session_writes('bidder', 'password', self.listing.id, rounds=2)
+
+    def test_session_writes_per_profile(self):
+        self.assertEqual(self.writes('db')['login'], {'session': 2, 'other': 1})
+        cached = self.writes('cached_db')
+        self.assertEqual(cached['login'], {'session': 1, 'other': 1})
+        self.assertEqual(cached['bid_add'], {'session': 0, 'other': 2})
+        signed = self.writes('signed_cookies')
+        self.assertEqual(sum(action['session'] for action in signed.values()), 0)
+
+    def test_unchanged_sessions_are_not_saved(self):
+        session = LowWriteSessionStore()
+        session['timezone'] = 'Asia/Tokyo'
+        session.save()
+        cache.clear()
+        session = LowWriteSessionStore(session.session_key)
+        session['timezone'] = 'Asia/Tokyo'
+        self.assertTrue(session.modified)
+        with self.assertNumQueries(0):
+            session.save()
+        session['timezone'] = 'Europe/Paris'
+        session.save()
+        self.assertEqual(LowWriteSessionStore(session.session_key)['timezone'], 'Europe/Paris')
+
+    def test_values_changed_in_place_are_saved(self):
+        session = LowWriteSessionStore()
+        session['recent'] = {'listings': [1]}
+        session.save()
+        cache.clear()
+        session = LowWriteSessionStore(session.session_key)
+        session['recent']['listings'].append(2)
+        session.modified = True
+        session.save()
+        cache.clear()
+        self.assertEqual(LowWriteSessionStore(session.session_key)['recent'], {'listings': [1, 2]})
+
+
+# SQLITE TUNING TESTS
+
+class SqliteTuningTests(TransactionTestCase):
+    # Read some settings on a new connection
+    # Connections belong to the thread that opened them, so a new one is opened in another thread
+    def new_connection(self):
+        found = {}
+
+        def read():
+            try:
+                with connection.cursor() as cursor:
+                    for name in ('busy_timeout', 'synchronous'):
+                        found[name] = cursor.execute(f'PRAGMA {name}').fetchone()[0]
+                found['transaction_mode'] = connection.transaction_mode
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        return found
+
+    def test_new_connections_are_tuned(self):
+        # synchronous 1 is NORMAL
+        self.assertEqual(self.new_connection(), {
+            'busy_timeout': settings.SQLITE_PRAGMAS['busy_timeout'], 'synchronous': 1, 'transaction_mode': 'IMMEDIATE'})
+        with sqlite_settings({'busy_timeout': 1234}):
+            self.assertEqual(self.new_connection(), {'busy_timeout': 1234, 'synchronous': 2, 'transaction_mode': None})
+        self.assertEqual(self.new_connection()['busy_timeout'], settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    @override_settings(PERFORMANCE_SAMPLE_RATE=0)
+    def test_contended_writes(self):
+        owner = User.objects.create_user('owner', password='password')
+        bidders = [User.objects.create_user(f'bidder{n}', password='password') for n in range(3)]
+        listing = Listing.objects.create(
+            owner=owner, title='Hot item', description='Everyone wants it', starting_price=decimal.Decimal('1.00'))
+        # With the tuned settings, writers wait for each other instead of failing
+        report = contended_writes(listing.id, bidders, threads=3, requests_per_thread=6)
+        self.assertEqual(report, {**report, 'requests': 18, 'locked': 0, 'errors': 0})
+        # Every comment was stored; bids made on a stale minimum may have been outbid, but not all of them
+        self.assertEqual(listing.comments.count(), 6)
+        listing.refresh_from_db()
+        self.assertGreater(listing.bid_count, 0)
+        self.assertEqual(listing.bid_count, listing.bids.count())
+
+
+# READ REPLICA TESTS
+
+@override_settings(READ_REPLICA_DATABASE='replica')
+class ReplicaTests(TestCase):
+    def read_from(self, request, view=None):
+        view = view or (lambda request: HttpResponse(str(router.db_for_read(Listing))))
+        response = ReplicaMiddleware(view)(request)
+        return response.content.decode(), STICKY_COOKIE in response.cookies
+
+    def test_routing(self):
+        factory = RequestFactory()
+        self.assertEqual(self.read_from(factory.get('/')), ('replica', False))
+        self.assertEqual(self.read_from(factory.post('/')), ('default', True))
+        # Reads stay on default for a while after the user writes
+        sticky = factory.get('/')
+        sticky.COOKIES[STICKY_COOKIE] = '1'
+        self.assertEqual(self.read_from(sticky), ('default', False))
+        # Views that write on a GET always use default
+        self.assertEqual(self.read_from(factory.get('/'), use_primary_database(
+            lambda request: HttpResponse(str(router.db_for_read(Listing))))), ('default', True))
+        self.assertEqual(router.db_for_write(Listing), 'default')
+        with override_settings(READ_REPLICA_DATABASE=None):
+            self.assertEqual(self.read_from(factory.post('/')), ('default', False))
+
+    # Reading from default as if it were the replica, so the views run against the test data
+    @override_settings(READ_REPLICA_DATABASE='default')
+    def test_writes_make_the_user_sticky(self):
+        owner = User.objects.create_user('owner', password='password')
+        listing = Listing.objects.create(
+            owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+        self.client.force_login(User.objects.create_user('bidder', password='password'))
+        self.assertNotIn(STICKY_COOKIE, self.client.get(reverse('listing', args=[listing.id])).cookies)
+        self.assertIn(STICKY_COOKIE, self.client.get(reverse('watchlist_add', args=[listing.id])).cookies)
+        response = self.client.post(reverse('bid_add'), {'listing': listing.id, 'amount': '6.00'})
+        self.assertEqual(response.cookies[STICKY_COOKIE]['max-age'], settings.READ_REPLICA_STICKY_SECONDS)
+
+    # Only versions the replica was copied after are cached or validated from it
+    @override_settings(READ_REPLICA_DATABASE='default')
+    def test_replica_reads_only_cache_what_was_copied(self):
+        cache.clear()
+        owner = User.objects.create_user('owner', password='password')
+        with self.captureOnCommitCallbacks(execute=True):
+            listing = Listing.objects.create(
+                owner=owner, title='Hat', description='A hat', starting_price=decimal.Decimal('5.00'))
+        listings = list(Listing.objects.with_card_data())
+        key = card_key(listing.id, listing_versions([listing.id])[listing.id])
+
+        def read_from_replica():
+            token = read_database.set('default')
+            try:
+                render_listing_cards(listings)
+            finally:
+                read_database.reset(token)
+            return [self.client.get(url).has_header('ETag') for url in (reverse('index'),
+                                                                         reverse('listing', args=[listing.id]))]
+
+        # Not copied yet
+        self.assertEqual(read_from_replica(), [False, False])
+        self.assertIsNone(cache.get(key))
+        record_replica_copy(time.time_ns())
+        self.assertEqual(read_from_replica(), [True, True])
+        self.assertIsNotNone(cache.get(key))
+        # Changed since the last copy
+        with self.captureOnCommitCallbacks(execute=True):
+            listing.save()
+        self.assertEqual(read_from_replica(), [False, False])
+        self.assertIsNone(cache.get(card_key(listing.id, listing_versions([listing.id])[listing.id])))
+        # Reads from default are always cached
+        self.assertTrue(self.client.get(reverse('index'), HTTP_COOKIE=f'{STICKY_COOKIE}=1').has_header('ETag'))
+
+    def test_copy_database(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source, replica = (os.path.join(directory.name, name) for name in ('source.sqlite3', 'replica.sqlite3'))
+        with sqlite3.connect(source) as database:
+            database.execute('CREATE TABLE bids (amount)')
+            database.execute('INSERT INTO bids VALUES (5)')
+        database.close()
+        copy_database(source, replica)
+        with sqlite3.connect(source) as database:
+            database.execute('INSERT INTO bids VALUES (6)')
+        database.close()
+        copy_database(source, replica)
+        database = sqlite3.connect(f'file:{replica}?mode=ro', uri=True)
+        self.assertEqual(database.execute('SELECT amount FROM bids ORDER BY amount').fetchall(), [(5,), (6,)])
+        database.close()
+
+
+# THUMBNAIL TESTS
+
+@unittest.skipIf(Image is None, 'Making thumbnails needs Pillow')
+class ThumbnailTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.TemporaryDirectory()
+        self.addCleanup(self.root.cleanup)
+        # The local image host is on the loopback address, which is refused unless allowed
+        settings_override = override_settings(THUMBNAIL_ROOT=self.root.name, THUMBNAIL_SIZE=(40, 40),
+                                              THUMBNAIL_ALLOWED_NETWORKS=['127.0.0.1/32'])
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        cache.clear()
+
+        # A local stand-in for the sites that host listing images
+        photo = io.BytesIO()
+        Image.new('RGB', (120, 80), 'red').save(photo, 'PNG')
+        self.hits = []
+
+        def image_host(environ, start_response):
+            self.hits.append(environ['PATH_INFO'])
+            if environ['PATH_INFO'] == '/photo.png':
+                start_response('200 OK', [('Content-Type', 'image/png')])
+                return [photo.getvalue()]
+            if environ['PATH_INFO'] == '/flaky.png' and self.hits.count('/flaky.png') == 1:
+                start_response('503 Service Unavailable', [('Content-Type', 'text/plain')])
+                return [b'Try again later']
+            if environ['PATH_INFO'] in ('/flaky.png', '/large.png'):
+                start_response('200 OK', [('Content-Type', 'image/png')])
+                return [photo.getvalue()]
+            if environ['PATH_INFO'] == '/redirect':
+                start_response('302 Found', [('Location', environ['QUERY_STRING'])])
+                return [b'']
+            start_response('404 Not Found', [('Content-Type', 'text/plain')])
+            return [b'Not found']
+
+        server = start_wsgi_server(image_host, threads=2)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        host, port = server.server_address
+        self.host_url = f'http://{host}:{port}'
+        self.photo_url = f'{self.host_url}/photo.png'
+
+        owner = User.objects.create_user('owner', password='password')
+        self.listings = [Listing.objects.create(owner=owner, title=title, description='For sale', image_url=url,
+                                                starting_price=decimal.Decimal('5.00'))
+                         for title, url in (('Hat', self.photo_url), ('Scarf', self.photo_url),
+                                            ('Boots', f'http://{host}:{port}/missing.png'), ('Lamp', None))]
+
+    def test_thumbnails(self):
+        self.assertTrue(all(listing.image_display == settings.PLACEHOLDER_IMAGE for listing in self.listings))
+        with self.assertLogs('auctions.thumbnails', 'WARNING'):
+            self.assertEqual(generate_thumbnails(workers=2), 3)
+        # The shared image was only fetched once
+        self.assertEqual(sorted(self.hits), ['/missing.png', '/photo.png'])
+        hat, scarf, boots, lamp = [Listing.objects.get(pk=listing.pk) for listing in self.listings]
+        self.assertEqual(hat.thumbnail, scarf.thumbnail)
+        self.assertEqual(hat.image_display, reverse('thumbnail', args=[hat.thumbnail]))
+        self.assertEqual((boots.thumbnail, boots.image_display), ('', settings.PLACEHOLDER_IMAGE))
+        self.assertEqual(lamp.image_display, settings.PLACEHOLDER_IMAGE)
+        with Image.open(thumbnail_path(hat.thumbnail)) as image:
+            self.assertEqual(image.size, (40, 27))
+        self.assertEqual(generate_thumbnails(), 0)
+
+        # A new image URL needs a new thumbnail
+        hat.image_url = self.photo_url + '?v=2'
+        hat.save()
+        self.assertEqual(hat.image_display, settings.PLACEHOLDER_IMAGE)
+        self.assertEqual(generate_thumbnails(), 1)
+
+    def test_private_addresses_are_refused(self):
+        for address in ('10.0.0.8', '192.168.1.1', '169.254.169.254', '::1', 'fe80::1%eth0', '::ffff:10.0.0.8',
+                        '0.0.0.0', '224.0.0.1'):
+            self.assertFalse(is_allowed_address(address), address)
+        for address in ('127.0.0.1', '93.184.216.34', '2606:2800:220:1:248:1893:25c7:1946'):
+            self.assertTrue(is_allowed_address(address), address)
+
+        self.assertEqual(len(fetch_image(self.photo_url)), len(fetch_image(f'{self.host_url}/redirect?/photo.png')))
+        # Every redirect is checked, as well as the first URL
+        with self.assertRaisesMessage(ThumbnailError, 'not a public address'):
+            fetch_image(f'{self.host_url}/redirect?http://169.254.169.254/latest/meta-data/')
+        for url in (f'{self.host_url}/redirect?file:///etc/passwd', 'file:///etc/passwd', 'ftp://example.com/a.png'):
+            with self.assertRaises(ThumbnailError, msg=url):
+                fetch_image(url)
+        with override_settings(THUMBNAIL_ALLOWED_NETWORKS=[]):
+            with self.assertRaisesMessage(ThumbnailError, 'not a public address'):
+                fetch_image(self.photo_url)
+
+    # An image that couldn't be fetched this time is tried again; one that can't be used isn't
+    def test_only_permanent_failures_are_stored(self):
+        Listing.objects.filter(pk__in=[listing.pk for listing in self.listings]).delete()
+        owner = User.objects.get(username='owner')
+        flaky, large = [Listing.objects.create(owner=owner, title=title, description='For sale',
+                                               image_url=f'{self.host_url}/{title.lower()}.png',
+                                               starting_price=decimal.Decimal('5.00'))
+                        for title in ('Flaky', 'Large')]
+        with override_settings(THUMBNAIL_MAX_BYTES=100), self.assertLogs('auctions.thumbnails', 'WARNING') as logs:
+            self.assertEqual(generate_thumbnails(batch_size=1), 1)
+        self.assertIn('will retry', '\n'.join(logs.output))
+        flaky.refresh_from_db()
+        large.refresh_from_db()
+        self.assertEqual((flaky.thumbnail, flaky.thumbnail_source), ('', None))
+        self.assertEqual((large.thumbnail, large.thumbnail_source), ('', large.image_url))
+
+        self.assertEqual(generate_thumbnails(), 1)
+        flaky.refresh_from_db()
+        self.assertEqual(flaky.image_display, reverse('thumbnail', args=[flaky.thumbnail]))
+        self.assertEqual(self.hits.count('/flaky.png'), 2)
+
+    def test_serving(self):
+        with self.assertLogs('auctions.thumbnails', 'WARNING'):
+            generate_thumbnails()
+        response = self.client.get(Listing.objects.get(pk=self.listings[0].pk).image_display)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertIn(response['Content-Type'], ('image/webp', 'image/jpeg'))
+        self.assertEqual(self.client.get(reverse('thumbnail', args=['../../settings.py'])).status_code, 404)
+
+
+# STATIC ASSET TESTS
+
+class StaticAssetTests(TestCase):
+    def test_minify_css(self):
+        self.assertEqual(minify_css('/*! Licence */\n/* Note */\nnav :hover,\na > b {\n    color: red;\n    margin: 0 auto;\n}\n'),
+                         '/*! Licence */ nav :hover,a>b{color:red;margin:0 auto}')
+
+    def test_vendoring_checks_integrity(self):
+        def cdn(environ, start_response):
+            start_response('200 OK', [('Content-Type', 'text/css')])
+            return [b'body{margin:0}']
+
+        server = start_wsgi_server(cdn, threads=1)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = 'http://%s:%s/bootstrap.min.css' % server.server_address
+        good = VendorAsset('auctions/vendor/test.min.css', url, integrity(b'body{margin:0}'))
+        self.assertEqual(fetch_vendor_asset(good), b'body{margin:0}')
+        with self.assertRaises(VendorError):
+            fetch_vendor_asset(good._replace(integrity=integrity(b'body{margin:1px}')))
+
+    def test_vendored_files_match_their_hashes(self):
+        for asset in VENDOR_ASSETS.values():
+            with open(finders.find(asset.path), 'rb') as file:
+                self.assertEqual(integrity(file.read(), asset.integrity.split('-', 1)[0]), asset.integrity)
+
+    def test_build_and_serve(self):
+        root = tempfile.TemporaryDirectory()
+        self.addCleanup(root.cleanup)
+        with override_settings(STATIC_ROOT=root.name):
+            call_command('collectstatic', interactive=False, verbosity=0)
+            styles = staticfiles_storage.stored_name('auctions/styles.css')
+            self.assertRegex(styles, r'^auctions/styles\.[0-9a-f]{12}\.css$')
+            index = self.client.get(reverse('index'))
+            self.assertContains(index, staticfiles_storage.url('auctions/styles.css'))
+            # Bootstrap is served from here, hashed and compressed like our own files, and never from its CDN
+            bootstrap = staticfiles_storage.stored_name(VENDOR_ASSETS['bootstrap'].path)
+            self.assertContains(index, settings.STATIC_URL + bootstrap)
+            self.assertNotContains(index, VENDOR_ASSETS['bootstrap'].url)
+            response = self.client.get(settings.STATIC_URL + bootstrap, HTTP_ACCEPT_ENCODING='br, gzip')
+            self.assertEqual(response['Content-Encoding'], 'br' if brotli else 'gzip')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            with open(staticfiles_storage.path(styles), 'rb') as file:
+                minified = file.read()
+            self.assertNotIn(b'\n', minified)
+
+            # Static files are served before the session or the user are loaded
+            self.client.force_login(User.objects.create_user('viewer', password='password'))
+            with self.assertNumQueries(0):
+                response = self.client.get(settings.STATIC_URL + styles, HTTP_ACCEPT_ENCODING='gzip, deflate')
+            self.assertEqual(response['Content-Encoding'], 'gzip')
+            self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+            self.assertEqual(response['Vary'], 'Accept-Encoding')
+            self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), minified)
+
+            response = self.client.get(settings.STATIC_URL + 'auctions/styles.css', HTTP_ACCEPT_ENCODING='br;q=0')
+            self.assertNotIn('Content-Encoding', response)
+            self.assertEqual(response['Cache-Control'], 'no-cache')
+            self.assertEqual(self.client.get(settings.STATIC_URL + 'auctions/styles.css',
+                                             HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+            self.assertEqual(self.client.get(settings.STATIC_URL + '../manage.py').status_code, 404)
+
+
+# SEEDING TESTS
+
+class SeedingTests(TestCase):
+    def test_bids_are_in_the_past_and_never_by_the_owner(self):
+        self.assertEqual(seed_auctions(users=1, listings=5, bids=10, comments=0, watchlist=0, seed=1)['bids'], 0)
+        created = seed_auctions(users=3, categories=1, listings=50, bids=500, comments=100, watchlist=0, seed=1)
+        self.assertEqual(created['bids'], 500)
+        now = timezone.now()
+        self.assertFalse(Bid.objects.filter(timestamp__gt=now).exists())
+        self.assertFalse(Comment.objects.filter(timestamp__gt=now).exists())
+        self.assertFalse(Bid.objects.filter(bidder=F('listing__owner')).exists())
+
+
+# LOAD TEST TESTS
+
+# One virtual user at a time, so the journeys made and the bids placed are the same on every run
+@override_settings(ALLOWED_HOSTS=['127.0.0.1'], PERFORMANCE_SAMPLE_RATE=0)
+class LoadTestTests(TransactionTestCase):
+    def setUp(self):
+        seed_auctions(users=5, categories=2, listings=20, bids=20, comments=10, watchlist=5, seed=1)
+        from commerce.wsgi import application
+        self.application = application
+
+    def test_journeys(self):
+        bids = Bid.objects.count()
+        shop = run_load_test(InProcessTransport(self.application), users=1, journeys_per_user=1, buyer_fraction=1,
+                             seeded_users=5, seed=1)
+        self.assertEqual(shop['journeys'], {'shop': 1})
+        self.assertEqual(shop['total']['error_rate'], 0)
+        for name in ('login', 'index', 'listing', 'watchlist_add', 'bid_add', 'comment_add', 'watchlist_remove'):
+            self.assertIn(name, shop['urls'])
+        self.assertEqual(Bid.objects.count(), bids + 1)
+
+        server = start_wsgi_server(self.application, 1)
+        try:
+            browse = run_load_test(SocketTransport('127.0.0.1', server.server_port), users=1, journeys_per_user=2,
+                                   buyer_fraction=0, seed=1)
+        finally:
+            server.shutdown()
+            server.server_close()
+        self.assertEqual(browse['journeys'], {'browse': 2})
+        self.assertEqual(browse['total']['error_rate'], 0)
+        self.assertEqual(browse['urls']['search']['requests'], 2)
+
+    def test_missed_targets(self):
+        summary = {'total': {'requests': 10, 'p95_ms': 90.0, 'error_rate': 0.1},
+                   'urls': {'index': {'requests': 5, 'p95_ms': 50.0, 'error_rate': 0},
+                            'search': {'requests': 5, 'p95_ms': 120.0, 'error_rate': 0.2}}}
+        self.assertEqual(missed_targets(summary, max_p95_ms=100), ['search: p95 of 120.0ms is over 100ms'])
+        self.assertEqual(len(missed_targets(summary, max_error_rate=0.05)), 2)
+        self.assertEqual(missed_targets(summary), [])
@@ -0,0 +1,273 @@
+from concurrent.futures import ThreadPoolExecutor
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils.module_loading import import_string
+import functools
+import hashlib
+import http.client
+import io
+import ipaddress
+import logging
+import os
+import re
+import socket
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+from .card_cache import bump_listing_versions
+from .models import Listing
+
+# Pillow is optional:  without it no thumbnails are made, and listings keep showing the placeholder image
+try:
+    from PIL import Image, features
+except ImportError:
+    Image = None
+
+logger = logging.getLogger(__name__)
+
+
+# LISTING THUMBNAILS
+# Listing images are arbitrary full-size pictures on other sites.  The generate_thumbnails worker fetches each
+# image once, shrinks it to fit THUMBNAIL_SIZE, and stores the result on disk under a name made from a hash of
+# its contents.  A thumbnail's name never points at different bytes, so it can be cached by browsers forever.
+# Listing.image_display shows the placeholder image until the listing's thumbnail is ready.
+
+# Stored thumbnails are named <first two hex digits>/<sha256 hex digest>.<extension>
+THUMBNAIL_NAME = re.compile(r'[0-9a-f]{2}/[0-9a-f]{64}\.(webp|jpg)')
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpg': 'image/jpeg'}
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+# A failure that may not happen next time, such as a timeout or a server error, so the image is tried again later
+class TemporaryThumbnailError(ThumbnailError):
+    pass
+
+
+# FETCHING IMAGES SAFELY
+# Image URLs are chosen by listing owners, and the server fetches them, so a URL must not be able to reach the
+# server's own network:  loopback, private and link-local addresses (such as a cloud metadata service) are refused.
+# The host is checked when the connection is made, against the address actually connected to, so a DNS answer
+# can't change between the check and the connection.  Each redirect is a new connection, and is checked again.
+
+def is_allowed_address(address):
+    ip = ipaddress.ip_address(address.split('%', 1)[0])
+    if ip.version == 6 and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    if any(ip in ipaddress.ip_network(network) for network in settings.THUMBNAIL_ALLOWED_NETWORKS):
+        return True
+    return ip.is_global and not ip.is_multicast
+
+
+# Connect to the first of the host's addresses, refusing the host if any of them isn't allowed
+def create_checked_connection(address, timeout=socket._GLOBAL_DEFAULT_TIMEOUT, source_address=None, **kwargs):
+    host, port = address
+    try:
+        found = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except socket.gaierror as error:
+        raise TemporaryThumbnailError(f'Could not resolve {host}: {error}')
+    for family, socket_type, protocol, _, socket_address in found:
+        if not is_allowed_address(socket_address[0]):
+            raise ThumbnailError(f'Image host {host} is not a public address')
+    family, socket_type, protocol, _, socket_address = found[0]
+    sock = socket.socket(family, socket_type, protocol)
+    try:
+        if timeout is not socket._GLOBAL_DEFAULT_TIMEOUT:
+            sock.settimeout(timeout)
+        sock.connect(socket_address)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+# HTTPConnection sets _create_connection on each new connection, so it is replaced there
+class CheckedHTTPConnection(http.client.HTTPConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_checked_connection
+
+
+class CheckedHTTPSConnection(http.client.HTTPSConnection):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._create_connection = create_checked_connection
+
+
+class CheckedHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, request):
+        return self.do_open(CheckedHTTPConnection, request)
+
+
+class CheckedHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, request):
+        return self.do_open(CheckedHTTPSConnection, request, context=self._context)
+
+
+# Follow a few redirects, and only to other HTTP(S) URLs
+class CheckedRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, request, fp, code, message, headers, new_url):
+        if urllib.parse.urlsplit(new_url).scheme.lower() not in ('http', 'https'):
+            raise ThumbnailError(f'Refusing to follow a redirect to {new_url}')
+        return super().redirect_request(request, fp, code, message, headers, new_url)
+
+
+def image_opener():
+    redirects = CheckedRedirectHandler()
+    redirects.max_redirections = settings.THUMBNAIL_MAX_REDIRECTS
+    # No proxies:  the address checks only mean something when the server connects to the image host itself
+    return urllib.request.build_opener(urllib.request.ProxyHandler({}), CheckedHTTPHandler, CheckedHTTPSHandler,
+                                       redirects)
+
+
+# The default fetcher:  download the image over HTTP(S), refusing anything larger than THUMBNAIL_MAX_BYTES
+# Fetchers are called with the image URL and return the image's bytes, or raise ThumbnailError, or
+# TemporaryThumbnailError if fetching the image again later might work.
+
+# Responses that say the image isn't there, apart from these, are taken at their word
+TEMPORARY_STATUSES = {408, 429}
+
+def fetch_image(url):
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme.lower() not in ('http', 'https') or not parts.hostname:
+        raise ThumbnailError(f'Not an HTTP URL: {url}')
+    request = urllib.request.Request(url, headers={'User-Agent': 'commerce-thumbnailer'})
+    try:
+        with image_opener().open(request, timeout=settings.THUMBNAIL_FETCH_TIMEOUT) as response:
+            data = response.read(settings.THUMBNAIL_MAX_BYTES + 1)
+    except urllib.error.HTTPError as error:
+        if error.code >= 500 or error.code in TEMPORARY_STATUSES:
+            raise TemporaryThumbnailError(f'Could not fetch {url}: {error}')
+        raise ThumbnailError(f'Could not fetch {url}: {error}')
+    except urllib.error.URLError as error:
+        # Refusals made while connecting arrive wrapped in a URLError
+        if isinstance(error.reason, ThumbnailError):
+            raise error.reason
+        raise TemporaryThumbnailError(f'Could not fetch {url}: {error}')
+    except (OSError, http.client.HTTPException) as error:
+        raise TemporaryThumbnailError(f'Could not fetch {url}: {error}')
+    except ValueError as error:
+        raise ThumbnailError(f'Could not fetch {url}: {error}')
+    if len(data) > settings.THUMBNAIL_MAX_BYTES:
+        raise ThumbnailError(f'Image is larger than {settings.THUMBNAIL_MAX_BYTES} bytes: {url}')
+    return data
+
+
+@functools.lru_cache(maxsize=None)
+def get_fetcher():
+    return import_string(settings.THUMBNAIL_FETCHER)
+
+
+# Shrink an image to fit within THUMBNAIL_SIZE, keeping its proportions, and encode it as WebP
+# Falls back to JPEG where Pillow was built without WebP support.  Returns the encoded bytes and the extension.
+
+def make_thumbnail(data):
+    use_webp = settings.THUMBNAIL_FORMAT == 'WEBP' and features.check('webp')
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            image.thumbnail(settings.THUMBNAIL_SIZE)
+            keep_alpha = use_webp and image.has_transparency_data
+            image = image.convert('RGBA' if keep_alpha else 'RGB')
+            output = io.BytesIO()
+            image.save(output, 'WEBP' if use_webp else 'JPEG', quality=settings.THUMBNAIL_QUALITY)
+    except (OSError, ValueError, Image.DecompressionBombError) as error:
+        raise ThumbnailError(f'Not a usable image: {error}')
+    return output.getvalue(), 'webp' if use_webp else 'jpg'
+
+
+def thumbnail_path(name):
+    return os.path.join(settings.THUMBNAIL_ROOT, *name.split('/'))
+
+
+# Store a thumbnail under its content hash, and return its name
+# Identical thumbnails share one file.  The file is written under a temporary name and then renamed,
+# so a request never sees a half-written thumbnail.
+
+def store_thumbnail(data, extension):
+    digest = hashlib.sha256(data).hexdigest()
+    name = f'{digest[:2]}/{digest}.{extension}'
+    path = thumbnail_path(name)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        descriptor, temporary = tempfile.mkstemp(dir=os.path.dirname(path))
+        with os.fdopen(descriptor, 'wb') as file:
+            file.write(data)
+        os.chmod(temporary, 0o644)
+        os.replace(temporary, path)
+    return name
+
+
+# Fetch, shrink and store the image at one URL
+# Returns the thumbnail's name, or '' if the image can't be used, so the listing isn't retried on every run.
+# Returns None if the image couldn't be fetched this time, so it's tried again on the next run.
+
+def thumbnail_for_url(url):
+    try:
+        return store_thumbnail(*make_thumbnail(get_fetcher()(url)))
+    except TemporaryThumbnailError as error:
+        logger.warning('No thumbnail for listing image yet, will retry: %s', error)
+        return None
+    except ThumbnailError as error:
+        logger.warning('No thumbnail for listing image: %s', error)
+        return ''
+
+
+# Listings whose image has no thumbnail yet, including those whose image URL has changed since theirs was made
+
+def pending_listings():
+    return (Listing.objects.filter(image_url__isnull=False).exclude(image_url='')
+            .filter(Q(thumbnail_source__isnull=True) | ~Q(thumbnail_source=F('image_url'))))
+
+
+# Make thumbnails for one batch of listings, newest first, fetching and resizing in a pool of worker threads
+# Each URL is fetched at most once, however many listings share it.  Listings in skip are left out.
+# Returns the ids of the listings updated, and of those left pending because their image couldn't be fetched.
+
+def generate_thumbnail_batch(batch_size=100, workers=4, skip=()):
+    if Image is None:
+        raise ThumbnailError('Making thumbnails needs Pillow:  pip install Pillow')
+    pending = list(pending_listings().exclude(pk__in=skip).order_by('-timestamp')
+                   .values_list('id', 'image_url')[:batch_size])
+    if not pending:
+        return [], []
+    listing_ids = {}
+    for listing_id, url in pending:
+        listing_ids.setdefault(url, []).append(listing_id)
+
+    # Reuse what earlier runs made from the same URLs, including images that couldn't be used
+    names = dict(Listing.objects.filter(thumbnail_source__in=list(listing_ids)).order_by()
+                 .values_list('thumbnail_source', 'thumbnail').distinct())
+    missing = [url for url in listing_ids if url not in names]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        names.update(zip(missing, pool.map(thumbnail_for_url, missing)))
+
+    # Only update listings whose image URL hasn't changed in the meantime
+    updated = []
+    postponed = []
+    for url, ids in listing_ids.items():
+        if names[url] is None:
+            postponed.extend(ids)
+            continue
+        Listing.objects.filter(pk__in=ids, image_url=url).update(thumbnail=names[url], thumbnail_source=url)
+        updated.extend(ids)
+    # Bulk updates don't send signals, so refresh the cached cards here
+    bump_listing_versions(updated)
+    return updated, postponed
+
+
+# Make thumbnails for every pending listing, one batch at a time
+# Listings postponed by one batch aren't tried again in the same run.  Returns the number of listings updated.
+
+def generate_thumbnails(batch_size=100, workers=4):
+    done = 0
+    postponed = set()
+    while True:
+        updated, retry = generate_thumbnail_batch(batch_size, workers, postponed)
+        done += len(updated)
+        postponed.update(retry)
+        if len(updated) + len(retry) < batch_size:
+            return done
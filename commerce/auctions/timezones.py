@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.utils.html import format_html_join
+from django.utils.safestring import mark_safe
+from functools import lru_cache
+import zoneinfo
+
+
+# DISPLAY TIMEZONES
+# Each user picks a display timezone when they register.  It is copied into the session when they log in,
+# so TimezoneMiddleware can activate it on every request without loading the user.
+# The list of zones and the options for the timezone select are built once per process and then reused.
+
+TIMEZONE_SESSION_KEY = 'timezone'
+
+# Zones that exist only for backwards compatibility, or that depend on how the server is set up
+HIDDEN_PREFIXES = ('Etc/', 'SystemV/')
+HIDDEN_ZONES = {'Factory', 'localtime', 'posixrules'}
+
+
+# Every zone a user may choose, as (value, label) choices for User.timezone
+# Used as a callable, so migrations don't change whenever the installed timezone database does
+
+@lru_cache(maxsize=None)
+def timezone_choices():
+    names = sorted(zoneinfo.available_timezones() - HIDDEN_ZONES)
+    return tuple((name, name) for name in names)
+
+
+@lru_cache(maxsize=None)
+def valid_timezones():
+    return frozenset(name for name, _ in timezone_choices())
+
+
+# The zones offered in the register form:  the "Area/City" names plus UTC, as with pytz.common_timezones
+
+@lru_cache(maxsize=None)
+def common_timezones():
+    return tuple(name for name, _ in timezone_choices()
+                 if name == 'UTC' or ('/' in name and not name.startswith(HIDDEN_PREFIXES)))
+
+
+# The <option> tags for the timezone select, with the given zone selected
+# Only a handful of different zones are ever pre-selected, so each version is cached
+
+@lru_cache(maxsize=16)
+def timezone_options(selected):
+    return format_html_join('\n', '<option value="{}"{}>{}</option>', (
+        (name, mark_safe(' selected="selected"') if name == selected else '', name) for name in common_timezones()))
+
+
+# The zone to show times in for this user, falling back to the site default for unknown names
+
+def display_timezone(name):
+    return name if name in valid_timezones() else settings.DEFAULT_TIMEZONE
+
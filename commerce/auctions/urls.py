@@ -8,6 +8,7 @@ urlpatterns = [
     path("logout", views.logout_view, name="logout"),
     path("register", views.register, name="register"),
     path("listing/<int:listing_id>", views.listing_view, name="listing"),
+    path("listing/<int:listing_id>/comments", views.listing_comments, name="listing_comments"),
     path("listings_closed", views.listings_closed, name="listings_closed"),
     path("listing_add", views.listing_add, name="listing_add"),
     path("watchlist/<int:listing_id>", views.watchlist_add, name="watchlist_add"),
@@ -18,5 +19,7 @@ urlpatterns = [
     path("bid_add", views.bid_add, name="bid_add"),
     path("categories", views.category_index, name="category_index"),
     path("category/<int:category_id>", views.category_listing, name="category_listing"),
+    path("search", views.search, name="search"),
+    path("thumbnails/<path:name>", views.thumbnail, name="thumbnail"),
 
 ]
@@ -3,8 +3,8 @@
 #        Other changes that were not based on TF feedback are not called out.
 
 from django.contrib.auth import authenticate, login, logout
-from django.db import IntegrityError
-from django.http import HttpResponse, HttpResponseRedirect
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse, HttpResponseRedirect, JsonResponse
 from django.http.response import Http404
 from django.shortcuts import render
 from django.urls import reverse
@@ -12,11 +12,21 @@ from django.db.models import Max
 from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.utils import timezone
+from django.utils import timezone, formats
 from django import forms
 import datetime
-import pytz
-from .models import User, Listing, Category, Bid, Comment
+from .models import User, Listing, Bid, Comment
+from .pagination import KeysetPaginator, encode_cursor
+from .bidding import place_bid, BidOutcome
+from .search import search_listings
+from .categories import category_counts, find_category
+from .timezones import display_timezone, timezone_options
+from .thumbnails import CONTENT_TYPES, THUMBNAIL_NAME, thumbnail_path
+from .watchlist import watched_listing_ids, is_watching
+from .live import publish_listing_event
+from .sse import page_events_url
+from .replicas import use_primary_database
+from .conditional import list_validators, listing_validators, not_modified, add_validators
 
 
 # FORM CLASSES
@@ -51,7 +61,19 @@ class ListingForm(forms.ModelForm):
     class Meta:
         model = Listing
         fields = ['title', 'description',
-                  'starting_price', 'category', 'image_url']
+                  'starting_price', 'category', 'image_url', 'end_time']
+        widgets = {
+            'end_time': forms.DateTimeInput(attrs={'type': 'datetime-local'}, format='%Y-%m-%dT%H:%M'),
+        }
+        help_texts = {
+            'end_time': 'Optional.  Without an end time, the auction runs until you close it.',
+        }
+
+    def clean_end_time(self):
+        end_time = self.cleaned_data['end_time']
+        if end_time is not None and end_time <= timezone.now():
+            raise forms.ValidationError('The end time must be in the future.')
+        return end_time
 
 
 # AUTHENTICATION
@@ -69,8 +91,6 @@ def login_view(request):
         # Check if authentication successful
         if user is not None:
             login(request, user)
-            # Set the display timezone to the user's chosen time
-            timezone.activate(user.timezone)
             # CITATION:  Using 'next' to return to starting page:  https://stackoverflow.com/a/21693784
             if next:
                 return HttpResponseRedirect(request.POST.get('next'))
@@ -84,18 +104,15 @@ def login_view(request):
 
 # Log out
 
+@use_primary_database
 def logout_view(request):
     logout(request)
-    # We don't need to unset the timezone; that is done when index is called
     return HttpResponseRedirect(reverse('index'))
 
 
 # Register a new user
 
 def register(request):
-    # Gather a list of timezones to populate the timezone choice field in the form
-    timezones = pytz.common_timezones
-
     if request.method == 'POST':
         username = request.POST['username']
         email = request.POST['email']
@@ -107,37 +124,32 @@ def register(request):
             messages.error(request, 'Passwords must match')
             # return HttpResponseRedirect('register')
             return render(request, 'auctions/register.html', {
-                'timezones': timezones,
-                'default_timezone': settings.DEFAULT_TIMEZONE
+                'timezone_options': timezone_options(settings.DEFAULT_TIMEZONE)
             })
         if password == '':
             messages.error(request, 'Password cannot be blank')
             return render(request, 'auctions/register.html', {
-                'timezones': timezones,
-                'default_timezone': settings.DEFAULT_TIMEZONE
+                'timezone_options': timezone_options(settings.DEFAULT_TIMEZONE)
             })
 
         # Attempt to create new user
         try:
             user = User.objects.create_user(username, email, password)
-            user.timezone = request.POST['user_timezone']
+            # Unknown zones fall back to the site default
+            user.timezone = display_timezone(request.POST.get('user_timezone'))
             user.save()
         except IntegrityError:
             messages.error(request, 'Username already taken.')
             return render(request, 'auctions/register.html', {
-                'timezones': timezones,
-                'default_timezone': settings.DEFAULT_TIMEZONE
+                'timezone_options': timezone_options(settings.DEFAULT_TIMEZONE)
             })
         login(request, user)
-        # Set the display timezone to the user's chosen time
-        timezone.activate(user.timezone)
         # Send the user to the home page
         return HttpResponseRedirect(reverse('index'))
 
     else:
         return render(request, 'auctions/register.html', {
-            'timezones': timezones,
-            'default_timezone': settings.DEFAULT_TIMEZONE
+            'timezone_options': timezone_options(settings.DEFAULT_TIMEZONE)
         })
 
 
@@ -148,11 +160,24 @@ def register(request):
 def index(request, listings=None, title='Active Listings'):
     # Show all active listings, unless a set is passed in
     if listings is None:
-        listings = Listing.objects.filter(is_active=True)
-    # If the user isn't authenticated, set the display timezone to the site's default
-    if not request.user.is_authenticated:
-        timezone.activate(settings.DEFAULT_TIMEZONE)
-    return render(request, 'auctions/index.html', {'listings': listings, 'title': title})
+        listings = Listing.objects.active()
+    # Fetch the owner and bid stats for every card in the same query as the listings
+    listings = listings.with_card_data()
+    # If the browser's copy of the page is still current, skip the listings query and the rendering
+    validators = list_validators(request)
+    response = not_modified(request, validators)
+    if response:
+        return response
+    # Show one page of listings, starting after the cursor if one was passed in
+    cursor = request.GET.get('cursor')
+    page = KeysetPaginator(listings, settings.LISTINGS_PER_PAGE).page(cursor)
+    return add_validators(request, render(request, 'auctions/index.html', {
+        'listings': page.object_list,
+        'watched_ids': watched_listing_ids(request.user),
+        'title': title,
+        'page': page,
+        'is_first_page': not cursor
+    }), validators)
 
 
 # Display all inactive listings
@@ -164,27 +189,71 @@ def listings_closed(request):
 # Display the detail view of a listing
 
 def listing_view(request, listing_id):
+    # If the browser's copy of the page is still current, skip the queries and the rendering
+    validators = listing_validators(request, listing_id)
+    response = not_modified(request, validators)
+    if response:
+        return response
+
     # CITATION:  error checking based on cookbook example in Vlad's section
     try:
-        listing = Listing.objects.get(pk=listing_id)
+        listing = Listing.objects.select_related(
+            'owner', 'category', 'high_bidder').get(pk=listing_id)
     except Listing.DoesNotExist:
         raise Http404("Listing does not exist")
 
     # Determine whether this listing is in the user's watchlist
-    if request.user.is_authenticated:
-        # POST-GRADING:  Didn't realize request.user was already a User object
-        in_watchlist = listing in request.user.watchlist_items.all()
-    else:
-        in_watchlist = False
+    # POST-GRADING:  Didn't realize request.user was already a User object
+    in_watchlist = is_watching(request.user, listing.id)
+
+    # Only the first page of comments is rendered here; the rest are fetched from listing_comments
+    comments = comment_paginator(listing_id).page()
 
     # Render the listing detail page
-    return render(request, 'auctions/listing.html', {
+    return add_validators(request, render(request, 'auctions/listing.html', {
         'listing_id': listing_id,
         'listing': listing,
         'in_watchlist': in_watchlist,
-        'comments': Comment.objects.filter(listing=listing_id).order_by('timestamp'),
+        'comments': comments.object_list,
+        'comments_cursor': encode_cursor(comments.object_list[-1]) if comments.object_list else '',
+        'comments_more': comments.has_next,
+        'events_url': page_events_url(listing),
         'comment_form': CommentForm(initial={'listing': listing_id}),
         'bid_form': BidForm(initial={'listing': listing})
+    }), validators)
+
+
+# Comments for a listing, oldest first, one page at a time
+
+def comment_paginator(listing_id):
+    comments = Comment.objects.filter(listing=listing_id).select_related('commenter')
+    return KeysetPaginator(comments, settings.COMMENTS_PER_PAGE, descending=False)
+
+
+# Return the next page of comments as JSON
+# The since cursor is the position of the last comment the page already shows.  The same request
+# loads older pages and, once the client has caught up, picks up any comments posted since.
+
+def listing_comments(request, listing_id):
+    page = comment_paginator(listing_id).page(request.GET.get('since'))
+
+    # Only check that the listing exists when there's nothing to show, to save a query on every page
+    if not page.object_list and not Listing.objects.filter(pk=listing_id).exists():
+        raise Http404("Listing does not exist")
+
+    comments = page.object_list
+    return JsonResponse({
+        'comments': [{
+            'id': comment.id,
+            'body': comment.body,
+            'commenter': str(comment.commenter),
+            'timestamp': comment.timestamp.isoformat(),
+            # Formatted the same way as the comments rendered on the listing page
+            'display_timestamp': formats.localize(timezone.template_localtime(comment.timestamp)),
+        } for comment in comments],
+        # Where to continue from, or the caller's own cursor if there was nothing new
+        'cursor': encode_cursor(comments[-1]) if comments else request.GET.get('since', ''),
+        'more': page.has_next,
     })
 
 
@@ -218,17 +287,27 @@ def listing_add(request):
 
 # Close a listing:  ends the auction, making the highest bidder the winner
 
+@use_primary_database
 @login_required
 def close_listing(request, listing_id):
     # Mark the listing as closed
     try:
-        listing = Listing.objects.get(pk=listing_id)
+        listing = Listing.objects.select_related('high_bidder').get(pk=listing_id)
     except Listing.DoesNotExist:
         raise Http404("Listing does not exist")
 
     # TO DO: error handling
-    listing.is_active = False
-    listing.save()
+    # Close the listing and lock in the final bid stats together, in one write
+    # The winner is only loaded again if the recalculated stats name a different one
+    # Only those fields are written, so changes made to the listing since it was loaded here are kept
+    with transaction.atomic():
+        listing.is_active = False
+        listing.refresh_bid_stats(save=False)
+        listing.save(update_fields=['is_active', 'high_bid', 'num_bids', 'high_bidder'])
+        # Tell everyone watching the listing that the auction is over
+        publish_listing_event(listing.id, 'close', {
+            'amount': f'{listing.max_bid:.2f}' if listing.max_bid is not None else None,
+        })
     # Re-render the page with the new information
     return listing_view(request, listing_id)
 
@@ -249,6 +328,7 @@ def watchlist_view(request):
 # NOTE:  I chose to allow users to include their own listings and closed listings on their watch lists,
 #           since we are not providing any other way for users to track those things
 
+@use_primary_database
 @login_required
 def watchlist_add(request, listing_id):
     try:
@@ -264,6 +344,7 @@ def watchlist_add(request, listing_id):
 
 # Remove a listing from the user's watchlist
 
+@use_primary_database
 @login_required
 def watchlist_remove(request, listing_id):
     try:
@@ -287,23 +368,45 @@ def watchlist_remove(request, listing_id):
 
 def category_index(request):
     return render(request, 'auctions/categories.html', {
-        'categories': Category.objects.all()
+        'categories': category_counts()
     })
 
 
 # View a list of all listings for a given category
+# The category name comes from the cached category counts, where id 0 is "Uncategorized"
 
 def category_listing(request, category_id):
-    if category_id == 0:
-        category_name = 'Uncategorized'
-        listings = Listing.objects.filter(category=None, is_active=True)
-    else:
-        try:
-            category_name = Category.objects.get(pk=category_id).name
-        except Category.DoesNotExist:
-            raise Http404("Category does not exist")
-        listings = Listing.objects.filter(category=category_id, is_active=True)
-    return index(request, listings, category_name)
+    category = find_category(category_counts(), category_id)
+    if category is None:
+        raise Http404("Category does not exist")
+    listings = Listing.objects.active().filter(category=category.id or None)
+    return index(request, listings, category.name)
+
+
+# SEARCH METHODS
+
+# Search listing titles and descriptions, optionally within a category or including closed listings
+
+def search(request):
+    query = request.GET.get('q', '').strip()
+    include_closed = request.GET.get('closed') == 'on'
+    try:
+        category_id = int(request.GET['category']) if request.GET.get('category') else None
+    except ValueError:
+        category_id = None
+
+    listings = []
+    if query:
+        listings = search_listings(query, active_only=not include_closed, category_id=category_id,
+                                   limit=settings.SEARCH_RESULTS_LIMIT)
+    return render(request, 'auctions/search.html', {
+        'query': query,
+        'listings': listings,
+        'watched_ids': watched_listing_ids(request.user),
+        'categories': category_counts(),
+        'category_id': category_id,
+        'include_closed': include_closed
+    })
 
 
 # COMMENT METHODS
@@ -348,24 +451,19 @@ def bid_add(request):
         form = BidForm(request.POST)
         if form.is_valid():
             # POST-GRADING:  Model form handling refactored based on the cookbook example from Vlad's section
-            # Save the bid locally so we can test
-            bid = form.save(commit=False)
-            listing = bid.listing
-            # Validate the form on the backend
-            if bid.amount < listing.required_bid:
-                messages.error(
-                    request, f'You must bid at least ${listing.required_bid}')
-            elif listing.owner == request.user:
+            listing = form.cleaned_data['listing']
+            # Validate and save the bid in a single conditional write, so concurrent bids can't both win
+            result = place_bid(listing.id, request.user, form.cleaned_data['amount'])
+            if result.outcome == BidOutcome.ACCEPTED:
+                messages.success(request, 'Thank you for your bid')
+            elif result.outcome == BidOutcome.OWN_LISTING:
                 messages.error(
                     request, 'You may not bid on your own listings.')
-            elif not listing.is_active:
+            elif result.outcome == BidOutcome.CLOSED:
                 messages.error(request, 'Sorry, this auction has ended.')
-            # If all validation passes, save the bid
             else:
-                bid.bidder = request.user
-                bid.timestamp = datetime.datetime.now()
-                bid.save()
-                messages.success(request, 'Thank you for your bid')
+                messages.error(
+                    request, f'You must bid at least ${result.required_bid}')
             # Refresh the listing page and show a success or error message
             return HttpResponseRedirect(reverse('listing', args=[listing.id]))
         # If we don't have a valid form, we don't have a listing ID, so take the user back to the index
@@ -373,3 +471,21 @@ def bid_add(request):
             messages.error(
                 request, 'An error occurred while validating your bid.  Your bid has NOT been saved.')
             return HttpResponseRedirect(reverse('index'))
+
+
+# THUMBNAIL METHODS
+
+# Serve a stored listing thumbnail
+# A thumbnail's name is the hash of its contents, so browsers and proxies may keep it forever without checking back
+
+def thumbnail(request, name):
+    match = THUMBNAIL_NAME.fullmatch(name)
+    if match is None:
+        raise Http404("Thumbnail does not exist")
+    try:
+        image = open(thumbnail_path(name), 'rb')
+    except FileNotFoundError:
+        raise Http404("Thumbnail does not exist")
+    response = FileResponse(image, content_type=CONTENT_TYPES[match.group(1)])
+    response['Cache-Control'] = 'public, max-age=31536000, immutable'
+    return response
@@ -0,0 +1,61 @@
+from django.conf import settings
+from django.core.cache import cache
+from .models import Listing
+
+
+# WATCHLIST LOOKUPS
+# Each user's watched listing ids are cached as a set, so pages can mark every watched listing without a query per
+# listing.  The set is dropped whenever the user's watchlist changes (see signals.watchlist_changed).
+
+WatchlistItem = Listing.watchlist_items.through
+
+
+def watchlist_key(user_id):
+    return f'watchlist_ids:{user_id}'
+
+
+def watched_listing_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    ids = cache.get(watchlist_key(user.id))
+    if ids is None:
+        ids = frozenset(WatchlistItem.objects.filter(user_id=user.id).values_list('listing_id', flat=True))
+        cache.set(watchlist_key(user.id), ids, settings.WATCHLIST_CACHE_TIMEOUT)
+    return ids
+
+
+async def awatched_listing_ids(user):
+    if not user.is_authenticated:
+        return frozenset()
+    ids = await cache.aget(watchlist_key(user.id))
+    if ids is None:
+        ids = frozenset([listing_id async for listing_id in
+                         WatchlistItem.objects.filter(user_id=user.id).values_list('listing_id', flat=True)])
+        await cache.aset(watchlist_key(user.id), ids, settings.WATCHLIST_CACHE_TIMEOUT)
+    return ids
+
+
+# Is this listing on the user's watchlist?
+# Uses the cached set if there is one; otherwise a single lookup on the (listing, user) unique index,
+# rather than loading the user's whole watchlist
+
+def is_watching(user, listing_id):
+    if not user.is_authenticated:
+        return False
+    ids = cache.get(watchlist_key(user.id))
+    if ids is not None:
+        return listing_id in ids
+    return WatchlistItem.objects.filter(listing_id=listing_id, user_id=user.id).exists()
+
+
+async def ais_watching(user, listing_id):
+    if not user.is_authenticated:
+        return False
+    ids = await cache.aget(watchlist_key(user.id))
+    if ids is not None:
+        return listing_id in ids
+    return await WatchlistItem.objects.filter(listing_id=listing_id, user_id=user.id).aexists()
+
+
+def invalidate_watchlists(user_ids):
+    cache.delete_many([watchlist_key(user_id) for user_id in user_ids])
@@ -2,6 +2,7 @@
 ASGI config for commerce project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Requests for a listing's live update stream are answered by auctions.sse; everything else goes to Django.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/3.0/howto/deployment/asgi/
@@ -12,5 +13,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
+# This application serves the live update streams, so listing pages can open them
+os.environ['AUCTIONS_LIVE_UPDATES'] = '1'
 
-application = get_asgi_application()
+django_application = get_asgi_application()
+
+# Import after Django is set up, since the event streams use the models
+from auctions.sse import LiveUpdatesRouter  # noqa: E402
+
+application = LiveUpdatesRouter(django_application)
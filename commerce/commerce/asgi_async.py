@@ -0,0 +1,40 @@
+"""
+ASGI config for commerce project, with async views.
+
+Like commerce/asgi.py, but the listing and browse pages are served by the async views in auctions/async_views.py,
+so slow clients and database waits don't each hold a worker thread.  Run it with any ASGI server, e.g.:
+
+    uvicorn commerce.asgi_async:application
+"""
+
+import os
+
+import django
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.handlers.asgi import ASGIHandler
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'commerce.settings')
+# This application serves the live update streams, so listing pages can open them
+os.environ['AUCTIONS_LIVE_UPDATES'] = '1'
+# Connections opened by async views are never reused, so persistent connections would only pile up
+os.environ.setdefault('AUCTIONS_CONN_MAX_AGE', '0')
+django.setup(set_prefix=False)
+
+for alias, database in settings.DATABASES.items():
+    if database.get('CONN_MAX_AGE'):
+        raise ImproperlyConfigured(f'The async views need CONN_MAX_AGE = 0, but database {alias!r} has '
+                                   f'{database["CONN_MAX_AGE"]}:  unset AUCTIONS_CONN_MAX_AGE or set it to 0')
+
+# Import after Django is set up, since the event streams use the models
+from auctions.sse import LiveUpdatesRouter  # noqa: E402
+
+
+class AsyncViewsHandler(ASGIHandler):
+    # Resolve every request against the URLconf with the async views
+    async def get_response_async(self, request):
+        request.urlconf = 'commerce.urls_async'
+        return await super().get_response_async(request)
+
+
+application = LiveUpdatesRouter(AsyncViewsHandler())
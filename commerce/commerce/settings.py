@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/3.0/ref/settings/
 """
 
 import os
+import sys
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,11 +42,15 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'auctions.middleware.StaticAssetsMiddleware',
+    'auctions.middleware.PerformanceMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'auctions.middleware.ReplicaMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'auctions.middleware.TimezoneMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -54,7 +59,8 @@ ROOT_URLCONF = 'commerce.urls'
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        # Django's template backend, plus render timing for PerformanceMiddleware
+        'BACKEND': 'auctions.instrumentation.TimedDjangoTemplates',
         'DIRS': [],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -74,15 +80,138 @@ WSGI_APPLICATION = 'commerce.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.0/ref/settings/#databases
 
+# Connections are kept open for CONN_MAX_AGE seconds, one per server thread, rather than opened for every request.
+# commerce/asgi_async.py sets AUCTIONS_CONN_MAX_AGE=0, and refuses to start with anything else:  Django doesn't
+# support persistent connections in async mode.
+CONN_MAX_AGE = int(os.environ.get('AUCTIONS_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {
+            # Take the write lock when a transaction begins.  A transaction that reads and then writes can
+            # otherwise fail at once with "database is locked", without waiting for busy_timeout.
+            'transaction_mode': 'IMMEDIATE',
+        },
+        # The tests use a database file too, rather than SQLite's in-memory database, which locks whole tables
+        # instead of using the write-ahead log, so concurrency tests measure what the web server does
+        'TEST': {'NAME': os.path.join(BASE_DIR, 'test_db.sqlite3')},
     }
 }
 
+# SQLite tuning, applied to every new connection (see auctions/pragmas.py)
+#   journal_mode = wal      Readers don't block the writer, and the writer doesn't block readers
+#   synchronous = normal    Safe with WAL:  a power cut may lose the last few commits, but can't corrupt the database
+#   busy_timeout            Milliseconds to wait for another connection's write lock before giving up
+#   mmap_size               Read up to this many bytes of the database through a memory map
+#   cache_size              The page cache for each connection; negative numbers are in KiB
+# manage.py bench_writes compares write throughput and lock errors with and without these settings.
+
+SQLITE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+    'busy_timeout': 10000,
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32 * 1024,
+}
+
+# Read replica
+# Set AUCTIONS_REPLICA_DB to the path of a copy of the database, kept up to date by manage.py sync_replica,
+# to send the reads of GET requests there (see auctions/replicas.py).  After a user writes, their reads stay on
+# default for READ_REPLICA_STICKY_SECONDS, which should be longer than sync_replica's --interval.
+# The replica is opened read-only.  In the tests it mirrors default, so it sees the test data.
+
+REPLICA_DATABASE_PATH = os.environ.get('AUCTIONS_REPLICA_DB')
+if REPLICA_DATABASE_PATH:
+    DATABASES['replica'] = {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': f'file:{REPLICA_DATABASE_PATH}?mode=ro',
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        'TEST': {'MIRROR': 'default'},
+    }
+READ_REPLICA_DATABASE = 'replica' if REPLICA_DATABASE_PATH else None
+READ_REPLICA_STICKY_SECONDS = 5
+DATABASE_ROUTERS = ['auctions.replicas.ReplicaRouter']
+
 AUTH_USER_MODEL = 'auctions.User'
 
+# Cache
+# https://docs.djangoproject.com/en/3.0/topics/cache/
+
+# The cached listing cards, the version numbers that invalidate them, category counts, watchlists and cached_db
+# sessions all live in the cache, so every worker process must share it:  with a cache in each process, a bid
+# handled by one worker would leave the others showing the old cards.  Choose a backend with AUCTIONS_CACHE:
+#   file    Files under AUCTIONS_CACHE_DIR, shared by every process on this machine (the default)
+#   redis   The Redis server at AUCTIONS_REDIS_URL, shared by every machine.  Needs the redis package.
+
+CACHE_BACKENDS = {
+    'file': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.environ.get('AUCTIONS_CACHE_DIR', os.path.join(BASE_DIR, 'cache')),
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    'redis': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('AUCTIONS_REDIS_URL', 'redis://127.0.0.1:6379'),
+    },
+}
+
+CACHES = {
+    'default': CACHE_BACKENDS[os.environ.get('AUCTIONS_CACHE', 'file')],
+}
+
+# Sessions and messages
+# https://docs.djangoproject.com/en/3.0/topics/http/sessions/#configuring-the-session-engine
+# Choose a profile with the AUCTIONS_SESSION_PROFILE environment variable:
+#   db              Django's defaults:  sessions in the database, messages in a cookie with the session as overflow
+#   cached_db       Low-write sessions read through the cache (auctions/sessions.py), and messages in a cookie
+#   signed_cookies  Sessions and messages both in signed cookies, so they never touch the database.  Sessions
+#                   can't be revoked on the server, and logging out only clears the browser's copy.
+# manage.py bench_sessions compares the database writes per user action for each profile.
+
+SESSION_PROFILES = {
+    'db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.fallback.FallbackStorage',
+    },
+    'cached_db': {
+        'SESSION_ENGINE': 'auctions.sessions',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+    'signed_cookies': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'MESSAGE_STORAGE': 'django.contrib.messages.storage.cookie.CookieStorage',
+    },
+}
+
+SESSION_PROFILE = os.environ.get('AUCTIONS_SESSION_PROFILE', 'db')
+SESSION_ENGINE = SESSION_PROFILES[SESSION_PROFILE]['SESSION_ENGINE']
+MESSAGE_STORAGE = SESSION_PROFILES[SESSION_PROFILE]['MESSAGE_STORAGE']
+
+# Logging
+# https://docs.djangoproject.com/en/3.0/topics/logging/
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'auctions.performance': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 # Password validation
 # https://docs.djangoproject.com/en/3.0/ref/settings/#auth-password-validators
 
@@ -121,6 +250,19 @@ USE_TZ = True
 
 STATIC_URL = '/static/'
 
+# Where collectstatic gathers the static files, minified, with content-hashed names and compressed copies
+# See auctions/assets.py for the build step
+STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'auctions.assets.CompressedManifestStaticFilesStorage',
+    },
+}
+
 
 # JESSICA'S UPDATES BEGIN HERE
 
@@ -136,9 +278,64 @@ DEFAULT_TIMEZONE = 'America/New_York'
 # Placeholder listing image courtesy of janjf93 on Pixabay:  https://pixabay.com/vectors/day-shield-price-tag-flyers-1727489/
 PLACEHOLDER_IMAGE = '/static/auctions/default_photo.png'
 
+# Listing thumbnails, made by manage.py generate_thumbnails (see auctions/thumbnails.py); making them needs Pillow
+# Thumbnails are stored in THUMBNAIL_ROOT.  In production, have the web server serve that directory at /thumbnails/
+# with the same far-future cache headers as the thumbnail view.
+THUMBNAIL_ROOT = os.path.join(BASE_DIR, 'thumbnails')
+THUMBNAIL_SIZE = (400, 400)
+THUMBNAIL_FORMAT = 'WEBP'
+THUMBNAIL_QUALITY = 80
+# Fetches listing images, as a dotted path to a function that takes a URL and returns the image's bytes
+THUMBNAIL_FETCHER = 'auctions.thumbnails.fetch_image'
+THUMBNAIL_FETCH_TIMEOUT = 10
+THUMBNAIL_MAX_BYTES = 10 * 1024 * 1024
+THUMBNAIL_MAX_REDIRECTS = 3
+# Image URLs are chosen by listing owners, so images are only fetched from public internet addresses.
+# Networks listed here are allowed as well, e.g. ['10.1.2.0/24'] for an image server on the local network.
+THUMBNAIL_ALLOWED_NETWORKS = []
+
 # Requires bidders to beat any existing bids by the specified amount
 BID_INCREMENT = 0.01
 
+# Number of listings shown per page on the index pages
+LISTINGS_PER_PAGE = 25
+
+# Number of comments shown on the listing page, and returned per request by the comments endpoint
+COMMENTS_PER_PAGE = 20
+
+# Maximum number of listings shown on the search results page
+SEARCH_RESULTS_LIMIT = 50
+
+# How long (in seconds) a rendered listing card stays cached
+# Cards are also invalidated whenever the listing, its bids or its comments change
+LISTING_CARD_CACHE_TIMEOUT = 60 * 60
+
+# How long (in seconds) each user's set of watched listing ids stays cached
+# The set is also invalidated whenever the user's watchlist changes
+WATCHLIST_CACHE_TIMEOUT = 60 * 60
+
+# How long (in seconds) the per-category listing counts stay cached
+# The counts are also invalidated whenever a listing is created or closed, or a category changes
+CATEGORY_COUNTS_TIMEOUT = 60 * 5
+
+# Whether listing pages open live update streams.  Only the ASGI entry points serve the streams (see
+# auctions/sse.py), so commerce/asgi.py and commerce/asgi_async.py turn this on, and it stays off under WSGI.
+LIVE_UPDATES = os.environ.get('AUCTIONS_LIVE_UPDATES') == '1'
+
+# Broker that carries bids and closings to the live update streams, as a dotted path
+# The in-process broker only reaches streams served by the same process (see auctions/live.py)
+LIVE_UPDATES_BROKER = 'auctions.live.InProcessBroker'
+
+# Seconds between keepalive messages on an idle live update stream
+LIVE_UPDATES_KEEPALIVE = 20
+
+# Fraction of requests (0 to 1) that PerformanceMiddleware times and logs
+# Set AUCTIONS_PERFORMANCE_SAMPLE_RATE=1 to time every request while investigating a slow page
+# Nothing is sampled under manage.py test, so the tests' output doesn't depend on chance; the tests of the timing
+# set their own rate.
+PERFORMANCE_SAMPLE_RATE = float(os.environ.get('AUCTIONS_PERFORMANCE_SAMPLE_RATE',
+                                               0 if sys.argv[1:2] == ['test'] else 0.01))
+
 
 # Attribution for images used in sample listings: 
 # Cat hair sweater:     https://commons.wikimedia.org/wiki/File:Sphynx_cat_in_orange_sweater.jpg
@@ -0,0 +1,17 @@
+"""commerce URL Configuration for commerce/asgi_async.py
+
+The same URLs as commerce/urls.py, with the busiest read-only pages served by the async views in
+auctions/async_views.py.  They are listed first so they take precedence over the sync views.
+"""
+from django.contrib import admin
+from django.urls import include, path
+
+from auctions import async_views
+
+urlpatterns = [
+    path("admin/", admin.site.urls),
+    path("", async_views.index, name="index"),
+    path("listing/<int:listing_id>", async_views.listing_view, name="listing"),
+    path("category/<int:category_id>", async_views.category_listing, name="category_listing"),
+    path("", include("auctions.urls"))
+]